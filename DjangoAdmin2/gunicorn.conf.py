@@ -0,0 +1,41 @@
+import os
+
+# gunicorn 設定
+# 用法：gunicorn -c gunicorn.conf.py
+
+wsgi_app = 'myproject.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+
+# 多執行緒 worker，同一個 worker 內同時到達的搜尋才能被合併成一批
+# 執行緒數要大於 TRAVEL_SEARCH 的 ADMISSION_CONCURRENCY + ADMISSION_QUEUE_SIZE，
+# 搜尋滿載時才有執行緒處理其他請求
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+# 在 master 先載入 Django 與 FAISS 索引，fork 之後各 worker 共用同一份記憶體
+preload_app = True
+
+
+def when_ready(server):
+    from travel_app.search_registry import SearchUnavailable, get_search_settings, registry
+    # 使用獨立的搜尋服務時，worker 不需要載入索引
+    if get_search_settings()['SERVER_ADDRESS']:
+        server.log.info('使用搜尋服務：%s', get_search_settings()['SERVER_ADDRESS'])
+        return
+    try:
+        registry.get_index()
+        server.log.info('FAISS 索引已在 master 載入：%s', registry.status()['index'])
+    except SearchUnavailable as e:
+        server.log.warning('FAISS 索引無法載入：%s', e)
+    # encoder（PyTorch）不在 fork 前載入，避免執行緒池在子行程中卡住；
+    # 各 worker 會在第一次查詢時自行載入
+
+
+def post_worker_init(worker):
+    from travel_app.analytics import start_prewarmer
+    from travel_app.search_registry import get_search_settings
+    # 快取在各 worker 內（沒有使用搜尋服務）時，每個 worker 各自預熱熱門查詢
+    config = get_search_settings()
+    if not config['SERVER_ADDRESS'] and config['PREWARM_TOP_N']:
+        start_prewarmer()
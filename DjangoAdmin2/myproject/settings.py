@@ -203,6 +203,16 @@ REST_FRAMEWORK = {
     ),
 }
 
+# 旅遊景點語意搜尋設置（模型與索引在第一次查詢時才載入）
+# 所有項目與預設值見 travel_app/search_registry.py 的 DEFAULT_SEARCH_SETTINGS，這裡只寫與預設不同的項目
+TRAVEL_SEARCH = {
+    # 以環境變數指定獨立搜尋服務的位址（見 `manage.py search_server`）
+    'SERVER_ADDRESS': os.environ.get('TRAVEL_SEARCH_SERVER') or None,
+}
+
+# 附近景點、地圖群集與縣市對照表的設定，預設值見 travel_app/conf.py 的 DEFAULT_TRAVEL_SETTINGS
+TRAVEL_APP = {}
+
 # JWT 設置
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -23,6 +23,7 @@ urlpatterns = [
     path('shop/', include('shopping_system.urls')),
     path('travel/', include('travel_app.urls')),
     path('theme/', include('theme_entertainment.urls')),
+    path('trip/', include('trip_planner.urls')),
     path('', include('forum_system.urls')),
     path('admin-dashboard/travel_app/', include('travel_app.urls')),
     path('api/health-check/', health_check, name='health_check'),
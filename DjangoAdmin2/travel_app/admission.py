@@ -0,0 +1,120 @@
+"""
+語意搜尋的准入控制
+
+搜尋很吃 CPU，同一個 worker 的執行緒都被搜尋佔滿時，登入檢查等一般頁面也會跟著卡住。
+AdmissionGate 限制同時執行的搜尋數，多出來的請求最多 queue_size 個排隊等待，
+等待佇列已滿時立即拒絕（429），排隊超過 timeout 仍輪不到也拒絕（503），
+兩者都附上建議的 Retry-After 秒數。
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .search_registry import get_search_settings
+
+# 統計等待時間時保留最近幾筆
+WAIT_SAMPLES = 1024
+
+REJECT_QUEUE_FULL = 'queue_full'
+REJECT_TIMEOUT = 'timeout'
+
+
+class Rejected(Exception):
+    """搜尋已滿載，請求被拒絕"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    def __init__(self, limit, queue_size, timeout):
+        self.limit = max(limit, 1)
+        self.queue_size = max(queue_size, 0)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.rejected = {REJECT_QUEUE_FULL: 0, REJECT_TIMEOUT: 0}
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._service_seconds = 0.0
+        self._served = 0
+
+    def retry_after(self):
+        """依平均處理時間估計排隊中的請求多久能消化完，至少 1 秒"""
+        average = self._service_seconds / self._served if self._served else 0
+        return max(1, math.ceil(average * (self.waiting + 1) / self.limit))
+
+    def _acquire(self):
+        start = time.perf_counter()
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                self._waits.append(0.0)
+                return
+            if self.waiting >= self.queue_size:
+                self.rejected[REJECT_QUEUE_FULL] += 1
+                raise Rejected(REJECT_QUEUE_FULL, self.retry_after())
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            try:
+                admitted = self._cond.wait_for(lambda: self.active < self.limit, timeout=self.timeout)
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.rejected[REJECT_TIMEOUT] += 1
+                raise Rejected(REJECT_TIMEOUT, self.retry_after())
+            self.active += 1
+            self.admitted += 1
+            self._waits.append(time.perf_counter() - start)
+
+    def _release(self, seconds):
+        with self._cond:
+            self.active -= 1
+            self._service_seconds += seconds
+            self._served += 1
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self):
+        """滿載時拋出 Rejected"""
+        self._acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - start)
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                'limit': self.limit,
+                'queue_size': self.queue_size,
+                'timeout_ms': self.timeout * 1000,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'peak_queue_depth': self.peak_waiting,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'wait_ms': {
+                    'avg': sum(waits) / len(waits) * 1000 if waits else None,
+                    'p95': waits[int(len(waits) * 0.95)] * 1000 if waits else None,
+                    'max': waits[-1] * 1000 if waits else None,
+                },
+                'avg_service_ms': self._service_seconds / self._served * 1000 if self._served else None,
+            }
+
+
+_config = get_search_settings()
+search_gate = AdmissionGate(
+    _config['ADMISSION_CONCURRENCY'],
+    _config['ADMISSION_QUEUE_SIZE'],
+    _config['ADMISSION_TIMEOUT_MS'] / 1000,
+)
@@ -0,0 +1,317 @@
+"""
+搜尋查詢分析與快取預熱
+
+QueryViewSet 的每句查詢以一行 JSON 附加到 QUERY_LOG_DIR/queries-YYYYMMDD.jsonl
+（各 worker 先累積在記憶體，每 FLUSH_SIZE 筆或 FLUSH_SECONDS 秒以 O_APPEND 寫入一次）。
+search_analytics 指令定期讀取最近 ANALYTICS_WINDOW_DAYS 天的紀錄，用 Space-Saving
+找出最常見的查詢與分數偏低的查詢，寫成 summary.json；持有快取的行程（search_server
+或各 worker）每隔 PREWARM_INTERVAL 秒依 summary 重新執行最熱門的查詢，讓快取保持溫熱。
+"""
+import atexit
+import datetime
+import glob
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+from .search_cache import normalize_query
+from .search_registry import SearchUnavailable, get_search_settings
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = 64
+FLUSH_SECONDS = 2.0
+
+# Space-Saving 的計數器數量是要求筆數的幾倍（越多越準）
+CAPACITY_FACTOR = 10
+
+# 請求中會影響搜尋結果的參數，預熱時原樣重送才會命中同一個快取鍵
+REQUEST_PARAMS = ('k', 'nprobe', 'ef_search', 'region', 'town', 'class_ids', 'rerank')
+
+
+class SpaceSaving:
+    """
+    Space-Saving 演算法（Metwally 等人）：只用 capacity 個計數器，近似找出出現最多次的項目。
+    新項目取代目前最小的計數器並繼承它的值，所以計數可能高估，最多高估 error
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(capacity, 1)
+        # 項目 -> [計數, 可能高估的量]
+        self.counts = {}
+        # (計數, 項目) 的 min-heap，計數更新後舊的項目留在 heap 裡，取出時再略過
+        self._heap = []
+
+    def add(self, item, weight=1):
+        entry = self.counts.get(item)
+        if entry is None:
+            if len(self.counts) < self.capacity:
+                entry = self.counts[item] = [0, 0]
+            else:
+                count = self._pop_min()
+                entry = self.counts[item] = [count, count]
+        entry[0] += weight
+        heapq.heappush(self._heap, (entry[0], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(entry[0], key) for key, entry in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            entry = self.counts.get(item)
+            if entry is not None and entry[0] == count:
+                del self.counts[item]
+                return count
+
+    def top(self, n):
+        """[(項目, 計數, 可能高估的量)]，依計數由大到小"""
+        ranked = sorted(self.counts.items(), key=lambda pair: -pair[1][0])[:n]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+    def __len__(self):
+        return len(self.counts)
+
+
+def log_dir():
+    return get_search_settings()['QUERY_LOG_DIR']
+
+
+def log_path(directory, day):
+    return os.path.join(directory, f'queries-{day:%Y%m%d}.jsonl')
+
+
+def summary_path(directory=None):
+    return os.path.join(directory or log_dir(), 'summary.json')
+
+
+def request_key(record):
+    """同一句查詢、同一組參數視為同一個請求；用 JSON 字串當作 Space-Saving 的項目"""
+    return json.dumps([record['q']] + [record.get(name) for name in REQUEST_PARAMS], ensure_ascii=False)
+
+
+class QueryLog:
+    """附加寫入的查詢紀錄；同時以 Space-Saving 記錄本行程最近的熱門查詢"""
+
+    def __init__(self, directory=None, flush_size=FLUSH_SIZE, flush_seconds=FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._flushed_at = time.monotonic()
+        self.recent = SpaceSaving(get_search_settings()['ANALYTICS_TOP_K'] * CAPACITY_FACTOR)
+        self.logged = 0
+        self.errors = 0
+
+    def append(self, query, results, latency_ms, **params):
+        """
+        results 為 (相似度 list, document id list)；max_score 是第一名的相似度，
+        沒有結果時為 None
+        """
+        similarities = results[0]
+        record = {
+            'ts': round(time.time(), 3),
+            'q': normalize_query(query),
+            'results': len(similarities),
+            'max_score': round(float(max(similarities)), 4) if similarities else None,
+            'ms': round(latency_ms, 1),
+        }
+        record.update((name, params.get(name)) for name in REQUEST_PARAMS)
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._buffer.append(line)
+            self.recent.add(record['q'])
+            self.logged += 1
+            if len(self._buffer) >= self.flush_size or time.monotonic() - self._flushed_at >= self.flush_seconds:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._flushed_at = time.monotonic()
+        if not self._buffer:
+            return
+        data = ''.join(self._buffer).encode('utf-8')
+        self._buffer = []
+        directory = self.directory or log_dir()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # O_APPEND 一次寫入整批，多個 worker 同時寫同一個檔案也不會交錯
+            fd = os.open(log_path(directory, datetime.date.today()), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            # 紀錄寫不進去不影響搜尋
+            self.errors += 1
+            logger.warning('查詢紀錄寫入失敗：%s', e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'logged': self.logged,
+                'buffered': len(self._buffer),
+                'errors': self.errors,
+                'recent_top': [
+                    {'query': query, 'count': count, 'error': error}
+                    for query, count, error in self.recent.top(get_search_settings()['ANALYTICS_TOP_K'])
+                ],
+            }
+
+
+query_log = QueryLog()
+atexit.register(query_log.flush)
+
+
+def iter_records(directory, days):
+    """最近 days 天（含今天）的查詢紀錄"""
+    today = datetime.date.today()
+    for offset in range(days - 1, -1, -1):
+        path = log_path(directory, today - datetime.timedelta(days=offset))
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # 行程中斷時可能留下寫一半的行
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def summarize(directory=None, days=None, top_k=None, low_score=None):
+    """讀取查詢紀錄，回傳熱門查詢、熱門請求（預熱用）與分數偏低的查詢"""
+    config = get_search_settings()
+    directory = directory or log_dir()
+    days = days or config['ANALYTICS_WINDOW_DAYS']
+    top_k = top_k or config['ANALYTICS_TOP_K']
+    low_score = config['ANALYTICS_LOW_SCORE'] if low_score is None else low_score
+
+    queries = SpaceSaving(top_k * CAPACITY_FACTOR)
+    requests = SpaceSaving(config['PREWARM_TOP_N'] * CAPACITY_FACTOR)
+    low = SpaceSaving(top_k * CAPACITY_FACTOR)
+    total = low_count = 0
+    latency = 0.0
+    for record in iter_records(directory, days):
+        total += 1
+        latency += record.get('ms') or 0
+        queries.add(record['q'])
+        requests.add(request_key(record))
+        max_score = record.get('max_score')
+        if max_score is None or max_score < low_score:
+            low_count += 1
+            low.add(record['q'])
+
+    top_requests = []
+    for key, count, error in requests.top(config['PREWARM_TOP_N']):
+        values = json.loads(key)
+        top_requests.append({
+            'query': values[0], 'params': dict(zip(REQUEST_PARAMS, values[1:])), 'count': count, 'error': error,
+        })
+    return {
+        'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'window_days': days,
+        'total_queries': total,
+        'avg_latency_ms': latency / total if total else None,
+        'low_score_threshold': low_score,
+        'low_score_rate': low_count / total if total else None,
+        'top_queries': [{'query': q, 'count': count, 'error': error} for q, count, error in queries.top(top_k)],
+        'low_score_queries': [{'query': q, 'count': count, 'error': error} for q, count, error in low.top(top_k)],
+        'top_requests': top_requests,
+    }
+
+
+def write_summary(summary, directory=None):
+    path = summary_path(directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_summary(directory=None):
+    try:
+        with open(summary_path(directory), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def prune_logs(directory=None, retention_days=None):
+    """刪除超過保存期限的紀錄檔，回傳刪除的檔名"""
+    directory = directory or log_dir()
+    retention_days = retention_days or get_search_settings()['QUERY_LOG_RETENTION_DAYS']
+    oldest = log_path(directory, datetime.date.today() - datetime.timedelta(days=retention_days - 1))
+    removed = []
+    for path in sorted(glob.glob(os.path.join(glob.escape(directory), 'queries-*.jsonl'))):
+        if path < oldest:
+            os.remove(path)
+            removed.append(os.path.basename(path))
+    return removed
+
+
+def prewarm(summary=None, limit=None):
+    """
+    在本行程重新執行最熱門的請求，填入查詢向量 / 搜尋結果 / rerank 快取；
+    回傳執行的請求數。需要在持有快取的行程（search_server 或 worker）中呼叫
+    """
+    from .semantic_search import run_search
+    summary = summary or read_summary()
+    if not summary:
+        return 0
+    limit = limit or get_search_settings()['PREWARM_TOP_N']
+    count = 0
+    for entry in summary['top_requests'][:limit]:
+        params = dict(entry['params'])
+        params['k'] = params.get('k') or 5
+        params['rerank'] = bool(params.get('rerank'))
+        try:
+            run_search([entry['query']], **params)
+        except SearchUnavailable as e:
+            logger.warning('快取預熱中止：%s', e)
+            break
+        except Exception:
+            logger.exception('快取預熱失敗：%s', entry['query'])
+            continue
+        count += 1
+    return count
+
+
+_prewarmer = None
+_prewarmer_lock = threading.Lock()
+
+
+def start_prewarmer(interval=None):
+    """啟動背景預熱執行緒（每個行程一個）；fork 後的子行程要各自呼叫"""
+    global _prewarmer
+    interval = interval or get_search_settings()['PREWARM_INTERVAL']
+    with _prewarmer_lock:
+        if _prewarmer is not None and _prewarmer[0] == os.getpid():
+            return
+        thread = threading.Thread(target=_prewarm_loop, args=(interval,), name='search-prewarm', daemon=True)
+        _prewarmer = (os.getpid(), thread)
+        thread.start()
+
+
+def _prewarm_loop(interval):
+    from django.db import close_old_connections
+    while True:
+        # 篩選條件會查詢資料庫，每一輪結束後釋放連線
+        try:
+            count = prewarm()
+            if count:
+                logger.info('快取預熱完成：%s 個請求', count)
+        except Exception:
+            logger.exception('快取預熱失敗')
+        finally:
+            close_old_connections()
+        time.sleep(interval)
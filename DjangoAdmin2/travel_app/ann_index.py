@@ -0,0 +1,161 @@
+"""
+可切換的 FAISS 索引類型
+
+INDEX_SPEC 使用 faiss.index_factory 的字串，例如：
+    'Flat'          暴力搜尋（原本的 IndexFlatIP）
+    'IVF256,Flat'   倒排索引，查詢時用 nprobe 調整
+    'HNSW32'        圖索引，查詢時用 efSearch 調整（不支援刪除，異動時會整份重建）
+    'IVF,PQ16x8'    沒寫群數時依資料量自動決定
+"""
+import logging
+import math
+import re
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 每個 IVF 群至少要有幾筆訓練資料（faiss 建議 39 筆以上）
+TRAIN_POINTS_PER_LIST = 39
+
+# IVF 第一次依 doc id 取向量時要建立 direct map，只能建立一次
+_direct_map_lock = threading.Lock()
+
+
+def resolve_spec(spec, ntotal):
+    """把沒有指定群數的 'IVF' 換成依資料量計算的 IVF<n>"""
+    if not re.search(r'IVF(?!\d)', spec):
+        return spec
+    nlist = max(1, min(int(4 * math.sqrt(max(ntotal, 1))), ntotal // TRAIN_POINTS_PER_LIST or 1))
+    return re.sub(r'IVF(?!\d)', f'IVF{nlist}', spec)
+
+
+def new_index(dims, spec='Flat', ntotal=0):
+    """
+    建立內積索引。IVF 本身就能記錄 doc id；其他類型外面再包一層 IndexIDMap
+    """
+    import faiss  # type: ignore
+    index = faiss.index_factory(dims, resolve_spec(spec, ntotal), faiss.METRIC_INNER_PRODUCT)
+    if faiss.try_extract_index_ivf(index) is None:
+        index = faiss.IndexIDMap(index)
+    return index
+
+
+def base_index(index):
+    """拿掉 IndexIDMap 外層，回傳實際的索引"""
+    import faiss  # type: ignore
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index):
+    import faiss  # type: ignore
+    if faiss.try_extract_index_ivf(index) is not None:
+        return 'ivf'
+    if isinstance(base_index(index), faiss.IndexHNSW):
+        return 'hnsw'
+    return 'flat'
+
+
+def supports_remove(index):
+    """HNSW 不能刪除向量，異動時只能整份重建"""
+    return index_kind(index) != 'hnsw'
+
+
+def training_size(index):
+    """需要訓練的索引要抽樣多少筆；不需要訓練時回傳 0"""
+    if index.is_trained:
+        return 0
+    import faiss  # type: ignore
+    # PQ 每個子空間有 256 個中心點，IVF 則依群數
+    ivf = faiss.try_extract_index_ivf(index)
+    nlist = ivf.nlist if ivf is not None else 0
+    return max(nlist, 256) * TRAIN_POINTS_PER_LIST
+
+
+def train(index, sample):
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(sample, dtype='float32'))
+
+
+def read_index(path, mmap=False):
+    """
+    讀取索引。mmap=True 時以唯讀 mmap 開啟，向量資料留在 page cache，
+    多個 worker 共用同一份實體記憶體；不支援的索引類型退回一般讀取。
+    回傳 (index, 是否為 mmap)
+    """
+    import faiss  # type: ignore
+    if mmap:
+        # IO_FLAG_MMAP_IFC（faiss 1.8+）可 mmap Flat / IVF / HNSW 的向量；舊版只能用 IO_FLAG_MMAP
+        flags = [getattr(faiss, 'IO_FLAG_MMAP_IFC', None), faiss.IO_FLAG_MMAP]
+        for flag in flags:
+            if flag is None:
+                continue
+            try:
+                return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError as e:
+                logger.info('索引無法以 mmap 讀取（flag=%s）：%s', flag, e)
+    return faiss.read_index(path), False
+
+
+def reconstruct(index, doc_id):
+    """
+    依 doc id 取回索引中儲存的向量，不存在時回傳 None。
+    IndexIDMap 先從 id_map 找到位置再向內層索引取向量；IVF 第一次使用時建立 direct map。
+    PQ 類的索引取回的是量化後的近似向量
+    """
+    import faiss  # type: ignore
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        positions = np.flatnonzero(faiss.vector_to_array(index.id_map) == doc_id)
+        if not len(positions):
+            return None
+        return index.index.reconstruct(int(positions[0]))
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        with _direct_map_lock:
+            # travel_id 不連續，要用 hashtable 形式的 direct map
+            if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    try:
+        return index.reconstruct(int(doc_id))
+    except RuntimeError:
+        return None
+
+
+def search_parameters(index, nprobe=None, ef_search=None, selector=None):
+    """
+    依索引類型組出單次查詢用的 SearchParameters（不會改到共用的索引設定）
+    selector 是 faiss.IDSelector，用來在檢索時只考慮部分 doc id
+    """
+    import faiss  # type: ignore
+    kind = index_kind(index)
+    kwargs = {}
+    if selector is not None:
+        kwargs['sel'] = selector
+    if kind == 'ivf' and nprobe:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe), **kwargs)
+    if kind == 'hnsw' and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search), **kwargs)
+    if kwargs:
+        return faiss.SearchParameters(**kwargs)
+    return None
+
+
+def id_selector(ids):
+    """只允許指定 doc id 的 selector；ids 必須在查詢結束前保持存在"""
+    import faiss  # type: ignore
+    return faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype='int64'))
+
+
+def describe(index):
+    import faiss  # type: ignore
+    info = {'kind': index_kind(index), 'ntotal': int(index.ntotal), 'dims': index.d}
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        info['nlist'] = int(ivf.nlist)
+    return info
@@ -0,0 +1,103 @@
+"""
+語意搜尋的請求合併（micro-batching）
+
+同一個行程內、在很短的時間窗內到達的查詢會被合併成一批，
+只呼叫一次 encode 與一次 index.search，再把結果分回各個請求。
+只有在多執行緒的 worker（runserver、gunicorn gthread）下才會真的合併到多個請求。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# 等待批次結果的上限（秒）
+RESULT_TIMEOUT = 30
+
+
+class MicroBatcher:
+    """
+    handler(items, contexts) 接收合併後的 list 與每個項目所屬請求的 context，
+    回傳等長的結果 list。每個請求送進來的是一個 list，結果也以 list 回傳。
+    """
+
+    def __init__(self, handler, window_ms=5, max_batch=64, name='micro-batcher'):
+        self.handler = handler
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, items, context=None):
+        """送出一個請求的所有項目，阻塞到批次處理完成"""
+        if not items:
+            return []
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((list(items), context, future))
+        return future.result(timeout=RESULT_TIMEOUT)
+
+    def _ensure_worker(self):
+        # fork 之後執行緒不會跟著過去，要在子行程重新啟動
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """拿到第一個請求後，在時間窗內繼續收集，直到達到批次上限"""
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for request_items, _, _ in batch for item in request_items]
+            contexts = [context for request_items, context, _ in batch for _ in request_items]
+            try:
+                results = self.handler(items, contexts)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            start = 0
+            for request_items, _, future in batch:
+                future.set_result(results[start:start + len(request_items)])
+                start += len(request_items)
+
+    def stats(self):
+        return {
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else None,
+            'queue_depth': self._queue.qsize(),
+        }
@@ -0,0 +1,405 @@
+"""
+語意搜尋的 recall / 延遲基準測試
+
+從 travel 資料表匯出一份固定的子集（fixture），之後每次都用同一份 fixture
+在本機建立索引，不需要連資料庫。查詢句子取自景點名稱與介紹的第一句，
+以 Flat 索引的結果當作標準答案，計算 recall@k、延遲分位數、編碼 / 檢索時間與 QPS。
+encoder_parity() 則比較兩個 encoder 後端（例如 torch 與 onnx-int8）的向量、排序、延遲與記憶體。
+measure_nearby() 比較附近景點的空間索引與直接以 ORM 讀取座標逐筆計算距離的延遲。
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import ann_index
+from .indexer import document_text
+from .models import Travel
+from .search_registry import get_search_settings, registry
+
+FIXTURE_FIELDS = ('travel_id', 'travel_name', 'travel_txt', 'region', 'town', 'class1_id')
+DEFAULT_FIXTURE = os.path.join(settings.BASE_DIR, 'travel_app', 'travel_model', 'benchmark_fixture.json')
+
+
+def export_fixture(path, limit=500):
+    """依 travel_id 均勻抽出 limit 筆景點寫成 fixture"""
+    ids = list(Travel.objects.order_by('travel_id').values_list('travel_id', flat=True))
+    step = max(1, len(ids) // limit)
+    picked = ids[::step][:limit]
+    rows = list(Travel.objects.filter(travel_id__in=picked).order_by('travel_id').values(*FIXTURE_FIELDS))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=1)
+    return len(rows)
+
+
+def load_fixture(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def first_sentence(text):
+    if not text:
+        return ''
+    return re.split(r'[。！？!?\n]', text.strip(), maxsplit=1)[0]
+
+
+def build_queries(rows, limit=200):
+    """每個景點產生兩種查詢：名稱，以及介紹的第一句；expected 是來源景點"""
+    queries = []
+    for row in rows:
+        queries.append({'text': row['travel_name'], 'kind': 'name', 'expected': row['travel_id']})
+        sentence = first_sentence(row['travel_txt'])
+        if sentence:
+            queries.append({'text': sentence, 'kind': 'sentence', 'expected': row['travel_id']})
+    return queries[:limit]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return float(np.percentile(np.asarray(values) * 1000, q))
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class SearchBenchmark:
+    """在 fixture 上建立標準答案（Flat）與受測索引，並量測各項指標"""
+
+    def __init__(self, rows, encode=None, spec=None, k=10, nprobe=None, ef_search=None):
+        config = get_search_settings()
+        self.rows = rows
+        self.encode = encode or self._default_encode
+        self.spec = spec or config['INDEX_SPEC']
+        self.k = k
+        self.nprobe = nprobe or config['NPROBE']
+        self.ef_search = ef_search or config['EF_SEARCH']
+
+    @staticmethod
+    def _default_encode(texts):
+        embeddings = registry.get_encoder().encode(
+            texts, batch_size=512, show_progress_bar=False, normalize_embeddings=False
+        )
+        return np.asarray(embeddings, dtype='float32')
+
+    def build(self):
+        ids = np.array([row['travel_id'] for row in self.rows], dtype='int64')
+        start = time.perf_counter()
+        vectors = self.encode([document_text(row['travel_txt'], row['travel_name']) for row in self.rows])
+        self.corpus_encode_seconds = time.perf_counter() - start
+
+        self.truth_index = ann_index.new_index(vectors.shape[1], 'Flat')
+        self.truth_index.add_with_ids(vectors, ids)
+
+        start = time.perf_counter()
+        self.index = ann_index.new_index(vectors.shape[1], self.spec, len(vectors))
+        ann_index.train(self.index, vectors)
+        self.index.add_with_ids(vectors, ids)
+        self.build_seconds = time.perf_counter() - start
+        self.params = ann_index.search_parameters(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+
+    def search_one(self, text):
+        """單一查詢：回傳 (ids, encode 秒數, search 秒數)"""
+        start = time.perf_counter()
+        vector = self.encode([text])
+        encoded = time.perf_counter()
+        _, I = self.index.search(vector, self.k, params=self.params)
+        return I[0], encoded - start, time.perf_counter() - encoded
+
+    def measure_quality(self, queries):
+        vectors = self.encode([query['text'] for query in queries])
+        _, truth = self.truth_index.search(vectors, self.k)
+        _, found = self.index.search(vectors, self.k, params=self.params)
+        recall = np.mean([len(set(f) & set(t)) / self.k for f, t in zip(found, truth)])
+        hit = np.mean([query['expected'] in f for query, f in zip(queries, found)])
+        reciprocal = []
+        for query, f in zip(queries, found):
+            positions = np.where(f == query['expected'])[0]
+            reciprocal.append(1 / (positions[0] + 1) if len(positions) else 0)
+        return {
+            f'recall@{self.k}': float(recall),
+            f'hit@{self.k}': float(hit),
+            'mrr': float(np.mean(reciprocal)),
+        }
+
+    def _rank_quality(self, queries, found):
+        hit, reciprocal = [], []
+        for query, ids in zip(queries, found):
+            ids = list(ids[:self.k])
+            hit.append(query['expected'] in ids)
+            reciprocal.append(1 / (ids.index(query['expected']) + 1) if query['expected'] in ids else 0)
+        return {f'hit@{self.k}': float(np.mean(hit)), 'mrr': float(np.mean(reciprocal))}
+
+    def measure_rerank(self, queries, candidates=30, budgets_ms=(50, 150, 500, None)):
+        """
+        第一階段取 candidates 筆候選，比較 cross-encoder 重新排序前後的 hit@k / MRR，
+        以及各時間預算下 rerank 階段的延遲與實際完成排序的比例（不使用分數快取）
+        """
+        from .reranker import passage_text, rerank
+        passages = {row['travel_id']: passage_text(row['travel_name'], row['travel_txt']) for row in self.rows}
+        model = registry.get_reranker()
+        D, I = self.index.search(self.encode([query['text'] for query in queries]), candidates, params=self.params)
+        first = [[int(doc_id) for doc_id in row if doc_id != -1] for row in I]
+
+        runs = []
+        for budget in budgets_ms:
+            found, latencies, reranked = [], [], 0
+            for query, ids, scores in zip(queries, first, D):
+                start = time.perf_counter()
+                deadline = time.monotonic() + (budget / 1000 if budget else float('inf'))
+                _, order, done = rerank(
+                    query['text'], scores[:len(ids)].tolist(), ids, self.k, deadline,
+                    get_passages=lambda doc_ids: {doc_id: passages[doc_id] for doc_id in doc_ids},
+                    get_model=lambda: model, cache=None, version=0,
+                )
+                latencies.append(time.perf_counter() - start)
+                found.append(order)
+                reranked += done
+            runs.append(dict(
+                self._rank_quality(queries, found),
+                budget_ms=budget,
+                reranked_rate=reranked / len(queries),
+                p50_ms=percentile(latencies, 50),
+                p95_ms=percentile(latencies, 95),
+            ))
+        return {
+            'model_name': get_search_settings()['RERANK_MODEL'],
+            'candidates': candidates,
+            'first_stage': self._rank_quality(queries, first),
+            'runs': runs,
+        }
+
+    def measure_latency(self, queries):
+        totals, encodes, searches = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            _, encode_seconds, search_seconds = self.search_one(query['text'])
+            totals.append(time.perf_counter() - start)
+            encodes.append(encode_seconds)
+            searches.append(search_seconds)
+        return {
+            'p50_ms': percentile(totals, 50),
+            'p95_ms': percentile(totals, 95),
+            'p99_ms': percentile(totals, 99),
+            'encode_mean_ms': float(np.mean(encodes) * 1000),
+            'search_mean_ms': float(np.mean(searches) * 1000),
+        }
+
+    def measure_qps(self, queries, concurrency, requests_per_client=20):
+        lock = threading.Lock()
+        latencies = []
+
+        def client(offset):
+            local = []
+            for i in range(requests_per_client):
+                query = queries[(offset * requests_per_client + i) % len(queries)]
+                start = time.perf_counter()
+                self.search_one(query['text'])
+                local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return {
+            'concurrency': concurrency,
+            'qps': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+        }
+
+    def run(self, query_limit=200, concurrency_levels=(1, 8, 32), rerank_candidates=None):
+        self.build()
+        queries = build_queries(self.rows, query_limit)
+        result = {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'model_name': get_search_settings()['MODEL_NAME'],
+            'encoder_backend': get_search_settings()['ENCODER_BACKEND'],
+            'index': ann_index.describe(self.index),
+            'index_spec': self.spec,
+            'nprobe': self.nprobe,
+            'ef_search': self.ef_search,
+            'k': self.k,
+            'documents': len(self.rows),
+            'queries': len(queries),
+            'corpus_encode_seconds': self.corpus_encode_seconds,
+            'build_seconds': self.build_seconds,
+            'quality': self.measure_quality(queries),
+            'latency': self.measure_latency(queries),
+            'throughput': [self.measure_qps(queries, level) for level in concurrency_levels],
+        }
+        if rerank_candidates:
+            result['rerank'] = self.measure_rerank(queries, candidates=rerank_candidates)
+        return result
+
+
+def rss_mb():
+    """目前的 RSS（MB）；沒有 /proc 時退回最高 RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # Linux 的 ru_maxrss 單位是 KB，macOS 是 bytes
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _encode(encoder, texts, batch_size=64):
+    embeddings = encoder.encode(texts, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=False)
+    return np.asarray(embeddings, dtype='float32')
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _encoder_latency(encoder, queries, corpus_texts):
+    singles = []
+    for query in queries:
+        start = time.perf_counter()
+        _encode(encoder, [query['text']])
+        singles.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    _encode(encoder, corpus_texts)
+    batch_seconds = time.perf_counter() - start
+    return {
+        'single_p50_ms': percentile(singles, 50),
+        'single_p95_ms': percentile(singles, 95),
+        'batch_texts_per_sec': len(corpus_texts) / batch_seconds if batch_seconds else None,
+    }
+
+
+def encoder_parity(load_reference, load_candidate, rows, k=10, query_limit=200):
+    """
+    比較兩個 encoder：同一段文字向量的 cosine、以各自向量檢索的 top-k 重疊率、
+    單句 / 批次延遲，以及載入後增加的 RSS。load_* 是回傳 encoder 的函式
+    """
+    corpus_texts = [document_text(row['travel_txt'], row['travel_name']) for row in rows]
+    queries = build_queries(rows, query_limit)
+    report = {'documents': len(rows), 'queries': len(queries), 'k': k}
+    vectors = {}
+
+    for name, loader in (('reference', load_reference), ('candidate', load_candidate)):
+        before = rss_mb()
+        start = time.perf_counter()
+        encoder = loader()
+        load_seconds = time.perf_counter() - start
+        rss_delta = rss_mb() - before
+        # 先暖身一次，避免第一次呼叫的初始化時間算進延遲
+        _encode(encoder, [queries[0]['text']])
+        corpus = _normalize(_encode(encoder, corpus_texts))
+        query_vectors = _normalize(_encode(encoder, [query['text'] for query in queries]))
+        vectors[name] = (corpus, query_vectors)
+        report[name] = dict(
+            _encoder_latency(encoder, queries, corpus_texts),
+            load_seconds=load_seconds,
+            rss_delta_mb=rss_delta,
+        )
+        del encoder
+
+    ref_corpus, ref_queries = vectors['reference']
+    cand_corpus, cand_queries = vectors['candidate']
+    cosine = np.sum(ref_corpus * cand_corpus, axis=1)
+    # 索引用的是內積，這裡也以正規化後的內積排序
+    ref_top = np.argsort(-(ref_queries @ ref_corpus.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_queries @ cand_corpus.T), axis=1)[:, :k]
+    overlap = [len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)]
+    report['parity'] = {
+        'cosine_mean': float(np.mean(cosine)),
+        'cosine_min': float(np.min(cosine)),
+        f'overlap@{k}': float(np.mean(overlap)),
+        'top1_agreement': float(np.mean(ref_top[:, 0] == cand_top[:, 0])),
+    }
+    return report
+
+
+def _orm_nearby(lat, lng, radius_km, bounding_box=False):
+    """
+    不使用空間索引的作法：以 ORM 讀出座標，逐筆用 math 計算 haversine 後排序。
+    bounding_box=True 時先在資料庫以經緯度範圍縮小候選（沒有空間索引時較合理的作法）
+    """
+    import math
+
+    from .spatial import EARTH_RADIUS_KM
+
+    queryset = Travel.objects.filter(px__isnull=False, py__isnull=False)
+    if bounding_box:
+        dlat = radius_km / (EARTH_RADIUS_KM * math.pi / 180)
+        dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        queryset = queryset.filter(py__range=(lat - dlat, lat + dlat), px__range=(lng - dlng, lng + dlng))
+    found = []
+    for travel_id, py, px in queryset.values_list('travel_id', 'py', 'px'):
+        lat2, lng2 = math.radians(float(py)), math.radians(float(px))
+        a = (math.sin((lat2 - math.radians(lat)) / 2) ** 2
+             + math.cos(math.radians(lat)) * math.cos(lat2) * math.sin((lng2 - math.radians(lng)) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+        if distance <= radius_km:
+            found.append((distance, travel_id))
+    found.sort()
+    return found
+
+
+def measure_nearby(query_count=200, radius_km=3.0, seed=0):
+    """
+    以資料庫中隨機景點附近的點當作查詢，比較空間索引與 ORM 作法的延遲，並確認結果一致
+    """
+    from .spatial import SpatialIndex, load_rows
+
+    rows = list(load_rows())
+    if not rows:
+        return None
+    start = time.perf_counter()
+    index = SpatialIndex.from_rows(rows)
+    build_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(rows), size=min(query_count, len(rows)), replace=False)
+    points = [(float(rows[i][1]) + rng.normal(0, 0.01), float(rows[i][2]) + rng.normal(0, 0.01)) for i in picks]
+
+    methods = {
+        'spatial_index': lambda lat, lng: list(zip(*(array.tolist() for array in index.query(lat, lng, radius_km)))),
+        'orm_scan': lambda lat, lng: _orm_nearby(lat, lng, radius_km),
+        'orm_bounding_box': lambda lat, lng: _orm_nearby(lat, lng, radius_km, bounding_box=True),
+    }
+    report = {'rows': len(rows), 'queries': len(points), 'radius_km': radius_km, 'index_build_seconds': build_seconds}
+    results = {}
+    for name, method in methods.items():
+        latencies = []
+        results[name] = []
+        for lat, lng in points:
+            start = time.perf_counter()
+            results[name].append([travel_id for _, travel_id in method(lat, lng)])
+            latencies.append(time.perf_counter() - start)
+        report[name] = {
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'mean_ms': float(np.mean(latencies) * 1000),
+            'avg_results': float(np.mean([len(found) for found in results[name]])),
+        }
+    report['results_match'] = all(
+        set(a) == set(b) == set(c)
+        for a, b, c in zip(results['spatial_index'], results['orm_scan'], results['orm_bounding_box'])
+    )
+    report['speedup_vs_orm_scan'] = report['orm_scan']['mean_ms'] / report['spatial_index']['mean_ms']
+    return report
@@ -0,0 +1,27 @@
+"""
+資料版本號：資料異動時遞增，行程內的快取用版本號判斷是否過期
+
+版本號存在 Django cache。若 CACHES 設定為 Redis / Memcached 等共用快取，
+所有 worker 都會看到同一個版本；預設的 LocMemCache 只在同一個行程內有效，
+因此快取本身仍應搭配 TTL。
+"""
+from django.core.cache import cache
+
+KEY_PREFIX = 'travel_app:version:'
+
+
+def get_version(name):
+    version = cache.get(KEY_PREFIX + name)
+    if version is None:
+        version = 1
+        cache.add(KEY_PREFIX + name, version, timeout=None)
+    return version
+
+
+def bump_version(name):
+    try:
+        return cache.incr(KEY_PREFIX + name)
+    except ValueError:
+        # key 不存在（或已被清掉）時重新建立
+        cache.set(KEY_PREFIX + name, 2, timeout=None)
+        return 2
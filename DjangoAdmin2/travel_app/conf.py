@@ -0,0 +1,30 @@
+"""
+travel_app 一般功能的設定
+
+附近景點、地圖群集、縣市對照表等功能與語意搜尋無關，不放在 TRAVEL_SEARCH；
+myproject/settings.py 的 TRAVEL_APP 只需要寫與預設不同的項目。
+"""
+from django.conf import settings
+
+DEFAULT_TRAVEL_SETTINGS = {
+    # 附近景點 API（travel/api/nearby/）的半徑上限（公里）；
+    # 版本號只在行程內有效（LocMemCache）時，其他 worker 的異動最多幾秒後才反映到本 worker 的空間索引
+    'NEARBY_MAX_RADIUS_KM': 50,
+    'NEARBY_REFRESH_SECONDS': 300,
+    # 地圖群集 API（travel/api/map/）：縮放層級達 MAP_POINTS_ZOOM 才回傳個別景點；
+    # 一次請求最多 MAP_MAX_TILES 張圖磚，圖磚結果快取在各 worker（筆數 / 秒），景點異動後自動失效
+    'MAP_POINTS_ZOOM': 15,
+    'MAP_MAX_TILES': 64,
+    'MAP_TILE_CACHE_SIZE': 4096,
+    'MAP_TILE_CACHE_TTL': 3600,
+    # 縣市 / 鄉鎮市區對照表（counties / taiwen）載入到各 worker 的記憶體，驗證時不查詢資料庫；
+    # 資料幾乎不會變動，版本號只在行程內有效時最多幾秒後重新載入
+    'GAZETTEER_REFRESH_SECONDS': 3600,
+}
+
+
+def get_travel_settings():
+    """合併預設值與 settings.TRAVEL_APP"""
+    config = dict(DEFAULT_TRAVEL_SETTINGS)
+    config.update(getattr(settings, 'TRAVEL_APP', {}))
+    return config
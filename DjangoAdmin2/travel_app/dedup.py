@@ -0,0 +1,207 @@
+"""
+景點的正規化雜湊與近似重複偵測
+
+名稱、電話、地址先正規化（全形轉半形、去掉空白與標點、「台」視為「臺」、電話只留數字），
+再取 128 位元雜湊存在 travel 表有索引的 *_hash 欄位，重複檢查只需要一次索引查詢，
+只差在空白或全形字的資料也會被視為重複。
+
+近似重複以 MinHash + LSH 批次找出：名稱與地址的字元 3-gram 取 NUM_PERM 個 MinHash，
+切成 BANDS 段，任一段完全相同的景點成為候選，再以估計的 Jaccard 相似度過濾，
+最後與雜湊完全相同的景點一起以 union-find 合併成群組。
+"""
+import hashlib
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from .models import Travel
+
+HASH_FIELDS = ('name_hash', 'tel_hash', 'address_hash')
+
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+BANDS = 32
+
+# 同一個 LSH 桶超過這麼多筆時只比較前面的景點，避免常見字串造成平方級的候選數
+MAX_BUCKET = 200
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_IGNORED = re.compile(r'[\s\W_]+')
+
+
+def normalize_text(text):
+    """全形轉半形、轉小寫、去掉空白與標點，「台」一律視為「臺」"""
+    text = unicodedata.normalize('NFKC', str(text or '')).casefold()
+    return _IGNORED.sub('', text).replace('台', '臺')
+
+
+def normalize_tel(tel):
+    """只留數字；+886 開頭的國際格式轉回 0 開頭"""
+    digits = re.sub(r'\D', '', unicodedata.normalize('NFKC', str(tel or '')))
+    if digits.startswith('886'):
+        digits = '0' + digits[3:]
+    return digits
+
+
+def normalize_address(address):
+    """去掉開頭的郵遞區號後與 normalize_text 相同"""
+    text = normalize_text(address)
+    return re.sub(r'^\d{3,6}', '', text)
+
+
+def value_hash(normalized):
+    if not normalized:
+        return None
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def travel_hashes(name, tel, address):
+    return {
+        'name_hash': value_hash(normalize_text(name)),
+        'tel_hash': value_hash(normalize_tel(tel)),
+        'address_hash': value_hash(normalize_address(address)),
+    }
+
+
+def backfill_hashes(batch_size=1000, model=Travel):
+    """重新計算所有景點的雜湊欄位，回傳更新的筆數"""
+    updated, batch = 0, []
+    travels = model.objects.only('travel_id', 'travel_name', 'tel', 'travel_address', *HASH_FIELDS).order_by('travel_id')
+    for travel in travels.iterator(chunk_size=batch_size):
+        hashes = travel_hashes(travel.travel_name, travel.tel, travel.travel_address)
+        if any(getattr(travel, field) != value for field, value in hashes.items()):
+            for field, value in hashes.items():
+                setattr(travel, field, value)
+            batch.append(travel)
+        if len(batch) >= batch_size:
+            model.objects.bulk_update(batch, HASH_FIELDS)
+            updated += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, HASH_FIELDS)
+        updated += len(batch)
+    return updated
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.default_rng(seed)
+        # (a * x + b) mod p，a < 2^31、x < 2^32，乘積不會超出 uint64
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype='uint64')
+        self.b = rng.integers(0, 1 << 31, num_perm, dtype='uint64')
+        self.num_perm = num_perm
+
+    def signature(self, text):
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))}
+        values = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingles if shingle], dtype='uint64')
+        if not len(values):
+            return np.full(self.num_perm, _MAX_HASH, dtype='uint32')
+        hashed = (values[:, None] * self.a + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return hashed.min(axis=0).astype('uint32')
+
+
+def lsh_candidates(signatures, bands=BANDS):
+    """任一段 MinHash 完全相同的 (i, j) 配對，i < j"""
+    rows = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        part = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for position, key in enumerate(part):
+            buckets[key.tobytes()].append(position)
+        for members in buckets.values():
+            members = members[:MAX_BUCKET]
+            for index, i in enumerate(members):
+                for j in members[index + 1:]:
+                    pairs.add((i, j))
+    return pairs
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        self.parent[self.find(x)] = self.find(y)
+
+
+def find_duplicates(records, threshold=0.6, bands=BANDS, num_perm=NUM_PERM):
+    """
+    records 為 [(travel_id, 名稱, 電話, 地址)]。回傳可能重複的群組
+    [{'travel_ids': [...], 'reasons': [...], 'similarity': 最高的估計相似度}]，依群組大小排序
+    """
+    hasher = MinHasher(num_perm)
+    texts = [normalize_text(name) + normalize_address(address) for _, name, _, address in records]
+    signatures = np.array([hasher.signature(text) for text in texts]).reshape(len(records), num_perm)
+
+    union = _UnionFind(len(records))
+    reasons = defaultdict(set)
+    similarity = defaultdict(float)
+
+    def link(i, j, reason, score):
+        union.union(i, j)
+        reasons[(i, j)].add(reason)
+        similarity[(i, j)] = max(similarity[(i, j)], score)
+
+    for i, j in lsh_candidates(signatures, bands):
+        score = float(np.mean(signatures[i] == signatures[j]))
+        if score >= threshold and texts[i]:
+            link(i, j, 'similar', score)
+
+    # 正規化後完全相同的名稱 / 電話 / 地址
+    exact = (
+        ('name', [normalize_text(record[1]) for record in records]),
+        ('tel', [normalize_tel(record[2]) for record in records]),
+        ('address', [normalize_address(record[3]) for record in records]),
+    )
+    for reason, values in exact:
+        first = {}
+        for position, value in enumerate(values):
+            if not value:
+                continue
+            if value in first:
+                link(first[value], position, reason, 1.0)
+            else:
+                first[value] = position
+
+    groups = defaultdict(list)
+    for position in range(len(records)):
+        groups[union.find(position)].append(position)
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        member_set = set(members)
+        pairs = [pair for pair in reasons if pair[0] in member_set]
+        clusters.append({
+            'travel_ids': sorted(records[position][0] for position in members),
+            'reasons': sorted(set().union(*(reasons[pair] for pair in pairs))),
+            'similarity': round(max(similarity[pair] for pair in pairs), 3),
+        })
+    clusters.sort(key=lambda cluster: (-len(cluster['travel_ids']), -cluster['similarity'], cluster['travel_ids']))
+    return clusters
+
+
+def load_records(batch_size=2000):
+    """依 travel_id 分批讀取 (travel_id, 名稱, 電話, 地址)"""
+    records, last_id = [], 0
+    while True:
+        batch = list(
+            Travel.objects.filter(travel_id__gt=last_id).order_by('travel_id')
+            .values_list('travel_id', 'travel_name', 'tel', 'travel_address')[:batch_size]
+        )
+        if not batch:
+            return records
+        records.extend(batch)
+        last_id = batch[-1][0]
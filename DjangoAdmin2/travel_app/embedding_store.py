@@ -0,0 +1,141 @@
+"""
+景點向量的持久化儲存
+
+以 (模型名稱 + encoder 後端, travel_id, 文字雜湊) 為鍵，向量以 float16 存成 .npy 分片：
+    <EMBEDDING_STORE_DIR>/<模型>/<分片>.npy       向量（N x d，float16，讀取時 mmap）
+    <EMBEDDING_STORE_DIR>/<模型>/<分片>.keys.npy  每一列的 (travel_id, 文字雜湊)
+分片只會新增不會修改，同一個鍵以較新的分片為準；compact() 會合併分片並丟掉用不到的鍵。
+每個模型各自一個目錄，換模型時舊向量仍然保留，可以同時建兩份索引做比較。
+"""
+import os
+import re
+import time
+
+import numpy as np
+
+from .encoders import encoder_id
+from .search_registry import get_search_settings
+
+STORE_DTYPE = 'float16'
+KEY_DTYPE = np.dtype([('travel_id', 'int64'), ('hash', 'S40')])
+KEYS_SUFFIX = '.keys.npy'
+
+
+def model_slug(model_name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '__', model_name)
+
+
+def _save_npy(path, array):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class EmbeddingStore:
+    def __init__(self, model_name=None, root=None):
+        config = get_search_settings()
+        self.model_name = model_name or encoder_id(config['MODEL_NAME'], config['ENCODER_BACKEND'])
+        self.dir = os.path.join(root or config['EMBEDDING_STORE_DIR'], model_slug(self.model_name))
+        # (travel_id, 雜湊) -> (分片名稱, 列)
+        self._keys = None
+        self._vectors = {}
+
+    def _shard_names(self):
+        try:
+            names = os.listdir(self.dir)
+        except FileNotFoundError:
+            return []
+        # 鍵檔最後才寫入，有鍵檔的分片才是完整的
+        return sorted(name[:-len(KEYS_SUFFIX)] for name in names if name.endswith(KEYS_SUFFIX))
+
+    def _load(self):
+        if self._keys is not None:
+            return
+        self._keys = {}
+        for name in self._shard_names():
+            keys = np.load(os.path.join(self.dir, name + KEYS_SUFFIX))
+            for row, (travel_id, digest) in enumerate(keys.tolist()):
+                self._keys[(travel_id, digest.decode())] = (name, row)
+
+    def _shard(self, name):
+        if name not in self._vectors:
+            self._vectors[name] = np.load(os.path.join(self.dir, name + '.npy'), mmap_mode='r')
+        return self._vectors[name]
+
+    def __len__(self):
+        self._load()
+        return len(self._keys)
+
+    def lookup(self, keys):
+        """keys 為 [(travel_id, 雜湊)]，回傳 {位置: float32 向量}，沒有的不會出現在結果中"""
+        self._load()
+        by_shard = {}
+        for position, key in enumerate(keys):
+            found = self._keys.get(key)
+            if found is not None:
+                by_shard.setdefault(found[0], []).append((position, found[1]))
+
+        result = {}
+        for name, items in by_shard.items():
+            rows = self._shard(name)[[row for _, row in items]].astype('float32')
+            for (position, _), vector in zip(items, rows):
+                result[position] = vector
+        return result
+
+    def add(self, keys, vectors):
+        """新增一個分片；分片名稱含時間與 pid，不同行程同時寫入也不會撞名"""
+        if not len(keys):
+            return
+        self._load()
+        os.makedirs(self.dir, exist_ok=True)
+        name = f'{time.time_ns():020d}-{os.getpid()}'
+        self._write_shard(name, keys, vectors)
+        for row, key in enumerate(keys):
+            self._keys[key] = (name, row)
+
+    def _write_shard(self, name, keys, vectors):
+        _save_npy(os.path.join(self.dir, name + '.npy'), np.asarray(vectors, dtype=STORE_DTYPE))
+        _save_npy(os.path.join(self.dir, name + KEYS_SUFFIX), np.array(list(keys), dtype=KEY_DTYPE))
+
+    def compact(self, live_keys=None):
+        """把所有分片合併成一個；有給 live_keys 時只保留其中的鍵。回傳保留的筆數"""
+        self._load()
+        keys = [key for key in self._keys if live_keys is None or key in live_keys]
+        old_names = self._shard_names()
+        found = self.lookup(keys)
+        if keys:
+            name = f'{time.time_ns():020d}-{os.getpid()}'
+            self._write_shard(name, keys, np.vstack([found[i] for i in range(len(keys))]))
+        for old in old_names:
+            self._vectors.pop(old, None)
+            for suffix in (KEYS_SUFFIX, '.npy'):
+                try:
+                    os.remove(os.path.join(self.dir, old + suffix))
+                except FileNotFoundError:
+                    pass
+        self._keys = None
+        return len(keys)
+
+    def stats(self):
+        self._load()
+        names = self._shard_names()
+        size = sum(
+            os.path.getsize(os.path.join(self.dir, name + suffix))
+            for name in names for suffix in ('.npy', KEYS_SUFFIX)
+        )
+        return {
+            'model_name': self.model_name,
+            'path': self.dir,
+            'entries': len(self._keys),
+            'shards': len(names),
+            'bytes': size,
+        }
+
+
+def list_models(root=None):
+    root = root or get_search_settings()['EMBEDDING_STORE_DIR']
+    try:
+        return sorted(os.listdir(root))
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,33 @@
+"""
+建索引時在子行程中編碼的 worker
+
+子行程以 spawn 啟動，這個模組不能 import Django 的任何東西（models、settings），
+載入 encoder 需要的設定由主行程傳進來。
+"""
+import numpy as np
+
+ENCODE_BATCH_SIZE = 512
+
+_encoder = None
+
+
+def init_worker(model_name, threads=1, backend='torch', path=None, quantization='avx2'):
+    """每個子行程各自載入一次模型，並限制 torch 的執行緒數，避免多個行程互搶 CPU"""
+    global _encoder
+    try:
+        import torch  # type: ignore
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from .encoders import load_encoder
+    _encoder = load_encoder(model_name, backend=backend, path=path, quantization=quantization)
+
+
+def encode_chunk(texts):
+    embeddings = _encoder.encode(
+        texts,
+        batch_size=ENCODE_BATCH_SIZE,
+        show_progress_bar=False,
+        normalize_embeddings=False
+    )
+    return np.asarray(embeddings, dtype='float32')
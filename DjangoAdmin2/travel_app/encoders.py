@@ -0,0 +1,57 @@
+"""
+查詢 / 景點文字的 encoder 後端
+
+    'torch'       原本的 SentenceTransformer（PyTorch, float32）
+    'torch-int8'  PyTorch 動態量化：Linear 層改用 int8，不需要另外匯出
+    'onnx'        ONNX Runtime 執行匯出的 ONNX 圖（需要先執行 export_encoder）
+    'onnx-int8'   ONNX 圖再做動態 int8 量化（需要先執行 export_encoder）
+
+ONNX 只取代 transformer 本體，後面的 Pooling / Dense 層仍由 sentence-transformers 處理，
+所以輸出維度與原本相同。這個模組不 import Django，建索引的子行程也會用到。
+"""
+import os
+
+BACKENDS = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+
+
+def onnx_file_name(quantized, quantization='avx2'):
+    """export_dynamic_quantized_onnx_model 產生的檔名是 onnx/model_qint8_<設定>.onnx"""
+    return f'onnx/model_qint8_{quantization}.onnx' if quantized else 'onnx/model.onnx'
+
+
+def encoder_id(model_name, backend='torch'):
+    """
+    不同後端算出的向量有些微差異，embedding store 要分開存；
+    原本的 torch 後端沿用模型名稱，既有的向量不用重新編碼
+    """
+    return model_name if backend == 'torch' else f'{model_name}@{backend}'
+
+
+def load_encoder(model_name, backend='torch', path=None, quantization='avx2'):
+    if backend not in BACKENDS:
+        raise ValueError(f'不支援的 encoder 後端：{backend}，可用的有 {", ".join(BACKENDS)}')
+    if backend.startswith('onnx'):
+        file_name = onnx_file_name(backend == 'onnx-int8', quantization)
+        if not path or not os.path.exists(os.path.join(path, file_name)):
+            raise FileNotFoundError(f'找不到 ONNX 模型：{os.path.join(path or "", file_name)}，請先執行 export_encoder')
+    from sentence_transformers import SentenceTransformer  # type: ignore
+
+    if backend == 'torch':
+        return SentenceTransformer(model_name, device='cpu')
+
+    if backend == 'torch-int8':
+        import torch  # type: ignore
+        model = SentenceTransformer(model_name, device='cpu')
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    return SentenceTransformer(path, device='cpu', backend='onnx', model_kwargs={'file_name': file_name})
+
+
+def export_onnx(model_name, path, quantization='avx2'):
+    """把模型匯出成 ONNX（float32 與動態 int8 兩份）到 path，回傳產生的檔案"""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model  # type: ignore
+    model = SentenceTransformer(model_name, device='cpu', backend='onnx')
+    model.save_pretrained(path)
+    export_dynamic_quantized_onnx_model(model, quantization, path)
+    return [os.path.join(path, onnx_file_name(quantized, quantization)) for quantized in (False, True)]
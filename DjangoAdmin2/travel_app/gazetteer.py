@@ -0,0 +1,153 @@
+"""
+縣市 / 鄉鎮市區的記憶體內對照表
+
+counties 與 taiwen 幾乎不會變動，每個行程第一次使用時載入一次，之後的下拉選單與驗證都不查詢資料庫。
+資料表中「台」與「臺」混用，比對時一律以 canonical() 轉成「臺」。
+景點寫入時另外存下縣市 / 鄉鎮市區的整數代碼，篩選時以代碼比對（code_filter），不必同時比對兩種寫法。
+Counties / Taiwan 異動時遞增資料版本號（cache_version 'gazetteer'）讓各行程重新載入；
+版本號只在本行程有效（LocMemCache）時，最多 GAZETTEER_REFRESH_SECONDS 秒後重新載入。
+"""
+import threading
+import time
+
+from django.db.models import Q
+
+from .cache_version import get_version
+from .conf import get_travel_settings
+from .models import Counties, Taiwan, Travel
+
+
+def canonical(name):
+    """比對用的名稱：去掉前後空白，「台」一律視為「臺」"""
+    return (name or '').strip().replace('台', '臺')
+
+
+class Gazetteer:
+    def __init__(self, counties, towns):
+        """
+        counties 為 (id, 縣市)，towns 為 (taiwen_id, 縣市, 鄉鎮市區)；保留資料表中的寫法與順序。
+        縣市代碼為 counties.id，鄉鎮市區代碼為 taiwen.taiwen_id（寫入 Travel.region_code / town_code）
+        """
+        counties = list(counties)
+        self.regions = list(dict.fromkeys(name for _, name in counties))
+        # 縣市 -> 代碼（同名的縣市取第一筆）
+        self.region_codes = {}
+        for county_id, name in counties:
+            self.region_codes.setdefault(canonical(name), county_id)
+        # 縣市 -> [鄉鎮市區]；(縣市, 鄉鎮市區) -> 代碼；鄉鎮市區 -> [代碼]（不分縣市）
+        self.towns = {}
+        self.town_codes = {}
+        self.town_name_codes = {}
+        for taiwen_id, region, town in towns:
+            key = (canonical(region), canonical(town))
+            if key in self.town_codes:
+                continue
+            self.towns.setdefault(key[0], []).append(town)
+            self.town_codes[key] = taiwen_id
+            self.town_name_codes.setdefault(key[1], []).append(taiwen_id)
+
+    def has_region(self, region):
+        return canonical(region) in self.region_codes
+
+    def towns_of(self, region):
+        return self.towns.get(canonical(region), [])
+
+    def has_town(self, region, town):
+        return (canonical(region), canonical(town)) in self.town_codes
+
+    def region_code(self, region):
+        return self.region_codes.get(canonical(region))
+
+    def town_code(self, region, town):
+        return self.town_codes.get((canonical(region), canonical(town)))
+
+    def code_filter(self, region=None, town=None):
+        """
+        縣市 / 鄉鎮市區 -> Travel 的篩選條件（以整數代碼比對，使用 region_code, town_code 索引）；
+        名稱不存在時回傳 None，表示沒有任何景點符合。只給鄉鎮市區時比對所有同名的鄉鎮市區
+        """
+        conditions = {}
+        if region:
+            conditions['region_code'] = self.region_code(region)
+            if conditions['region_code'] is None:
+                return None
+        if town and region:
+            conditions['town_code'] = self.town_code(region, town)
+            if conditions['town_code'] is None:
+                return None
+        elif town:
+            conditions['town_code__in'] = self.town_name_codes.get(canonical(town))
+            if not conditions['town_code__in']:
+                return None
+        return Q(**conditions)
+
+    def region_error(self, region):
+        """新增 / 修改景點時縣市的錯誤訊息；景點資料的縣市一律寫成「臺」"""
+        if region.startswith('台'):
+            return "您好，台請改成臺"
+        if not self.has_region(region):
+            return "您好，此縣市不存在"
+        return None
+
+    def town_error(self, region, town):
+        if not self.has_town(region, town):
+            return "您好，這縣市，不存在此鄉鎮市"
+        return None
+
+
+class GazetteerRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.gazetteer = None
+        self.version = None
+        self.loaded_at = None
+
+    def _stale(self):
+        if self.gazetteer is None:
+            return True
+        max_age = get_travel_settings()['GAZETTEER_REFRESH_SECONDS']
+        return get_version('gazetteer') != self.version or time.monotonic() - self.loaded_at > max_age
+
+    def get(self):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    version = get_version('gazetteer')
+                    self.gazetteer = Gazetteer(
+                        Counties.objects.order_by('id').values_list('id', 'name'),
+                        Taiwan.objects.order_by('taiwen_id').values_list('taiwen_id', 'region', 'town'),
+                    )
+                    self.version, self.loaded_at = version, time.monotonic()
+        return self.gazetteer
+
+    def reset(self):
+        with self._lock:
+            self.gazetteer = None
+
+
+gazetteer_registry = GazetteerRegistry()
+
+
+def get_gazetteer():
+    return gazetteer_registry.get()
+
+
+def backfill_region_codes(travel_model=Travel, county_model=Counties, town_model=Taiwan):
+    """
+    依對照表填入景點的 region_code / town_code，並把縣市統一寫成「臺」。
+    依 (縣市, 鄉鎮市區) 組合批次更新，幾百次 UPDATE 即可涵蓋整張表；update() 不會觸發 signals。
+    回傳 (更新筆數, 對照表中沒有的 [(縣市, 鄉鎮市區)])
+    """
+    gazetteer = Gazetteer(
+        county_model.objects.order_by('id').values_list('id', 'name'),
+        town_model.objects.order_by('taiwen_id').values_list('taiwen_id', 'region', 'town'),
+    )
+    updated, unmatched = 0, []
+    for region, town in travel_model.objects.values_list('region', 'town').distinct().order_by():
+        town_code = gazetteer.town_code(region, town)
+        if town_code is None:
+            unmatched.append((region, town))
+        updated += travel_model.objects.filter(region=region, town=town).update(
+            region=canonical(region) or region, region_code=gazetteer.region_code(region), town_code=town_code,
+        )
+    return updated, unmatched
@@ -0,0 +1,263 @@
+"""
+可續跑、可平行的整份索引建置
+
+依 travel_id 分批讀取（keyset），embedding store 裡已有的向量（同模型、同文字雜湊）
+直接沿用，其餘送到子行程池編碼並存回 store。完成的批次把 (travel_id, 雜湊)
+寫成 <INDEX_PATH>.build/chunk-*.npz 並更新 checkpoint.json；中斷後再執行會從
+最後一個完成的批次繼續。全部批次完成後才從 store 取出向量、訓練 / 建立索引，
+寫成新版本並切換 manifest；建置期間搜尋繼續使用舊版本。
+"""
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.utils import timezone
+
+from . import ann_index, encode_worker
+from .embedding_store import EmbeddingStore
+from .encoders import encoder_id
+from .indexer import (
+    _write_json, document_text, encode_texts, index_write_lock, iter_travel_chunks,
+    save_index, text_hash, touch_lock,
+)
+from .models import TravelIndexTask
+from .search_registry import get_search_settings, registry
+
+logger = logging.getLogger(__name__)
+
+# 每個 worker 最多同時排幾批，避免讀取遠快於編碼時把整張表堆在記憶體
+INFLIGHT_PER_WORKER = 2
+
+
+def build_dir(index_path):
+    return index_path + '.build'
+
+
+def peak_memory_mb():
+    """本行程與（已結束的）子行程的最高 RSS，Windows 沒有 resource 時回傳 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux 的 ru_maxrss 單位是 KB，macOS 是 bytes
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def _save_npz(path, **arrays):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+class IndexBuild:
+    def __init__(self, index_path=None, chunk_size=1000, workers=1, skip_unchanged=True, compact=True, log=None):
+        config = get_search_settings()
+        self.index_path = index_path or config['INDEX_PATH']
+        self.model_name = config['MODEL_NAME']
+        self.backend = config['ENCODER_BACKEND']
+        self.encoder_args = (self.backend, config['ENCODER_PATH'], config['ENCODER_QUANTIZATION'])
+        self.spec = config['INDEX_SPEC']
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.skip_unchanged = skip_unchanged
+        self.compact = compact
+        self.log = log or logger.info
+        self.dir = build_dir(self.index_path)
+        self.checkpoint_path = os.path.join(self.dir, 'checkpoint.json')
+        self.store = EmbeddingStore(encoder_id(self.model_name, self.backend))
+
+    def _new_checkpoint(self):
+        return {
+            'model_name': self.model_name,
+            'encoder_backend': self.backend,
+            'index_spec': self.spec,
+            'chunk_size': self.chunk_size,
+            # 開始前已在佇列中的異動都會被這次建置涵蓋
+            'last_task': TravelIndexTask.objects.order_by('-id').values_list('id', flat=True).first(),
+            'last_id': 0,
+            'chunks': 0,
+            'rows': 0,
+            'encoded': 0,
+            'reused': 0,
+            'started_at': timezone.now().isoformat(),
+        }
+
+    def load_checkpoint(self, restart=False):
+        """讀取 checkpoint；模型或索引設定已變更時捨棄舊的批次重新開始"""
+        checkpoint = None
+        if not restart:
+            try:
+                with open(self.checkpoint_path, encoding='utf-8') as f:
+                    checkpoint = json.load(f)
+            except (FileNotFoundError, ValueError):
+                checkpoint = None
+        if checkpoint is not None and (
+            checkpoint.get('model_name') != self.model_name
+            or checkpoint.get('encoder_backend', 'torch') != self.backend
+            or checkpoint.get('index_spec') != self.spec
+        ):
+            self.log('設定已變更，捨棄先前的建置進度')
+            checkpoint = None
+        if checkpoint is None:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            os.makedirs(self.dir)
+            checkpoint = self._new_checkpoint()
+            _write_json(self.checkpoint_path, checkpoint)
+        return checkpoint
+
+    def _executor(self):
+        if self.workers <= 1:
+            return None
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # 用 spawn 啟動，子行程不會繼承 Django 的資料庫連線與 torch 的執行緒狀態
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=encode_worker.init_worker,
+            initargs=(self.model_name, threads) + self.encoder_args,
+        )
+
+    def _prepare(self, rows, executor):
+        """計算文字雜湊，store 裡已有的沿用，其餘送去編碼"""
+        texts = [document_text(txt, name) for _, txt, name in rows]
+        job = {
+            'ids': [row[0] for row in rows],
+            'hashes': [text_hash(text) for text in texts],
+        }
+        keys = list(zip(job['ids'], job['hashes']))
+        job['reused'] = self.store.lookup(keys) if self.skip_unchanged else {}
+        job['encode_at'] = [position for position in range(len(rows)) if position not in job['reused']]
+        job['texts'] = [texts[position] for position in job['encode_at']]
+
+        if not job['texts']:
+            job['result'] = None
+        elif executor is None:
+            job['result'] = encode_texts(job['texts'])
+        else:
+            job['result'] = executor.submit(encode_worker.encode_chunk, job['texts'])
+        return job
+
+    def _finish(self, job, checkpoint):
+        encoded = job['result']
+        if encoded is not None and not isinstance(encoded, np.ndarray):
+            encoded = encoded.result()
+
+        if encoded is not None:
+            self.store.add([(job['ids'][i], job['hashes'][i]) for i in job['encode_at']], encoded)
+
+        checkpoint['chunks'] += 1
+        _save_npz(
+            os.path.join(self.dir, f"chunk-{checkpoint['chunks']:06d}.npz"),
+            ids=np.array(job['ids'], dtype='int64'),
+            hashes=np.array(job['hashes'], dtype='S40'),
+        )
+        checkpoint['last_id'] = job['ids'][-1]
+        checkpoint['rows'] += len(job['ids'])
+        checkpoint['encoded'] += len(job['encode_at'])
+        checkpoint['reused'] += len(job['reused'])
+        _write_json(self.checkpoint_path, checkpoint)
+        touch_lock(self.index_path)
+        return len(job['ids'])
+
+    def _read_chunks(self):
+        """所有批次的 (travel_id, 雜湊) 與從 store 取出的向量"""
+        names = sorted(name for name in os.listdir(self.dir) if name.startswith('chunk-') and name.endswith('.npz'))
+        keys = []
+        for name in names:
+            data = np.load(os.path.join(self.dir, name))
+            keys.extend(zip(data['ids'].tolist(), (digest.decode() for digest in data['hashes'])))
+        if not keys:
+            return None, None
+        found = self.store.lookup(keys)
+        if len(found) != len(keys):
+            raise RuntimeError(f'embedding store 缺少 {len(keys) - len(found)} 筆向量，請加上 --restart 重新建置')
+        return keys, np.vstack([found[i] for i in range(len(keys))])
+
+    def _build_index(self, ids, vectors):
+        index = ann_index.new_index(vectors.shape[1], self.spec, len(vectors))
+        need = ann_index.training_size(index)
+        if need:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(len(vectors), min(need, len(vectors)), replace=False)]
+            ann_index.train(index, sample)
+        index.add_with_ids(vectors, ids)
+        return index
+
+    def run(self, restart=False):
+        """執行（或接續）建置，回傳統計資料；沒有任何景點時回傳 None"""
+        start = time.perf_counter()
+        with index_write_lock(self.index_path):
+            checkpoint = self.load_checkpoint(restart)
+            resumed_rows = checkpoint['rows']
+            if resumed_rows:
+                self.log(f"從 travel_id > {checkpoint['last_id']} 繼續（已完成 {resumed_rows} 筆）")
+
+            executor = self._executor()
+            pending = deque()
+            max_inflight = self.workers * INFLIGHT_PER_WORKER
+            try:
+                for rows in iter_travel_chunks(self.chunk_size, start_after=checkpoint['last_id']):
+                    pending.append(self._prepare(rows, executor))
+                    # 依序完成批次，checkpoint 才會是連續的
+                    while len(pending) >= max_inflight:
+                        self._finish(pending.popleft(), checkpoint)
+                        self._progress(checkpoint, resumed_rows, start)
+                while pending:
+                    self._finish(pending.popleft(), checkpoint)
+                    self._progress(checkpoint, resumed_rows, start)
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+
+            keys, vectors = self._read_chunks()
+            if keys is None:
+                shutil.rmtree(self.dir, ignore_errors=True)
+                return None
+            build_start = time.perf_counter()
+            index = self._build_index(np.array([travel_id for travel_id, _ in keys], dtype='int64'), vectors)
+            metadata = save_index(index, self.index_path)
+            build_seconds = time.perf_counter() - build_start
+            # 整份建置知道目前所有的鍵，順便合併分片、丟掉舊文字的向量
+            if self.compact:
+                self.store.compact(set(keys))
+
+        if checkpoint['last_task'] is not None:
+            TravelIndexTask.objects.filter(id__lte=checkpoint['last_task']).delete()
+        shutil.rmtree(self.dir, ignore_errors=True)
+        registry.reload_index()
+
+        elapsed = time.perf_counter() - start
+        session_rows = checkpoint['rows'] - resumed_rows
+        return {
+            'rows': checkpoint['rows'],
+            'encoded': checkpoint['encoded'],
+            'reused': checkpoint['reused'],
+            'resumed_from': resumed_rows,
+            'workers': self.workers,
+            'seconds': elapsed,
+            'index_build_seconds': build_seconds,
+            'rows_per_sec': session_rows / elapsed if elapsed else None,
+            'peak_memory_mb': peak_memory_mb(),
+            'store': self.store.stats(),
+            'metadata': metadata,
+        }
+
+    def _progress(self, checkpoint, resumed_rows, start):
+        elapsed = time.perf_counter() - start
+        rate = (checkpoint['rows'] - resumed_rows) / elapsed if elapsed else 0
+        self.log(
+            f"已完成 {checkpoint['rows']} 筆（編碼 {checkpoint['encoded']}，沿用 {checkpoint['reused']}），"
+            f"{rate:.1f} 筆/秒"
+        )
@@ -0,0 +1,98 @@
+"""
+版本化的索引檔
+
+每次寫入索引都產生新的檔案 vector.<版本>.index（旁邊是 vector.<版本>.index.meta.json），
+寫完後才以換名的方式更新 <INDEX_PATH>.manifest.json 指向新版本。
+正在查詢的行程不會讀到寫到一半的檔案，也不需要在同一個路徑上覆蓋被 mmap 的檔案；
+各行程看到 manifest 的版本變了，就在背景載入新版本再切換（見 search_registry）。
+沒有 manifest 時（舊的部署）沿用 INDEX_PATH 本身。
+"""
+import glob
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+
+def manifest_path(index_path):
+    return index_path + '.manifest.json'
+
+
+def version_path(index_path, version):
+    """vector.index -> vector.<version>.index"""
+    root, ext = os.path.splitext(index_path)
+    return f'{root}.{version}{ext}'
+
+
+def read_manifest(index_path):
+    try:
+        with open(manifest_path(index_path), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def current_version(index_path):
+    """目前的版本號；沒有 manifest 時回傳 None"""
+    manifest = read_manifest(index_path)
+    return manifest['version'] if manifest else None
+
+
+def current_index_path(index_path):
+    """manifest 指向的索引檔，沒有 manifest 時是 INDEX_PATH 本身"""
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        return index_path
+    return os.path.join(os.path.dirname(index_path), manifest['file'])
+
+
+def next_version(index_path):
+    """呼叫端需持有索引的寫入鎖"""
+    return (current_version(index_path) or 0) + 1
+
+
+def write_manifest(index_path, version, **extra):
+    """以換名的方式切換到 version，其他行程不會讀到寫一半的 manifest"""
+    path = manifest_path(index_path)
+    data = dict(extra, version=version, file=os.path.basename(version_path(index_path, version)))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return data
+
+
+def list_versions(index_path):
+    """磁碟上的所有版本，由舊到新"""
+    root, ext = os.path.splitext(index_path)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r'\.(\d+)' + re.escape(ext) + '$')
+    versions = []
+    for path in glob.glob(glob.escape(root) + '.*' + ext):
+        match = pattern.match(os.path.basename(path))
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def prune_versions(index_path, keep):
+    """
+    只保留最新的 keep 個版本（至少保留目前的版本）。
+    已 mmap 舊檔的行程不受刪檔影響（POSIX），切換到新版本後就會釋放
+    """
+    current = current_version(index_path)
+    removed = []
+    for version in list_versions(index_path)[:-max(keep, 1)]:
+        if version == current:
+            continue
+        path = version_path(index_path, version)
+        for file_path in (path, path + '.meta.json'):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning('無法刪除舊版索引 %s：%s', file_path, e)
+        removed.append(version)
+    return removed
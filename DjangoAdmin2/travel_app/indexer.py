@@ -0,0 +1,326 @@
+"""
+景點向量索引的增量維護
+
+Travel 的新增/修改/刪除由 signals 排入 TravelIndexTask，
+flush_pending() 只重新編碼有異動的 travel_txt，並在 IndexIDMap 上
+remove_ids / add_with_ids；rebuild_full() 只在需要整份重建時使用。
+編碼過的向量存在 embedding store，文字沒變的景點重建時不會再編碼。
+每次寫入都產生新版本的索引檔並更新 manifest（見 index_versions），
+索引旁會寫一份 metadata（模型名稱、向量數、最大 upload 日期），方便判斷是否過期。
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.db.models import Max
+from django.utils import timezone
+
+from . import ann_index, index_versions
+from .embedding_store import EmbeddingStore
+from .models import Travel, TravelIndexTask
+from .search_registry import get_search_settings, registry
+
+logger = logging.getLogger(__name__)
+
+ENCODE_BATCH_SIZE = 512
+
+# 寫入鎖超過這個秒數視為殘留（例如行程被中斷）
+LOCK_STALE_SECONDS = 3600
+
+
+class IndexLocked(Exception):
+    """已有其他行程在寫入索引"""
+
+
+def document_text(travel_txt, travel_name):
+    """用來編碼的文字，沒有介紹時退回景點名稱"""
+    return travel_txt or travel_name or ''
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def metadata_path(index_path):
+    return index_path + '.meta.json'
+
+
+def read_metadata(index_path=None):
+    index_path = index_path or get_search_settings()['INDEX_PATH']
+    try:
+        with open(metadata_path(index_versions.current_index_path(index_path)), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def load_index(index_path):
+    """讀取 manifest 指向的目前版本"""
+    import faiss  # type: ignore
+    path = index_versions.current_index_path(index_path)
+    if not os.path.exists(path):
+        return None
+    return faiss.read_index(path)
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_metadata(index, version=None):
+    config = get_search_settings()
+    max_upload = Travel.objects.aggregate(value=Max('upload'))['value']
+    return {
+        'version': version,
+        'model_name': config['MODEL_NAME'],
+        'encoder_backend': config['ENCODER_BACKEND'],
+        'index_spec': config['INDEX_SPEC'],
+        'index': ann_index.describe(index),
+        'dims': index.d,
+        'row_count': int(index.ntotal),
+        'max_upload': max_upload.isoformat() if max_upload else None,
+        'updated_at': timezone.now().isoformat(),
+    }
+
+
+def save_index(index, index_path):
+    """
+    寫成新版本的索引檔，寫完 metadata 後才更新 manifest，
+    正在使用舊版本的行程不受影響；呼叫端需持有寫入鎖
+    """
+    import faiss  # type: ignore
+    version = index_versions.next_version(index_path)
+    path = index_versions.version_path(index_path, version)
+    tmp_path = path + '.tmp'
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+    metadata = build_metadata(index, version)
+    _write_json(metadata_path(path), metadata)
+    index_versions.write_manifest(index_path, version, updated_at=metadata['updated_at'])
+    index_versions.prune_versions(index_path, get_search_settings()['INDEX_KEEP_VERSIONS'])
+    return metadata
+
+
+def lock_path(index_path):
+    return index_path + '.lock'
+
+
+def _lock_is_stale(path):
+    """超過時限沒有更新，或持有鎖的行程已經不在（同一台機器）"""
+    try:
+        if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+            return True
+        with open(path, encoding='utf-8') as f:
+            pid = int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return False
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def touch_lock(index_path):
+    """長時間持有鎖時定期更新 mtime，避免被其他行程當成殘留"""
+    try:
+        os.utime(lock_path(index_path))
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def index_write_lock(index_path):
+    path = lock_path(index_path)
+    if os.path.exists(path) and _lock_is_stale(path):
+        os.remove(path)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise IndexLocked(f"索引正在寫入中：{path}")
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+def encode_texts(texts):
+    embeddings = registry.get_encoder().encode(
+        texts,
+        batch_size=ENCODE_BATCH_SIZE,
+        show_progress_bar=False,
+        normalize_embeddings=False
+    )
+    return np.asarray(embeddings, dtype='float32')
+
+
+def embed_rows(rows, store=None):
+    """
+    rows 為 (travel_id, travel_txt, travel_name)。文字沒有變動的景點直接從
+    embedding store 取出向量，只編碼缺少的，並把新向量存回 store
+    """
+    store = store or EmbeddingStore()
+    keys = [(travel_id, text_hash(document_text(txt, name))) for travel_id, txt, name in rows]
+    found = store.lookup(keys)
+    missing = [position for position in range(len(rows)) if position not in found]
+    if missing:
+        encoded = encode_texts([document_text(rows[i][1], rows[i][2]) for i in missing])
+        store.add([keys[i] for i in missing], encoded)
+        found.update(zip(missing, encoded))
+    return np.vstack([found[i] for i in range(len(rows))]).astype('float32')
+
+
+def flush_pending(limit=1000):
+    """處理佇列中的異動，回傳新增/修改與刪除的筆數"""
+    index_path = get_search_settings()['INDEX_PATH']
+    tasks = list(TravelIndexTask.objects.order_by('id').values('id', 'travel_id', 'action')[:limit])
+    if not tasks:
+        return {'upserted': 0, 'deleted': 0, 'rebuilt': False, 'travel_ids': []}
+
+    # 同一個景點只看最後一次異動
+    latest = {}
+    for task in tasks:
+        latest[task['travel_id']] = task['action']
+
+    with index_write_lock(index_path):
+        index = load_index(index_path)
+
+        # 還沒有索引，或索引類型不支援刪除（HNSW）時只能整份重建
+        if index is None or not ann_index.supports_remove(index):
+            metadata = _rebuild_locked(index_path)
+            rebuilt = True
+        else:
+            upsert_ids = [travel_id for travel_id, action in latest.items() if action == TravelIndexTask.ACTION_UPSERT]
+            rows = list(Travel.objects.filter(travel_id__in=upsert_ids).values_list('travel_id', 'travel_txt', 'travel_name'))
+
+            # 修改與刪除都先移除舊向量，再加回仍存在的景點
+            index.remove_ids(np.array(list(latest), dtype='int64'))
+            if rows:
+                embeddings = embed_rows(rows)
+                index.add_with_ids(embeddings, np.array([row[0] for row in rows], dtype='int64'))
+            metadata = save_index(index, index_path)
+            rebuilt = False
+
+    if rebuilt:
+        # 重建已涵蓋目前所有異動
+        TravelIndexTask.objects.filter(id__lte=tasks[-1]['id']).delete()
+        result = {'upserted': metadata['row_count'] if metadata else 0, 'deleted': 0, 'rebuilt': True, 'travel_ids': list(latest)}
+    else:
+        TravelIndexTask.objects.filter(id__in=[task['id'] for task in tasks]).delete()
+        result = {'upserted': len(rows), 'deleted': len(latest) - len(rows), 'rebuilt': False, 'travel_ids': list(latest)}
+    registry.reload_index()
+
+    logger.info('索引增量更新完成：%s', result)
+    return result
+
+
+def iter_travel_chunks(chunk_size, start_after=0):
+    """依 travel_id 分批讀取（keyset），每批是一個小查詢，不會一次載入整張表"""
+    last_id = start_after
+    while True:
+        rows = list(
+            Travel.objects.filter(travel_id__gt=last_id)
+            .order_by('travel_id')
+            .values_list('travel_id', 'travel_txt', 'travel_name')[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _rebuild_locked(index_path, chunk_size=1000):
+    """
+    依 INDEX_SPEC 建立全新的索引。需要訓練的索引（IVF / PQ）會先累積
+    足夠的向量做訓練，再把累積的向量與之後的批次加入
+    """
+    spec = get_search_settings()['INDEX_SPEC']
+    total = Travel.objects.count()
+    store = EmbeddingStore()
+    index = None
+    pending_ids, pending_vectors = [], []
+    pending_count = 0
+    need = 0
+
+    for rows in iter_travel_chunks(chunk_size):
+        embeddings = embed_rows(rows, store)
+        ids = np.array([row[0] for row in rows], dtype='int64')
+        if index is None:
+            index = ann_index.new_index(embeddings.shape[1], spec, total)
+            need = ann_index.training_size(index)
+
+        if index.is_trained:
+            index.add_with_ids(embeddings, ids)
+            continue
+
+        pending_ids.append(ids)
+        pending_vectors.append(embeddings)
+        pending_count += len(ids)
+        if pending_count >= need:
+            _train_and_add(index, pending_ids, pending_vectors)
+            pending_ids, pending_vectors = [], []
+
+    if index is None:
+        return None
+    if pending_ids:
+        _train_and_add(index, pending_ids, pending_vectors)
+    return save_index(index, index_path)
+
+
+def _train_and_add(index, pending_ids, pending_vectors):
+    vectors = np.vstack(pending_vectors)
+    ann_index.train(index, vectors)
+    index.add_with_ids(vectors, np.concatenate(pending_ids))
+
+
+def rebuild_full(chunk_size=1000):
+    """重新編碼所有景點並建立全新的索引（不會重複加入既有向量）"""
+    index_path = get_search_settings()['INDEX_PATH']
+    # 重建前已在佇列中的異動都會被這次重建涵蓋
+    last_task = TravelIndexTask.objects.order_by('-id').values_list('id', flat=True).first()
+
+    with index_write_lock(index_path):
+        metadata = _rebuild_locked(index_path, chunk_size)
+
+    if metadata is not None and last_task is not None:
+        TravelIndexTask.objects.filter(id__lte=last_task).delete()
+    registry.reload_index()
+    return metadata
+
+
+def index_staleness():
+    """比較索引 metadata 與資料庫現況"""
+    metadata = read_metadata()
+    max_upload = Travel.objects.aggregate(value=Max('upload'))['value']
+    travel_count = Travel.objects.count()
+    pending = TravelIndexTask.objects.count()
+    max_upload = max_upload.isoformat() if max_upload else None
+    stale = (
+        metadata is None
+        or pending > 0
+        or metadata['row_count'] != travel_count
+        or metadata['max_upload'] != max_upload
+        or metadata['model_name'] != get_search_settings()['MODEL_NAME']
+        or metadata.get('encoder_backend', 'torch') != get_search_settings()['ENCODER_BACKEND']
+        or metadata.get('index_spec') != get_search_settings()['INDEX_SPEC']
+    )
+    return {
+        'stale': stale,
+        'metadata': metadata,
+        'travel_count': travel_count,
+        'max_upload': max_upload,
+        'pending_tasks': pending,
+    }
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from travel_app.cache_version import bump_version
+from travel_app.gazetteer import backfill_region_codes, gazetteer_registry
+
+
+class Command(BaseCommand):
+    help = '依縣市 / 鄉鎮市區對照表填入既有景點的 region_code / town_code，並把縣市統一寫成「臺」'
+
+    def handle(self, *args, **options):
+        gazetteer_registry.reset()
+        updated, unmatched = backfill_region_codes()
+        # update() 不會觸發 signals，手動讓景點相關快取失效
+        bump_version('travel')
+
+        for region, town in unmatched:
+            self.stdout.write(self.style.WARNING(f'對照表中沒有：{region} {town}'))
+        self.stdout.write(self.style.SUCCESS(f'已更新 {updated} 筆景點，{len(unmatched)} 組縣市 / 鄉鎮市區無法對應'))
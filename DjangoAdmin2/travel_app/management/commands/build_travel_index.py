@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from travel_app.index_build import IndexBuild
+from travel_app.indexer import IndexLocked
+from travel_app.neighbors import refresh_all
+
+
+class Command(BaseCommand):
+    help = '分批、平行編碼所有景點並建立向量索引；中斷後再執行會從上次的進度繼續'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='編碼用的子行程數（1 表示在本行程編碼）')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批讀取與編碼的景點數')
+        parser.add_argument('--restart', action='store_true', help='捨棄先前的進度，從頭開始')
+        parser.add_argument('--no-skip-unchanged', action='store_true', help='即使文字沒有變動也重新編碼')
+
+    def handle(self, *args, **options):
+        build = IndexBuild(
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            skip_unchanged=not options['no_skip_unchanged'],
+            log=self.stdout.write,
+        )
+        try:
+            stats = build.run(restart=options['restart'])
+        except IndexLocked as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+
+        if stats is None:
+            self.stdout.write(self.style.WARNING('沒有任何景點資料，未建立索引'))
+            return
+        stats['neighbors'] = refresh_all()
+        self.stdout.write(json.dumps(stats, ensure_ascii=False, indent=2))
+        self.stdout.write(self.style.SUCCESS(
+            f"索引建立完成，共 {stats['rows']} 筆，{stats['rows_per_sec']:.1f} 筆/秒"
+        ))
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from travel_app.embedding_store import EmbeddingStore, list_models
+from travel_app.indexer import document_text, iter_travel_chunks, text_hash
+
+
+class Command(BaseCommand):
+    help = '查看或整理已編碼的景點向量（embedding store）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', help='模型名稱（預設為 TRAVEL_SEARCH 的 MODEL_NAME）')
+        parser.add_argument('--all', action='store_true', help='列出所有模型的統計')
+        parser.add_argument('--compact', action='store_true', help='合併分片，只保留目前景點文字的向量')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            stats = [EmbeddingStore(name).stats() for name in list_models()]
+            self.stdout.write(json.dumps(stats, ensure_ascii=False, indent=2))
+            return
+
+        store = EmbeddingStore(options['model'])
+        if options['compact']:
+            live_keys = set()
+            for rows in iter_travel_chunks(1000):
+                live_keys.update((travel_id, text_hash(document_text(txt, name))) for travel_id, txt, name in rows)
+            kept = store.compact(live_keys)
+            self.stdout.write(self.style.SUCCESS(f'整理完成，保留 {kept} 筆'))
+        self.stdout.write(json.dumps(store.stats(), ensure_ascii=False, indent=2))
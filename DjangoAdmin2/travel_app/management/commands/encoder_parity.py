@@ -0,0 +1,58 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from travel_app.benchmark import DEFAULT_FIXTURE, encoder_parity, load_fixture
+from travel_app.encoders import BACKENDS, load_encoder
+from travel_app.search_registry import get_search_settings
+
+
+class Command(BaseCommand):
+    help = '比較 encoder 後端與 PyTorch 的向量 cosine、top-k 重疊率、延遲與記憶體'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=BACKENDS, help='受測的後端（預設為 ENCODER_BACKEND）')
+        parser.add_argument('--reference', choices=BACKENDS, default='torch')
+        parser.add_argument('--fixture', default=DEFAULT_FIXTURE, help='景點子集的 JSON 檔（search_benchmark --export 產生）')
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--queries', type=int, default=200, help='查詢句子數量上限')
+        parser.add_argument('--min-cosine', type=float, default=0.99, help='平均 cosine 低於此值時失敗')
+        parser.add_argument('--min-overlap', type=float, default=0.9, help='top-k 重疊率低於此值時失敗')
+        parser.add_argument('--output', help='結果 JSON 的輸出路徑')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['fixture']):
+            raise CommandError(f"找不到 fixture：{options['fixture']}，請先執行 search_benchmark --export")
+
+        config = get_search_settings()
+        backend = options['backend'] or config['ENCODER_BACKEND']
+
+        def loader(name):
+            return lambda: load_encoder(
+                config['MODEL_NAME'], backend=name,
+                path=config['ENCODER_PATH'], quantization=config['ENCODER_QUANTIZATION'],
+            )
+
+        report = encoder_parity(
+            loader(options['reference']), loader(backend), load_fixture(options['fixture']),
+            k=options['k'], query_limit=options['queries'],
+        )
+        report['reference']['backend'] = options['reference']
+        report['candidate']['backend'] = backend
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+        parity = report['parity']
+        overlap = parity[f"overlap@{options['k']}"]
+        if parity['cosine_mean'] < options['min_cosine'] or overlap < options['min_overlap']:
+            raise CommandError(
+                f"{backend} 與 {options['reference']} 差異過大：cosine {parity['cosine_mean']:.4f}，overlap {overlap:.3f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{backend} 與 {options['reference']} 一致：cosine {parity['cosine_mean']:.4f}，overlap {overlap:.3f}"
+        ))
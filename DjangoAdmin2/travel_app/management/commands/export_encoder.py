@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from travel_app.encoders import export_onnx
+from travel_app.search_registry import get_search_settings
+
+
+class Command(BaseCommand):
+    help = '把語意搜尋的 encoder 匯出成 ONNX（float32 與動態 int8），供 ENCODER_BACKEND=onnx / onnx-int8 使用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='輸出目錄（預設為 ENCODER_PATH）')
+        parser.add_argument('--quantization', help='量化設定：avx2 / avx512 / avx512_vnni / arm64（預設為 ENCODER_QUANTIZATION）')
+
+    def handle(self, *args, **options):
+        config = get_search_settings()
+        path = options['path'] or config['ENCODER_PATH']
+        quantization = options['quantization'] or config['ENCODER_QUANTIZATION']
+        files = export_onnx(config['MODEL_NAME'], path, quantization)
+        for file_path in files:
+            self.stdout.write(file_path)
+        self.stdout.write(self.style.SUCCESS(f'匯出完成：{path}，請再用 encoder_parity 確認與 PyTorch 的差異'))
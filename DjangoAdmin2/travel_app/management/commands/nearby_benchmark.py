@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from travel_app.benchmark import measure_nearby
+
+
+class Command(BaseCommand):
+    help = '附近景點基準測試：比較記憶體內空間索引與直接以 ORM 讀取座標計算距離的延遲'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='查詢點數量')
+        parser.add_argument('--radius', type=float, default=3.0, help='搜尋半徑（公里）')
+        parser.add_argument('--output', help='結果 JSON 的輸出路徑')
+
+    def handle(self, *args, **options):
+        report = measure_nearby(options['queries'], options['radius'])
+        if report is None:
+            self.stdout.write(self.style.WARNING('沒有任何具有座標的景點'))
+            return
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text)
+        self.stdout.write(text)
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from travel_app.analytics import prune_logs, summarize, write_summary
+
+
+class Command(BaseCommand):
+    help = '彙整查詢紀錄：熱門查詢、分數偏低的查詢與預熱清單（summary.json），並刪除過期的紀錄；建議排程執行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='分析最近幾天的紀錄（預設為 ANALYTICS_WINDOW_DAYS）')
+        parser.add_argument('--top', type=int, help='列出幾筆熱門查詢（預設為 ANALYTICS_TOP_K）')
+        parser.add_argument('--no-prune', action='store_true', help='不刪除超過保存期限的紀錄')
+
+    def handle(self, *args, **options):
+        summary = summarize(days=options['days'], top_k=options['top'])
+        write_summary(summary)
+        if not options['no_prune']:
+            removed = prune_logs()
+            if removed:
+                self.stdout.write(f'已刪除過期紀錄：{", ".join(removed)}')
+
+        report = {key: value for key, value in summary.items() if key not in ('top_queries', 'low_score_queries', 'top_requests')}
+        report['top_queries'] = summary['top_queries'][:10]
+        report['low_score_queries'] = summary['low_score_queries'][:10]
+        report['prewarm_requests'] = len(summary['top_requests'])
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"彙整完成，共 {summary['total_queries']} 筆查詢"))
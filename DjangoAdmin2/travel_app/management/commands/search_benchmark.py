@@ -0,0 +1,48 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from travel_app.benchmark import DEFAULT_FIXTURE, SearchBenchmark, export_fixture, load_fixture
+
+
+class Command(BaseCommand):
+    help = '語意搜尋基準測試：recall@k、延遲分位數、編碼/檢索時間與各併發數下的 QPS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixture', default=DEFAULT_FIXTURE, help='景點子集的 JSON 檔')
+        parser.add_argument('--export', type=int, metavar='N', help='從資料庫匯出 N 筆景點到 fixture 後結束')
+        parser.add_argument('--output', default='search_benchmark.json', help='結果 JSON 的輸出路徑')
+        parser.add_argument('--spec', help='受測的索引類型，預設為 INDEX_SPEC')
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--nprobe', type=int)
+        parser.add_argument('--ef-search', type=int)
+        parser.add_argument('--queries', type=int, default=200, help='查詢句子數量上限')
+        parser.add_argument('--concurrency', default='1,8,32', help='以逗號分隔的併發數')
+        parser.add_argument('--rerank', type=int, metavar='N', help='另外量測以 cross-encoder 重新排序前 N 筆候選的品質與延遲')
+
+    def handle(self, *args, **options):
+        if options['export']:
+            count = export_fixture(options['fixture'], options['export'])
+            self.stdout.write(self.style.SUCCESS(f"已匯出 {count} 筆景點到 {options['fixture']}"))
+            return
+
+        if not os.path.exists(options['fixture']):
+            raise CommandError(f"找不到 fixture：{options['fixture']}，請先執行 --export")
+
+        benchmark = SearchBenchmark(
+            load_fixture(options['fixture']),
+            spec=options['spec'],
+            k=options['k'],
+            nprobe=options['nprobe'],
+            ef_search=options['ef_search'],
+        )
+        levels = [int(level) for level in options['concurrency'].split(',') if level]
+        result = benchmark.run(
+            query_limit=options['queries'], concurrency_levels=levels, rerank_candidates=options['rerank']
+        )
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"結果已寫入 {options['output']}"))
@@ -0,0 +1,72 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from travel_app.analytics import start_prewarmer
+from travel_app.search_registry import get_search_settings, registry
+from travel_app.search_rpc import make_server
+from travel_app.search_service import handle_request
+
+
+def _set_thread_budget(threads):
+    """限制 PyTorch 與 FAISS 使用的執行緒數，避免跟同一台機器上的 Django worker 搶 CPU"""
+    try:
+        import torch  # type: ignore
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    try:
+        import faiss  # type: ignore
+        faiss.omp_set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _stop(signum, frame):
+    # 收到 SIGTERM 時跟 Ctrl+C 一樣結束 serve_forever
+    raise KeyboardInterrupt
+
+
+def _handle(message):
+    # 跟一般請求一樣，處理前後整理資料庫連線（篩選條件會查詢資料庫）
+    close_old_connections()
+    try:
+        return handle_request(message)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = '啟動語意搜尋服務：在獨立行程中持有模型與 FAISS 索引，Django worker 透過 SERVER_ADDRESS 連線'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', help='監聽位址，例如 unix:/tmp/travel-search.sock 或 127.0.0.1:8765（預設為 SERVER_ADDRESS）')
+        parser.add_argument('--threads', type=int, default=4, help='encoder / FAISS 可使用的執行緒數')
+        parser.add_argument('--no-warm-up', action='store_true', help='不預先載入模型與索引')
+
+    def handle(self, *args, **options):
+        address = options['address'] or get_search_settings()['SERVER_ADDRESS']
+        if not address:
+            self.stdout.write(self.style.ERROR('請用 --address 或 TRAVEL_SEARCH["SERVER_ADDRESS"] 指定監聽位址'))
+            return
+
+        _set_thread_budget(options['threads'])
+        if not options['no_warm_up']:
+            data = registry.warm_up()
+            for name in ('index', 'encoder'):
+                self.stdout.write(f"{name}: {data[name]['state']}")
+
+        # 依查詢紀錄的彙整定期重新執行熱門查詢，讓這個行程的快取保持溫熱
+        if get_search_settings()['PREWARM_TOP_N']:
+            start_prewarmer()
+
+        server = make_server(address, _handle)
+        signal.signal(signal.SIGTERM, _stop)
+        self.stdout.write(self.style.SUCCESS(f'搜尋服務已啟動：{address}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,41 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from travel_app.dedup import backfill_hashes, find_duplicates, load_records
+from travel_app.models import Travel
+
+
+class Command(BaseCommand):
+    help = '以 MinHash / LSH 找出可能重複的景點群組（名稱與地址相近，或正規化後名稱 / 電話 / 地址相同）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.6, help='估計的 Jaccard 相似度下限')
+        parser.add_argument('--backfill', action='store_true', help='先重新計算所有景點的雜湊欄位')
+        parser.add_argument('--limit', type=int, default=50, help='最多列出幾個群組')
+        parser.add_argument('--output', help='完整結果 JSON 的輸出路徑')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            updated = backfill_hashes()
+            self.stdout.write(f'已更新 {updated} 筆景點的雜湊欄位')
+
+        start = time.perf_counter()
+        records = load_records()
+        clusters = find_duplicates(records, threshold=options['threshold'])
+        elapsed = time.perf_counter() - start
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(clusters, f, ensure_ascii=False, indent=2)
+
+        names = dict(Travel.objects.filter(
+            travel_id__in={travel_id for cluster in clusters[:options['limit']] for travel_id in cluster['travel_ids']}
+        ).values_list('travel_id', 'travel_name'))
+        for cluster in clusters[:options['limit']]:
+            members = '、'.join(f'{travel_id} {names.get(travel_id, "")}' for travel_id in cluster['travel_ids'])
+            self.stdout.write(f"[{','.join(cluster['reasons'])} {cluster['similarity']:.2f}] {members}")
+        self.stdout.write(self.style.SUCCESS(
+            f'共 {len(records)} 筆景點，找到 {len(clusters)} 個可能重複的群組，耗時 {elapsed:.2f} 秒'
+        ))
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from travel_app.indexer import IndexLocked, flush_pending, index_staleness, rebuild_full
+from travel_app.neighbors import refresh_all, refresh_changed
+
+
+class Command(BaseCommand):
+    help = '把景點異動同步到向量索引（預設只處理佇列中的異動）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='重新編碼所有景點並重建索引')
+        parser.add_argument('--status', action='store_true', help='只顯示索引是否過期')
+        parser.add_argument('--limit', type=int, default=1000, help='每批處理的異動筆數')
+        parser.add_argument('--neighbors', action='store_true', help='只整份重算相似景點')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.stdout.write(json.dumps(index_staleness(), ensure_ascii=False, indent=2))
+            return
+
+        if options['neighbors']:
+            self.stdout.write(self.style.SUCCESS(f'相似景點重算完成，共 {refresh_all()} 筆'))
+            return
+
+        try:
+            if options['full']:
+                metadata = rebuild_full()
+                if metadata is None:
+                    self.stdout.write(self.style.WARNING('沒有任何景點資料，未建立索引'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"索引重建完成，共 {metadata['row_count']} 筆"))
+                    refresh_all()
+                return
+
+            total = {'upserted': 0, 'deleted': 0}
+            changed_ids = set()
+            while True:
+                result = flush_pending(limit=options['limit'])
+                if result['rebuilt']:
+                    self.stdout.write(self.style.WARNING(f"索引類型需要整份重建，共 {result['upserted']} 筆"))
+                    refresh_all()
+                    return
+                if not result['upserted'] and not result['deleted']:
+                    break
+                total['upserted'] += result['upserted']
+                total['deleted'] += result['deleted']
+                changed_ids.update(result['travel_ids'])
+        except IndexLocked as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+
+        refreshed = refresh_changed(changed_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"新增/修改 {total['upserted']} 筆，刪除 {total['deleted']} 筆，重算相似景點 {refreshed} 筆"
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from travel_app.search_registry import registry
+
+
+class Command(BaseCommand):
+    help = '預先載入語意搜尋的模型與 FAISS 索引，並顯示各項載入時間'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        data = registry.warm_up()
+        total = time.perf_counter() - start
+
+        for name in ('index', 'encoder'):
+            item = data[name]
+            if item['state'] == 'ready':
+                self.stdout.write(self.style.SUCCESS(f"{name}: 已載入，耗時 {item['load_seconds']:.2f} 秒"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{name}: {item['state']} ({item['error']})"))
+
+        if data['index']['ntotal'] is not None:
+            self.stdout.write(f"索引向量數：{data['index']['ntotal']}")
+        self.stdout.write(f"總耗時：{total:.2f} 秒")
@@ -0,0 +1,185 @@
+"""
+地圖標記的伺服器端聚合
+
+以 Web Mercator 圖磚為單位：縮放層級 z 的每張圖磚切成 CELLS_PER_TILE x CELLS_PER_TILE 格，
+同一格的景點聚合成一個群集（數量、中心點、最靠近中心的幾個代表景點）。
+格子與圖磚對齊，z 層的一格剛好是 z+1 層的 2x2 格，所以各層可以一次預先算好，
+依圖磚排序後，每張圖磚的群集是連續的一段。縮放到 POINTS_ZOOM 以上才回傳個別景點。
+
+座標以 1e5 的整數表示（約 1 公尺），群集與景點都是陣列而不是物件，減少傳輸量。
+預先計算的層級與每張圖磚的結果都以空間索引的 revision 當作鍵值，景點異動後自然失效。
+"""
+import math
+import threading
+
+import numpy as np
+
+from .conf import get_travel_settings
+from .search_cache import LRUCache
+from .spatial import CLASS_COLUMNS, spatial_registry
+
+CELLS_PER_TILE = 4
+
+# 每個群集附上幾個代表景點
+REPRESENTATIVES = 3
+
+# 座標整數化的倍數
+COORD_SCALE = 100000
+
+MAX_LAT = 85.05112878
+
+
+def mercator(lats, lngs):
+    """經緯度 -> Web Mercator 的 (x, y)，範圍 [0, 1)"""
+    lats = np.clip(np.asarray(lats, dtype='float64'), -MAX_LAT, MAX_LAT)
+    x = (np.asarray(lngs, dtype='float64') + 180) / 360
+    y = (1 - np.log(np.tan(np.radians(lats)) + 1 / np.cos(np.radians(lats))) / math.pi) / 2
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+def tile_range(zoom, west, south, east, north):
+    """涵蓋 bbox 的圖磚範圍 (x0, y0, x1, y1)，含端點"""
+    (x0, x1), (y1, y0) = mercator([south, north], [west, east])
+    n = 1 << zoom
+    return int(x0 * n), int(y0 * n), int(x1 * n), int(y1 * n)
+
+
+class Level:
+    """單一縮放層級的群集，依 (圖磚, 格子) 排序"""
+
+    def __init__(self, tiles, counts, lats, lngs, representatives):
+        self.tiles = tiles
+        self.counts = counts
+        self.lats = lats
+        self.lngs = lngs
+        self.representatives = representatives
+
+    def tile(self, tile_id):
+        start, end = np.searchsorted(self.tiles, [tile_id, tile_id + 1])
+        return slice(int(start), int(end))
+
+
+def aggregate(zoom, xs, ys, ids, lats, lngs):
+    """把景點聚合到 zoom 層的格子"""
+    n = 1 << zoom
+    scale = n * CELLS_PER_TILE
+    cx = np.minimum((xs * scale).astype('int64'), scale - 1)
+    cy = np.minimum((ys * scale).astype('int64'), scale - 1)
+    tiles = (cy // CELLS_PER_TILE) * n + cx // CELLS_PER_TILE
+    keys = tiles * CELLS_PER_TILE * CELLS_PER_TILE + (cy % CELLS_PER_TILE) * CELLS_PER_TILE + cx % CELLS_PER_TILE
+    cells, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    center_lats = np.bincount(inverse, lats) / counts
+    center_lngs = np.bincount(inverse, lngs) / counts
+
+    # 每格依與中心點的距離排序，取前 REPRESENTATIVES 個當代表
+    distance = (lats - center_lats[inverse]) ** 2 + (lngs - center_lngs[inverse]) ** 2
+    order = np.lexsort((ids, distance, inverse))
+    group_start = np.searchsorted(inverse[order], np.arange(len(cells)))
+    rank = np.arange(len(order)) - group_start[inverse[order]]
+    chosen = rank < REPRESENTATIVES
+    representatives = np.full((len(cells), REPRESENTATIVES), -1, dtype='int64')
+    representatives[inverse[order][chosen], rank[chosen]] = ids[order][chosen]
+
+    return Level(cells // (CELLS_PER_TILE * CELLS_PER_TILE), counts, center_lats, center_lngs, representatives)
+
+
+class ClusterIndex:
+    """由空間索引預先算好 0 ~ POINTS_ZOOM - 1 層的群集"""
+
+    def __init__(self, index, points_zoom):
+        self.revision = index.revision
+        self.points_zoom = points_zoom
+        self.ids, self.lats, self.lngs, self.classes = index.arrays()
+        self.xs, self.ys = mercator(self.lats, self.lngs)
+        self.levels = [
+            aggregate(zoom, self.xs, self.ys, self.ids, self.lats, self.lngs) for zoom in range(points_zoom)
+        ]
+
+    def _in_tile(self, zoom, tx, ty, mask=None):
+        n = 1 << zoom
+        selected = (
+            (np.minimum((self.xs * n).astype('int64'), n - 1) == tx)
+            & (np.minimum((self.ys * n).astype('int64'), n - 1) == ty)
+        )
+        return selected if mask is None else selected & mask
+
+    def tile(self, zoom, tx, ty, class_ids=None):
+        """
+        一張圖磚的內容：{'clusters': [[lat, lng, 數量, [代表景點]]], 'points': [[travel_id, lat, lng, class1]]}；
+        只有一個景點的格子直接當作景點回傳
+        """
+        mask = np.isin(self.classes, class_ids).any(axis=1) if class_ids else None
+        if zoom >= self.points_zoom:
+            selected = np.flatnonzero(self._in_tile(zoom, tx, ty, mask))
+            return {'clusters': [], 'points': self._points(selected)}
+
+        if mask is None:
+            level = self.levels[zoom]
+            part = level.tile(ty * (1 << zoom) + tx)
+            counts, lats, lngs, representatives = (
+                level.counts[part], level.lats[part], level.lngs[part], level.representatives[part]
+            )
+        else:
+            # 有類別篩選時只聚合這張圖磚內符合的景點
+            selected = self._in_tile(zoom, tx, ty, mask)
+            if not selected.any():
+                return {'clusters': [], 'points': []}
+            level = aggregate(zoom, self.xs[selected], self.ys[selected], self.ids[selected],
+                              self.lats[selected], self.lngs[selected])
+            counts, lats, lngs, representatives = level.counts, level.lats, level.lngs, level.representatives
+
+        single = counts == 1
+        clusters = [
+            [int(round(lat * COORD_SCALE)), int(round(lng * COORD_SCALE)), int(count), [int(i) for i in reps if i >= 0]]
+            for lat, lng, count, reps in zip(lats[~single], lngs[~single], counts[~single], representatives[~single])
+        ]
+        single_ids = representatives[single, 0]
+        positions = np.flatnonzero(np.isin(self.ids, single_ids))
+        return {'clusters': clusters, 'points': self._points(positions)}
+
+    def _points(self, positions):
+        return [
+            [int(travel_id), int(round(lat * COORD_SCALE)), int(round(lng * COORD_SCALE)), int(classes[0])]
+            for travel_id, lat, lng, classes in zip(
+                self.ids[positions], self.lats[positions], self.lngs[positions],
+                self.classes[positions].reshape(-1, CLASS_COLUMNS),
+            )
+        ]
+
+
+class ClusterRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = None
+        config = get_travel_settings()
+        self.tile_cache = LRUCache(config['MAP_TILE_CACHE_SIZE'], config['MAP_TILE_CACHE_TTL'])
+
+    def get_index(self):
+        spatial_index = spatial_registry.get_index()
+        points_zoom = get_travel_settings()['MAP_POINTS_ZOOM']
+        index = self.index
+        if index is None or index.revision != spatial_index.revision or index.points_zoom != points_zoom:
+            with self._lock:
+                index = self.index
+                if index is None or index.revision != spatial_index.revision or index.points_zoom != points_zoom:
+                    index = self.index = ClusterIndex(spatial_index, points_zoom)
+        return index
+
+    def tiles(self, zoom, tiles, class_ids=None):
+        """[(tx, ty)] -> 合併後的 {'clusters', 'points'}；每張圖磚各自快取"""
+        index = self.get_index()
+        class_key = tuple(sorted(class_ids or ()))
+        merged = {'clusters': [], 'points': []}
+        for tx, ty in tiles:
+            key = (index.revision, index.points_zoom, zoom, tx, ty, class_key)
+            content = self.tile_cache.get(key)
+            if content is None:
+                content = index.tile(zoom, tx, ty, list(class_key))
+                self.tile_cache.set(key, content)
+            merged['clusters'].extend(content['clusters'])
+            merged['points'].extend(content['points'])
+        merged['revision'] = index.revision
+        return merged
+
+
+cluster_registry = ClusterRegistry()
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_app', '0003_delete_yourmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravelIndexTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_id', models.IntegerField(db_index=True, verbose_name='景點ID')),
+                ('action', models.CharField(choices=[('upsert', '新增/修改'), ('delete', '刪除')], max_length=10, verbose_name='動作')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+            ],
+            options={
+                'verbose_name': '索引同步任務',
+                'verbose_name_plural': '索引同步任務',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_app', '0004_travelindextask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravelNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_id', models.IntegerField(verbose_name='景點ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='名次')),
+                ('neighbor_id', models.IntegerField(verbose_name='相似景點ID')),
+                ('score', models.FloatField(verbose_name='相似度')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '相似景點',
+                'verbose_name_plural': '相似景點',
+                'ordering': ['travel_id', 'rank'],
+                'indexes': [models.Index(fields=['neighbor_id'], name='travel_neighbor_nid_idx')],
+                'unique_together': {('travel_id', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations, models
+
+
+# travel 為既有的資料表（managed = False），欄位與索引以 SQL 加上；
+# 測試資料庫等沒有 travel 表的環境只更新 migration 狀態
+HASH_COLUMNS = ('name_hash', 'tel_hash', 'address_hash')
+
+
+def has_travel_table(schema_editor):
+    return 'travel' in schema_editor.connection.introspection.table_names()
+
+
+def add_hash_columns(apps, schema_editor):
+    if not has_travel_table(schema_editor):
+        return
+    for column in HASH_COLUMNS:
+        schema_editor.execute(f'ALTER TABLE travel ADD COLUMN {column} varchar(32) NULL')
+        schema_editor.execute(f'CREATE INDEX travel_{column}_idx ON travel ({column})')
+
+
+def drop_hash_columns(apps, schema_editor):
+    if not has_travel_table(schema_editor):
+        return
+    for column in HASH_COLUMNS:
+        schema_editor.execute(schema_editor.sql_delete_index % {
+            'table': schema_editor.quote_name('travel'), 'name': schema_editor.quote_name(f'travel_{column}_idx'),
+        })
+        schema_editor.execute(f'ALTER TABLE travel DROP COLUMN {column}')
+
+
+def backfill_hashes(apps, schema_editor):
+    if not has_travel_table(schema_editor):
+        return
+    from travel_app.dedup import backfill_hashes
+    backfill_hashes(model=apps.get_model('travel_app', 'Travel'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_app', '0005_travelneighbor'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_hash_columns, drop_hash_columns),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='travel',
+                    name=column,
+                    field=models.CharField(blank=True, db_index=True, editable=False, max_length=32, null=True),
+                )
+                for column in HASH_COLUMNS
+            ],
+        ),
+        migrations.RunPython(backfill_hashes, migrations.RunPython.noop),
+    ]
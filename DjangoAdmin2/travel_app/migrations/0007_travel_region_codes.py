@@ -0,0 +1,69 @@
+from django.db import migrations, models
+
+
+# travel 為既有的資料表（managed = False），欄位與索引以 SQL 加上，並依縣市 / 鄉鎮市區對照表填入既有景點的代碼；
+# 測試資料庫等沒有 travel 表的環境只更新 migration 狀態
+def has_tables(schema_editor, *tables):
+    existing = schema_editor.connection.introspection.table_names()
+    return all(table in existing for table in tables)
+
+
+def add_code_columns(apps, schema_editor):
+    if not has_tables(schema_editor, 'travel'):
+        return
+    schema_editor.execute('ALTER TABLE travel ADD COLUMN region_code integer NULL')
+    schema_editor.execute('ALTER TABLE travel ADD COLUMN town_code integer NULL')
+    schema_editor.execute('CREATE INDEX travel_region_town_idx ON travel (region_code, town_code)')
+
+
+def drop_code_columns(apps, schema_editor):
+    if not has_tables(schema_editor, 'travel'):
+        return
+    schema_editor.execute(schema_editor.sql_delete_index % {
+        'table': schema_editor.quote_name('travel'), 'name': schema_editor.quote_name('travel_region_town_idx'),
+    })
+    schema_editor.execute('ALTER TABLE travel DROP COLUMN town_code')
+    schema_editor.execute('ALTER TABLE travel DROP COLUMN region_code')
+
+
+def backfill_region_codes(apps, schema_editor):
+    if not has_tables(schema_editor, 'travel', 'counties', 'taiwen'):
+        return
+    from travel_app.gazetteer import backfill_region_codes
+    backfill_region_codes(
+        apps.get_model('travel_app', 'Travel'),
+        apps.get_model('travel_app', 'Counties'),
+        apps.get_model('travel_app', 'Taiwan'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_app', '0006_travel_hashes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_code_columns, drop_code_columns),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='travel',
+                    name='region_code',
+                    field=models.IntegerField(blank=True, editable=False, null=True),
+                ),
+                migrations.AddField(
+                    model_name='travel',
+                    name='town_code',
+                    field=models.IntegerField(blank=True, editable=False, null=True),
+                ),
+                migrations.AddIndex(
+                    model_name='travel',
+                    index=models.Index(fields=['region_code', 'town_code'], name='travel_region_town_idx'),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_region_codes, migrations.RunPython.noop),
+    ]
@@ -47,10 +47,18 @@ class Travel(models.Model):
     ticketinfo = models.TextField(blank=True, null=True)
     parkinginfo = models.TextField(blank=True, null=True)
     upload = models.DateField(blank=True, null=True)
+    # 正規化後的名稱 / 電話 / 地址雜湊（dedup.travel_hashes），儲存前由 signals 填入，重複檢查用
+    name_hash = models.CharField(max_length=32, blank=True, null=True, db_index=True, editable=False)
+    tel_hash = models.CharField(max_length=32, blank=True, null=True, db_index=True, editable=False)
+    address_hash = models.CharField(max_length=32, blank=True, null=True, db_index=True, editable=False)
+    # 縣市 / 鄉鎮市區的代碼（counties.id / taiwen.taiwen_id），儲存前由 signals 依 region / town 填入，篩選用
+    region_code = models.IntegerField(blank=True, null=True, editable=False)
+    town_code = models.IntegerField(blank=True, null=True, editable=False)
 
     class Meta:
         managed = False
         db_table = 'travel'
+        indexes = [models.Index(fields=['region_code', 'town_code'], name='travel_region_town_idx')]
 
 
 class TravelClass(models.Model):
@@ -60,3 +68,43 @@ class TravelClass(models.Model):
     class Meta:
         managed = False
         db_table = 'travel_class'
+
+
+class TravelIndexTask(models.Model):
+    """待同步到向量索引的景點異動"""
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = (
+        (ACTION_UPSERT, '新增/修改'),
+        (ACTION_DELETE, '刪除'),
+    )
+    travel_id = models.IntegerField(db_index=True, verbose_name='景點ID')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name='動作')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='建立時間')
+
+    class Meta:
+        verbose_name = '索引同步任務'
+        verbose_name_plural = '索引同步任務'
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.action} {self.travel_id}'
+
+
+class TravelNeighbor(models.Model):
+    """預先算好的相似景點（依向量索引），詳細頁只需要一次有索引的查詢"""
+    travel_id = models.IntegerField(verbose_name='景點ID')
+    rank = models.PositiveSmallIntegerField(verbose_name='名次')
+    neighbor_id = models.IntegerField(verbose_name='相似景點ID')
+    score = models.FloatField(verbose_name='相似度')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新時間')
+
+    class Meta:
+        verbose_name = '相似景點'
+        verbose_name_plural = '相似景點'
+        ordering = ['travel_id', 'rank']
+        unique_together = (('travel_id', 'rank'),)
+        indexes = [models.Index(fields=['neighbor_id'], name='travel_neighbor_nid_idx')]
+
+    def __str__(self):
+        return f'{self.travel_id} -> {self.neighbor_id} ({self.rank})'
@@ -0,0 +1,134 @@
+"""
+預先計算的相似景點（TravelNeighbor）
+
+每個景點存前 NEIGHBORS_TOP_N 名相似景點，詳細頁與 similar API 只需要一次依 travel_id 的查詢。
+索引增量更新後只重算受影響的景點：
+    1. 有異動（新增 / 修改 / 刪除）的景點本身
+    2. 相似清單中含有異動景點的景點
+    3. 異動景點的近鄰中，與它的相似度高於自己目前最後一名的景點（新景點可能擠進它們的清單）
+第 3 點只檢查異動景點前 NEIGHBORS_TOP_N * CANDIDATE_FACTOR 名的近鄰，屬於近似；
+refresh_all() 會整份重算，索引整份重建後也會使用。
+"""
+import logging
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import ann_index
+from .indexer import iter_travel_chunks
+from .models import TravelNeighbor
+from .search_registry import get_search_settings, registry
+
+logger = logging.getLogger(__name__)
+
+# 檢查新景點會不會擠進其他景點清單時，往外看幾倍的近鄰
+CANDIDATE_FACTOR = 4
+
+BATCH_SIZE = 256
+
+
+def top_n():
+    return get_search_settings()['NEIGHBORS_TOP_N']
+
+
+def stored_neighbors(travel_id, k):
+    """預先算好的 [(相似度, 景點ID)]；沒有預先計算或 k 超過預存筆數時回傳 None"""
+    if k > top_n():
+        return None
+    rows = list(
+        TravelNeighbor.objects.filter(travel_id=travel_id, rank__lt=k)
+        .order_by('rank')
+        .values_list('score', 'neighbor_id')
+    )
+    return rows or None
+
+
+def compute_neighbors(index, travel_ids, n):
+    """以索引中儲存的向量檢索，回傳 {travel_id: [(相似度, 景點ID), ...]}（不含自己）"""
+    found_ids, vectors = [], []
+    for travel_id in travel_ids:
+        vector = ann_index.reconstruct(index, travel_id)
+        if vector is not None:
+            found_ids.append(travel_id)
+            vectors.append(vector)
+    if not vectors:
+        return {}
+
+    config = get_search_settings()
+    params = ann_index.search_parameters(index, nprobe=config['NPROBE'], ef_search=config['EF_SEARCH'])
+    D, I = index.search(np.vstack(vectors).astype('float32'), n + 1, params=params)
+    result = {}
+    for travel_id, scores, ids in zip(found_ids, D, I):
+        pairs = [(float(score), int(doc_id)) for score, doc_id in zip(scores, ids) if doc_id not in (-1, travel_id)]
+        result[travel_id] = pairs[:n]
+    return result
+
+
+def _save(neighbors):
+    with transaction.atomic():
+        TravelNeighbor.objects.filter(travel_id__in=list(neighbors)).delete()
+        TravelNeighbor.objects.bulk_create([
+            TravelNeighbor(travel_id=travel_id, rank=rank, neighbor_id=neighbor_id, score=score)
+            for travel_id, pairs in neighbors.items()
+            for rank, (score, neighbor_id) in enumerate(pairs)
+        ])
+
+
+def _recompute(index, travel_ids, n):
+    travel_ids = list(travel_ids)
+    for start in range(0, len(travel_ids), BATCH_SIZE):
+        batch = travel_ids[start:start + BATCH_SIZE]
+        neighbors = compute_neighbors(index, batch, n)
+        # 已不在索引中的景點（被刪除）清空
+        neighbors.update({travel_id: [] for travel_id in batch if travel_id not in neighbors})
+        _save(neighbors)
+
+
+def refresh_all():
+    """重算所有景點；回傳處理的景點數"""
+    n = top_n()
+    if n <= 0:
+        return 0
+    index = registry.get_index()
+    started_at = timezone.now()
+    count = 0
+    for rows in iter_travel_chunks(BATCH_SIZE):
+        travel_ids = [row[0] for row in rows]
+        _recompute(index, travel_ids, n)
+        count += len(travel_ids)
+    # 這次沒有更新到的是已刪除的景點
+    TravelNeighbor.objects.filter(updated_at__lt=started_at).delete()
+    logger.info('相似景點整份重算完成：%s 筆', count)
+    return count
+
+
+def refresh_changed(changed_ids):
+    """索引增量更新後，只重算受影響的景點；回傳重算的景點數"""
+    n = top_n()
+    if n <= 0 or not changed_ids:
+        return 0
+    index = registry.get_index()
+    changed_ids = set(changed_ids)
+    affected = set(changed_ids)
+    affected |= set(TravelNeighbor.objects.filter(neighbor_id__in=changed_ids).values_list('travel_id', flat=True))
+
+    # 異動景點的近鄰 t：若 sim(t, 異動景點) 高於 t 目前的最後一名，t 的清單就要更新
+    candidates = {}
+    for pairs in compute_neighbors(index, changed_ids, n * CANDIDATE_FACTOR).values():
+        for score, travel_id in pairs:
+            candidates[travel_id] = max(score, candidates.get(travel_id, score))
+    worst = {
+        row['travel_id']: row
+        for row in TravelNeighbor.objects.filter(travel_id__in=list(candidates))
+        .values('travel_id').annotate(worst=Min('score'), count=Count('id'))
+    }
+    for travel_id, score in candidates.items():
+        row = worst.get(travel_id)
+        if row is None or row['count'] < n or score > row['worst']:
+            affected.add(travel_id)
+
+    _recompute(index, sorted(affected), n)
+    logger.info('相似景點增量更新：異動 %s 筆，重算 %s 筆', len(changed_ids), len(affected))
+    return len(affected)
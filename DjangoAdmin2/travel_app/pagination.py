@@ -0,0 +1,123 @@
+"""
+景點列表的分頁
+
+OFFSET 分頁每換一頁都要 COUNT(*)，還要掃過前面所有的資料列，越後面的頁越慢。這裡改以主鍵做 keyset 分頁：
+- travel_main：KeysetPaginator 以一次只讀主鍵的查詢算出總筆數與每一頁第一筆的主鍵（錨點），
+  存在 Django cache；之後任何一頁都是「主鍵 >= 錨點」的索引查詢，第 150 頁和第 1 頁一樣快
+- API：KeysetCursorPagination（以主鍵為游標的 CursorPagination），每頁筆數有上限
+總筆數與錨點的快取鍵值包含資料版本號（cache_version），景點異動後自然失效。
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .cache_version import get_version
+
+COUNT_CACHE_SECONDS = 600
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+
+def _query_key(prefix, queryset, version_name):
+    """以 SQL 與參數的雜湊當作快取鍵值；查詢必定沒有結果時拋出 EmptyResultSet"""
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha1(repr((sql, params)).encode('utf-8')).hexdigest()
+    return f'travel_app:{prefix}:{version_name}:{get_version(version_name)}:{digest}'
+
+
+def cached_count(queryset, version_name='travel'):
+    """快取的總筆數；version_name 的資料版本改變後重新計算"""
+    queryset = queryset.order_by()
+    try:
+        key = _query_key('count', queryset, version_name)
+    except EmptyResultSet:
+        return 0
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_SECONDS)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """總筆數改用 cached_count，其餘與 Paginator 相同（給仍使用頁碼分頁的 API）"""
+    version_name = 'travel'
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list, self.version_name)
+
+
+class KeysetPaginator(Paginator):
+    """
+    依主鍵遞增排序的分頁，介面與 Paginator 相同（get_page、num_pages、Page 物件），模板不需要修改
+    """
+
+    def __init__(self, object_list, per_page, version_name='travel', **kwargs):
+        self.pk_name = object_list.model._meta.pk.name
+        super().__init__(object_list.order_by(self.pk_name), per_page, **kwargs)
+        self.version_name = version_name
+
+    @cached_property
+    def _anchors(self):
+        """(總筆數, 每一頁第一筆的主鍵)"""
+        try:
+            key = f'{_query_key("pages", self.object_list, self.version_name)}:{self.per_page}'
+        except EmptyResultSet:
+            return 0, []
+        value = cache.get(key)
+        if value is None:
+            ids = list(self.object_list.values_list(self.pk_name, flat=True))
+            value = (len(ids), ids[::self.per_page])
+            cache.set(key, value, COUNT_CACHE_SECONDS)
+        return value
+
+    @cached_property
+    def count(self):
+        return self._anchors[0]
+
+    def page_queryset(self, number):
+        """第 number 頁的查詢（number 須已通過 validate_number）"""
+        queryset = self.object_list
+        if number > 1:
+            queryset = queryset.filter(**{f'{self.pk_name}__gte': self._anchors[1][number - 1]})
+        return queryset[:self.per_page]
+
+    def page(self, number):
+        number = self.validate_number(number)
+        return self._get_page(list(self.page_queryset(number)), number, self)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    以主鍵為游標的分頁：?cursor= 由 next / previous 連結提供，?page_size= 不超過 API_MAX_PAGE_SIZE；
+    回應附上快取的總筆數 count
+    """
+    page_size = API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = API_MAX_PAGE_SIZE
+    ordering = 'pk'
+    version_name = 'travel'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = cached_count(queryset, self.version_name)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response
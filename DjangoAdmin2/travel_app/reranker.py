@@ -0,0 +1,90 @@
+"""
+第二階段：以 cross-encoder 重新排序 FAISS 取回的候選景點
+
+每個請求有時間預算（RERANK_BUDGET_MS），候選依 FAISS 名次分批送進 cross-encoder，
+預算用完時該查詢退回 FAISS 的順序（只排一部分的分數無法跟其他候選比較）。
+已算過的 (查詢, 景點) 分數放在 rerank_cache，鍵值包含景點資料版本，景點修改後自然失效；
+即使這次超過預算，已算好的分數也會留著，下次同樣的查詢就能在預算內完成。
+"""
+import logging
+import time
+
+from .cache_version import get_version
+from .models import Travel
+from .search_cache import normalize_query, rerank_cache
+from .search_registry import SearchUnavailable, get_search_settings, registry
+
+logger = logging.getLogger(__name__)
+
+
+def passage_text(travel_name, travel_txt):
+    return f'{travel_name or ""} {travel_txt or ""}'.strip()
+
+
+def fetch_passages(travel_ids):
+    rows = Travel.objects.filter(travel_id__in=travel_ids).values_list('travel_id', 'travel_name', 'travel_txt')
+    return {travel_id: passage_text(name, txt) for travel_id, name, txt in rows}
+
+
+def rerank(query, similarities, document_ids, k, deadline,
+           get_passages=fetch_passages, get_model=None, cache=rerank_cache, version=None):
+    """
+    回傳 (相似度 list, document id list, 是否已重新排序)；相似度仍是 FAISS 的分數，只有順序改變
+    """
+    fallback = (list(similarities[:k]), list(document_ids[:k]), False)
+    if not document_ids:
+        return [], [], False
+    config = get_search_settings()
+    query = normalize_query(query)
+    version = get_version('travel') if version is None else version
+
+    scores = {}
+    missing = []
+    for doc_id in document_ids:
+        score = cache.get((query, doc_id, version)) if cache is not None else None
+        if score is None:
+            missing.append(doc_id)
+        else:
+            scores[doc_id] = score
+
+    if missing:
+        if time.monotonic() >= deadline:
+            return fallback
+        try:
+            model = (get_model or registry.get_reranker)()
+        except SearchUnavailable as e:
+            logger.warning('reranker 無法使用，維持第一階段順序：%s', e)
+            return fallback
+        passages = get_passages(missing)
+        batch_size = config['RERANK_BATCH_SIZE']
+        for start in range(0, len(missing), batch_size):
+            # 每批開始前檢查預算，最多超出一批的時間
+            if time.monotonic() >= deadline:
+                break
+            batch = missing[start:start + batch_size]
+            predicted = model.predict(
+                [(query, passages.get(doc_id, '')) for doc_id in batch],
+                batch_size=batch_size,
+                show_progress_bar=False,
+            )
+            for doc_id, score in zip(batch, predicted):
+                scores[doc_id] = float(score)
+                if cache is not None:
+                    cache.set((query, doc_id, version), float(score))
+        if len(scores) < len(document_ids):
+            return fallback
+
+    order = sorted(range(len(document_ids)), key=lambda i: -scores[document_ids[i]])[:k]
+    return [similarities[i] for i in order], [document_ids[i] for i in order], True
+
+
+def rerank_results(queries, results, k, budget_ms=None):
+    """同一個請求的所有查詢共用一份時間預算"""
+    config = get_search_settings()
+    budget_ms = config['RERANK_BUDGET_MS'] if budget_ms is None else budget_ms
+    deadline = time.monotonic() + budget_ms / 1000
+    version = get_version('travel')
+    return [
+        rerank(query, similarities, document_ids, k, deadline, version=version)
+        for query, (similarities, document_ids) in zip(queries, results)
+    ]
@@ -0,0 +1,96 @@
+"""
+語意搜尋的行程內快取
+
+第一層：正規化後的查詢文字 -> 向量（省下 encode）
+第二層：(向量雜湊, k, 索引版本) -> 搜尋結果（索引更新後版本改變，舊結果自然失效）
+另有篩選條件 -> 符合的 travel_id 快取、(查詢, 景點) -> cross-encoder 分數快取，鍵值包含景點資料版本
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from .search_registry import get_search_settings
+
+
+class LRUCache:
+    """有容量上限與 TTL 的 LRU 快取，並記錄命中次數"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else None,
+        }
+
+
+def normalize_query(text):
+    """全形轉半形、合併空白，讓只差在格式的查詢共用快取"""
+    text = unicodedata.normalize('NFKC', str(text))
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def embedding_key(vector):
+    return hashlib.sha1(vector.tobytes()).hexdigest()
+
+
+_config = get_search_settings()
+embedding_cache = LRUCache(_config['EMBEDDING_CACHE_SIZE'], _config['EMBEDDING_CACHE_TTL'])
+result_cache = LRUCache(_config['RESULT_CACHE_SIZE'], _config['RESULT_CACHE_TTL'])
+filter_cache = LRUCache(_config['FILTER_CACHE_SIZE'], _config['FILTER_CACHE_TTL'])
+rerank_cache = LRUCache(_config['RERANK_CACHE_SIZE'], _config['RERANK_CACHE_TTL'])
+
+
+def cache_stats():
+    return {
+        'embedding': embedding_cache.stats(),
+        'result': result_cache.stats(),
+        'filter': filter_cache.stats(),
+        'rerank': rerank_cache.stats(),
+    }
@@ -0,0 +1,426 @@
+"""
+語意搜尋的模型 / 索引註冊表
+
+SentenceTransformer 與 FAISS 索引不在 import 時載入，而是在第一次查詢
+（或執行 warm_search 指令）時才載入，並由鎖保證每個行程只載入一次。
+索引檔不存在時不會讓整個 URLconf 失敗，只會讓搜尋回報無法使用。
+索引寫入新版本後，各行程在背景載入新版本再切換參照，舊版本等進行中的查詢結束才釋放，
+重建索引期間搜尋不會中斷，也不需要重新啟動 worker。
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 所有設定的預設值；myproject/settings.py 的 TRAVEL_SEARCH 只需要寫與預設不同的項目
+DEFAULT_SEARCH_SETTINGS = {
+    'MODEL_NAME': 'sentence-transformers/distiluse-base-multilingual-cased-v1',
+    # encoder 後端：'torch'、'torch-int8'（動態量化）、'onnx'、'onnx-int8'
+    # onnx 需要先執行 `manage.py export_encoder`，切換前可用 `manage.py encoder_parity` 確認結果一致
+    'ENCODER_BACKEND': 'torch',
+    'ENCODER_PATH': os.path.join(settings.BASE_DIR, 'travel_app', 'travel_model', 'encoder-onnx'),
+    # ONNX 量化設定：avx2 / avx512 / avx512_vnni / arm64
+    'ENCODER_QUANTIZATION': 'avx2',
+    'INDEX_PATH': os.path.join(settings.BASE_DIR, 'travel_app', 'travel_model', 'vector.index'),
+    # 以唯讀 mmap 載入索引，多個 worker 共用同一份 page cache
+    'INDEX_MMAP': True,
+    # 索引每次寫入都產生 vector.<版本>.index 並更新 vector.index.manifest.json，各 worker 自動切換；保留最近幾個版本
+    'INDEX_KEEP_VERSIONS': 3,
+    # 已編碼的景點向量（依模型分目錄，float16），建索引時只編碼文字有變動的景點
+    'EMBEDDING_STORE_DIR': os.path.join(settings.BASE_DIR, 'travel_app', 'travel_model', 'embeddings'),
+    # 索引類型，例如 'Flat'、'IVF256,Flat'、'HNSW32'、'IVF,PQ16x8'（改了要執行 update_travel_index --full）
+    'INDEX_SPEC': 'Flat',
+    # IVF 查詢的群數 / HNSW 查詢的候選數，請求中可用 nprobe / ef_search 覆寫
+    'NPROBE': 16,
+    'EF_SEARCH': 64,
+    # 查詢向量、搜尋結果與篩選條件（-> 符合的 travel_id）快取（筆數 / 存活秒數）
+    'EMBEDDING_CACHE_SIZE': 2048,
+    'EMBEDDING_CACHE_TTL': 3600,
+    'RESULT_CACHE_SIZE': 4096,
+    'RESULT_CACHE_TTL': 600,
+    'FILTER_CACHE_SIZE': 256,
+    'FILTER_CACHE_TTL': 300,
+    # 合併同時到達的查詢：等待時間窗（毫秒）與每批最多句數（需要多執行緒 worker 才有效果）
+    'BATCHING': True,
+    'BATCH_WINDOW_MS': 5,
+    'BATCH_MAX_SIZE': 64,
+    # 第二階段 cross-encoder 重新排序（請求可用 rerank=true/false 覆寫）
+    # 先以 FAISS 取回 RERANK_CANDIDATES 筆候選，超過 RERANK_BUDGET_MS 毫秒時退回 FAISS 的順序
+    'RERANK_ENABLED': False,
+    'RERANK_MODEL': 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1',
+    'RERANK_CANDIDATES': 30,
+    'RERANK_BUDGET_MS': 150,
+    'RERANK_BATCH_SIZE': 8,
+    'RERANK_CACHE_SIZE': 8192,
+    'RERANK_CACHE_TTL': 3600,
+    # 每個景點預先計算的相似景點數，update_travel_index 時增量更新（0 表示不預先計算，similar API 每次即時檢索）
+    'NEIGHBORS_TOP_N': 10,
+    # 准入控制（每個 worker）：最多同時 2 個搜尋、4 個排隊，其餘執行緒留給登入檢查等一般請求
+    # 排隊已滿回 429、排隊超過 ADMISSION_TIMEOUT_MS 回 503，皆附 Retry-After
+    'ADMISSION_CONCURRENCY': 2,
+    'ADMISSION_QUEUE_SIZE': 4,
+    'ADMISSION_TIMEOUT_MS': 2000,
+    # 每個請求最多幾句查詢
+    'MAX_QUERIES': 32,
+    # 查詢紀錄：每天一個 queries-YYYYMMDD.jsonl，`manage.py search_analytics`（建議排程執行）彙整成 summary.json
+    'QUERY_LOG_ENABLED': True,
+    'QUERY_LOG_DIR': os.path.join(settings.BASE_DIR, 'travel_app', 'travel_model', 'query_log'),
+    'QUERY_LOG_RETENTION_DAYS': 30,
+    'ANALYTICS_WINDOW_DAYS': 7,
+    'ANALYTICS_TOP_K': 50,
+    # 第一名相似度低於這個值視為「幾乎沒有結果」的查詢
+    'ANALYTICS_LOW_SCORE': 0.3,
+    # 依 summary.json 每 PREWARM_INTERVAL 秒重新執行最熱門的 PREWARM_TOP_N 個請求（0 表示不預熱），間隔要小於 RESULT_CACHE_TTL
+    'PREWARM_TOP_N': 100,
+    'PREWARM_INTERVAL': 300,
+    # 設定後由 `manage.py search_server` 的獨立行程持有模型與索引，各 worker 只透過 socket 查詢
+    # 例如 'unix:/tmp/travel-search.sock' 或 '127.0.0.1:8765'；None 表示在各 worker 內查詢
+    'SERVER_ADDRESS': None,
+    # 等待搜尋服務回應的秒數
+    'SERVER_TIMEOUT': 5.0,
+}
+
+# 載入失敗後，間隔多久才重新嘗試（秒）
+RETRY_SECONDS = 30
+
+# 每隔幾秒檢查一次索引檔是否被更新（例如 update_travel_index 寫入新版本）
+RELOAD_CHECK_SECONDS = 5
+
+# 載入狀態
+STATE_UNLOADED = 'unloaded'
+STATE_LOADING = 'loading'
+STATE_READY = 'ready'
+STATE_MISSING = 'missing'
+STATE_ERROR = 'error'
+
+
+def get_search_settings():
+    """合併預設值與 settings.TRAVEL_SEARCH"""
+    config = dict(DEFAULT_SEARCH_SETTINGS)
+    config.update(getattr(settings, 'TRAVEL_SEARCH', {}))
+    return config
+
+
+class SearchUnavailable(Exception):
+    """模型或索引無法使用（例如索引檔不存在）"""
+
+
+class _Component:
+    """單一個延遲載入的資源，記錄狀態、耗時與錯誤訊息"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self.value = None
+        self.state = STATE_UNLOADED
+        self.load_seconds = None
+        self.error = None
+        self._failed_at = None
+
+    def get(self):
+        # 已載入就直接回傳，不需要拿鎖
+        if self.state == STATE_READY:
+            return self.value
+        with self._lock:
+            if self.state != STATE_READY and not self._recently_failed():
+                self._load()
+        if self.state != STATE_READY:
+            raise SearchUnavailable(self.error)
+        return self.value
+
+    def _recently_failed(self):
+        return self._failed_at is not None and time.monotonic() - self._failed_at < RETRY_SECONDS
+
+    def _load(self):
+        self.state = STATE_LOADING
+        start = time.perf_counter()
+        try:
+            self.value = self._loader()
+        except FileNotFoundError as e:
+            self.state = STATE_MISSING
+            self.error = str(e)
+            self._failed_at = time.monotonic()
+            logger.warning('%s 無法載入：%s', self.name, e)
+            return
+        except Exception as e:
+            self.state = STATE_ERROR
+            self.error = str(e)
+            self._failed_at = time.monotonic()
+            logger.exception('%s 載入失敗', self.name)
+            return
+        self.load_seconds = time.perf_counter() - start
+        self.error = None
+        self._failed_at = None
+        self.state = STATE_READY
+        logger.info('%s 載入完成，耗時 %.2f 秒', self.name, self.load_seconds)
+
+    def reset(self):
+        with self._lock:
+            self.state = STATE_UNLOADED
+            self.value = None
+            self.load_seconds = None
+            self.error = None
+            self._failed_at = None
+
+    def status(self):
+        return {
+            'state': self.state,
+            'load_seconds': self.load_seconds,
+            'error': self.error,
+        }
+
+
+def _load_encoder():
+    from .encoders import load_encoder
+    config = get_search_settings()
+    return load_encoder(
+        config['MODEL_NAME'],
+        backend=config['ENCODER_BACKEND'],
+        path=config['ENCODER_PATH'],
+        quantization=config['ENCODER_QUANTIZATION'],
+    )
+
+
+def _load_reranker():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(get_search_settings()['RERANK_MODEL'], device='cpu')
+
+
+class IndexGeneration:
+    """
+    一個已載入的索引版本。查詢期間以 lease 持有（acquire / release），
+    被新版本取代（retire）後，等進行中的查詢都結束才放掉索引
+    """
+
+    def __init__(self, index, number, version, path, signature, mmap, load_seconds):
+        self.index = index
+        # 本行程第幾次載入，搜尋結果快取以此判斷是否失效
+        self.number = number
+        # manifest 的版本號；沒有 manifest 的舊部署為 None
+        self.version = version
+        self.path = path
+        self.signature = signature
+        self.mmap = mmap
+        self.load_seconds = load_seconds
+        self.inflight = 0
+        self.retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """已經釋放的版本回傳 False，呼叫端改取目前的版本"""
+        with self._lock:
+            if self.index is None:
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+            drained = self.retired and self.inflight == 0
+        if drained:
+            self._free()
+
+    def retire(self):
+        with self._lock:
+            self.retired = True
+            drained = self.inflight == 0
+        if drained:
+            self._free()
+
+    def _free(self):
+        # 仍以 get_index() 取得參照的呼叫端不受影響，參照結束後才真正釋放記憶體 / mmap
+        self.index = None
+        logger.info('舊版索引（版本 %s）已無進行中的查詢，已釋放', self.version)
+
+    def status(self):
+        return {'version': self.version, 'path': self.path, 'inflight': self.inflight}
+
+
+def _index_signature(index_path):
+    """(manifest 版本, 檔案修改時間)，任何一個改變就需要載入新版本"""
+    from .index_versions import current_index_path, current_version
+    return current_version(index_path), os.path.getmtime(current_index_path(index_path))
+
+
+class SearchRegistry:
+    """每個行程共用一份的 encoder / index / reranker"""
+
+    def __init__(self):
+        self.encoder = _Component('encoder', _load_encoder)
+        self.reranker = _Component('reranker', _load_reranker)
+        self.index = _Component('index', self._load_index)
+        self._index_number = 0
+        self._checked_at = 0.0
+        # 同時只有一個執行緒載入新版本
+        self._swap_lock = threading.Lock()
+        self._swap_failed_at = None
+        self.swap_count = 0
+        self.swap_error = None
+        # 已被取代、還在等進行中查詢結束的版本
+        self._retired = []
+
+    def _load_index(self):
+        from .ann_index import read_index
+        from .index_versions import current_index_path, current_version
+        config = get_search_settings()
+        index_path = config['INDEX_PATH']
+        path = current_index_path(index_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"索引文件不存在：{path}")
+        signature = (current_version(index_path), os.path.getmtime(path))
+        start = time.perf_counter()
+        index, mmap = read_index(path, mmap=config['INDEX_MMAP'])
+        self._index_number += 1
+        return IndexGeneration(
+            index, self._index_number, signature[0], path, signature, mmap, time.perf_counter() - start
+        )
+
+    @property
+    def index_version(self):
+        generation = self.index.value
+        return generation.number if generation is not None else self._index_number
+
+    def _index_changed(self):
+        generation = self.index.value
+        if generation is None:
+            return False
+        try:
+            return _index_signature(get_search_settings()['INDEX_PATH']) != generation.signature
+        except OSError:
+            # 新版本寫到一半或舊檔已被刪除，下次再檢查
+            return False
+
+    def _reload_if_changed(self):
+        """
+        每隔 RELOAD_CHECK_SECONDS 檢查 manifest；有新版本時在背景執行緒載入，
+        載入期間查詢繼續使用舊版本
+        """
+        now = time.monotonic()
+        if self.index.state != STATE_READY or now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        if self._swap_failed_at is not None and now - self._swap_failed_at < RETRY_SECONDS:
+            return
+        if self._swap_lock.locked() or not self._index_changed():
+            return
+        threading.Thread(target=self._swap, name='index-reload', daemon=True).start()
+
+    def _swap(self):
+        """載入新版本後一次換掉參照；回傳是否已切換"""
+        with self._swap_lock:
+            if self.index.state != STATE_READY or not self._index_changed():
+                return False
+            try:
+                generation = self._load_index()
+            except Exception as e:
+                self.swap_error = str(e)
+                self._swap_failed_at = time.monotonic()
+                logger.exception('新版索引載入失敗，繼續使用目前的版本')
+                return False
+            old = self.index.value
+            # 指定屬性是原子操作，之後的查詢都會拿到新版本
+            self.index.value = generation
+            self.index.load_seconds = generation.load_seconds
+            self.swap_error = None
+            self._swap_failed_at = None
+            self.swap_count += 1
+            self._retired = [g for g in self._retired if g.index is not None] + [old]
+            old.retire()
+            logger.info('索引已切換：版本 %s -> %s，載入耗時 %.2f 秒', old.version, generation.version, generation.load_seconds)
+            return True
+
+    def reload_index(self):
+        """
+        索引寫入新版本後立即切換（不等定期檢查），回傳是否已切換。
+        尚未載入的行程不需要預先載入，下次取用時自然會讀到最新版本
+        """
+        if self.index.state != STATE_READY:
+            self.index.reset()
+            return False
+        return self._swap()
+
+    @contextmanager
+    def index_lease(self):
+        """查詢期間持有目前的索引版本，確保切換時舊版本不會在查詢途中被釋放"""
+        self._reload_if_changed()
+        while True:
+            generation = self.index.get()
+            if generation.acquire():
+                break
+        try:
+            yield generation
+        finally:
+            generation.release()
+
+    def get_encoder(self):
+        return self.encoder.get()
+
+    def get_reranker(self):
+        return self.reranker.get()
+
+    def get_index(self):
+        """直接取得目前的索引；呼叫端持有的參照會讓它留在記憶體中直到用完"""
+        with self.index_lease() as generation:
+            return generation.index
+
+    def warm_up(self):
+        """預先載入 encoder 與索引，回傳載入後的狀態"""
+        components = [self.index, self.encoder]
+        if get_search_settings()['RERANK_ENABLED']:
+            components.append(self.reranker)
+        for component in components:
+            try:
+                component.get()
+            except SearchUnavailable:
+                pass
+        return self.status()
+
+    def is_ready(self):
+        return self.encoder.state == STATE_READY and self.index.state == STATE_READY
+
+    def is_degraded(self):
+        """索引不存在或載入失敗時，搜尋無法提供服務"""
+        return any(c.state in (STATE_MISSING, STATE_ERROR) for c in (self.encoder, self.index))
+
+    def reset(self):
+        self.encoder.reset()
+        self.index.reset()
+        self.reranker.reset()
+        self._retired = []
+
+    def status(self):
+        config = get_search_settings()
+        index_status = self.index.status()
+        generation = self.index.value
+        index_status['path'] = generation.path if generation is not None else config['INDEX_PATH']
+        index_status['ntotal'] = generation.index.ntotal if generation is not None and generation.index is not None else None
+        index_status['version'] = generation.version if generation is not None else None
+        index_status['generation'] = self.index_version
+        index_status['mmap'] = generation.mmap if generation is not None else False
+        index_status['swaps'] = self.swap_count
+        index_status['swap_error'] = self.swap_error
+        index_status['draining'] = [g.status() for g in self._retired if g.index is not None]
+        encoder_status = self.encoder.status()
+        encoder_status['model_name'] = config['MODEL_NAME']
+        encoder_status['backend'] = config['ENCODER_BACKEND']
+        # reranker 是選用的，無法載入時只會退回第一階段順序，不影響 ready / degraded
+        reranker_status = self.reranker.status()
+        reranker_status['model_name'] = config['RERANK_MODEL']
+        reranker_status['enabled'] = config['RERANK_ENABLED']
+        return {
+            'ready': self.is_ready(),
+            'degraded': self.is_degraded(),
+            'encoder': encoder_status,
+            'index': index_status,
+            'reranker': reranker_status,
+        }
+
+
+registry = SearchRegistry()
@@ -0,0 +1,179 @@
+"""
+搜尋服務行程與 Django worker 之間的簡單 RPC
+
+訊息格式：4 bytes 長度（big-endian）+ UTF-8 JSON。一條連線可以連續送多個請求，
+client 每個執行緒保留一條連線重複使用。位址可以是 'unix:/path/to.sock' 或 'host:port'。
+這個模組不 import Django，測試可以直接在子行程中啟動 server。
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+HEADER = struct.Struct('>I')
+
+# 單一訊息的大小上限，避免錯誤的長度讓對方配置過大的記憶體
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+class RPCError(Exception):
+    """連不上、逾時或連線中斷"""
+
+
+class ConnectionClosed(RPCError):
+    """對方已關閉連線"""
+
+
+def parse_address(address):
+    """回傳 ('unix', path) 或 ('tcp', (host, port))"""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    if address.startswith('tcp:'):
+        address = address[len('tcp:'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionClosed('連線已關閉')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, message):
+    body = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def recv_message(sock):
+    (size,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if size > MAX_MESSAGE_BYTES:
+        raise RPCError(f'訊息過大：{size} bytes')
+    return json.loads(_recv_exact(sock, size).decode('utf-8'))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionClosed, ConnectionResetError):
+                return
+            try:
+                response = self.server.handler(message)
+            except Exception as e:
+                response = {'ok': False, 'error': str(e)}
+            send_message(self.request, response)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def server_close(self):
+            super().server_close()
+            try:
+                os.remove(self.server_address)
+            except OSError:
+                pass
+
+
+def make_server(address, handler):
+    """handler(dict) -> dict；每條連線一個執行緒"""
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        # 上次異常結束留下的 socket 檔
+        if os.path.exists(target):
+            os.remove(target)
+        server = _UnixServer(target, _Handler)
+    else:
+        server = _TCPServer(target, _Handler)
+    server.handler = handler
+    return server
+
+
+class RPCClient:
+    """每個執行緒一條連線並重複使用；fork 之後會重新連線"""
+
+    def __init__(self, address, timeout=5.0):
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+        self.calls = 0
+        self.connects = 0
+        self.errors = 0
+
+    def _connect(self):
+        kind, target = parse_address(self.address)
+        try:
+            if kind == 'unix':
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(target)
+            else:
+                sock = socket.create_connection(target, timeout=self.timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as e:
+            raise RPCError(f'無法連線到搜尋服務 {self.address}：{e}')
+        self.connects += 1
+        return sock
+
+    def _connection(self):
+        """回傳 (socket, 是否為沿用的連線)"""
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None and self._local.pid == os.getpid():
+            return sock, True
+        sock = self._connect()
+        self._local.sock = sock
+        self._local.pid = os.getpid()
+        return sock, False
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def call(self, message):
+        self.calls += 1
+        for attempt in range(2):
+            sock, reused = self._connection()
+            try:
+                send_message(sock, message)
+                return recv_message(sock)
+            except socket.timeout:
+                # 回應可能晚點才到，這條連線不能再用
+                self.close()
+                self.errors += 1
+                raise RPCError(f'搜尋服務逾時（{self.timeout} 秒）')
+            except (OSError, ConnectionClosed) as e:
+                self.close()
+                # 閒置的連線可能已被 server 關閉（例如服務重啟），重新連線再試一次
+                if reused and attempt == 0:
+                    continue
+                self.errors += 1
+                raise RPCError(f'搜尋服務連線中斷：{e}')
+
+    def stats(self):
+        return {
+            'address': self.address,
+            'timeout': self.timeout,
+            'calls': self.calls,
+            'connects': self.connects,
+            'errors': self.errors,
+        }
@@ -0,0 +1,149 @@
+"""
+語意搜尋的呼叫入口
+
+TRAVEL_SEARCH['SERVER_ADDRESS'] 沒有設定時在本行程內查詢（每個 worker 各自載入模型與索引）；
+設定後改呼叫 search_server 指令啟動的獨立行程，由它持有 encoder、索引、快取與批次合併，
+Django worker 只負責轉送請求與取回景點資料。
+"""
+import logging
+import threading
+
+from . import semantic_search
+from .indexer import read_metadata
+from .search_cache import cache_stats
+from .search_registry import SearchUnavailable, get_search_settings, registry
+from .search_rpc import RPCClient, RPCError
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """有設定 SERVER_ADDRESS 時回傳共用的 RPCClient，否則回傳 None"""
+    global _client
+    config = get_search_settings()
+    address = config['SERVER_ADDRESS']
+    if not address:
+        return None
+    if _client is None or _client.address != address:
+        with _client_lock:
+            if _client is None or _client.address != address:
+                _client = RPCClient(address, timeout=config['SERVER_TIMEOUT'])
+    return _client
+
+
+def _call(client, message):
+    try:
+        response = client.call(message)
+    except RPCError as e:
+        raise SearchUnavailable(str(e))
+    if not response.get('ok'):
+        if response.get('unavailable'):
+            raise SearchUnavailable(response.get('error'))
+        raise RuntimeError(response.get('error'))
+    return response
+
+
+def search(queries, k=5, nprobe=None, ef_search=None, region=None, town=None, class_ids=None, rerank=False):
+    """
+    查詢句子 -> [(相似度 list, document id list, 是否經過 reranker 排序), ...]
+    無法使用時拋出 SearchUnavailable
+    """
+    params = {
+        'k': k, 'nprobe': nprobe, 'ef_search': ef_search,
+        'region': region, 'town': town, 'class_ids': list(class_ids or []), 'rerank': bool(rerank),
+    }
+    client = get_client()
+    if client is None:
+        return semantic_search.run_search(queries, **params)
+    return _call(client, dict(params, op='search', queries=list(queries)))['results']
+
+
+def similar(travel_id, k=10, nprobe=None, ef_search=None, region=None, town=None, class_ids=None):
+    """以索引中儲存的向量找相似景點，回傳 (相似度 list, document id list)；不在索引中時回傳 None"""
+    params = {
+        'k': k, 'nprobe': nprobe, 'ef_search': ef_search,
+        'region': region, 'town': town, 'class_ids': list(class_ids or []),
+    }
+    client = get_client()
+    if client is None:
+        return semantic_search.run_similar(travel_id, **params)
+    return _call(client, dict(params, op='similar', travel_id=travel_id))['result']
+
+
+def status():
+    client = get_client()
+    if client is None:
+        data = registry.status()
+        data['index']['metadata'] = read_metadata()
+        return data
+    try:
+        data = _call(client, {'op': 'status'})['status']
+    except (SearchUnavailable, RuntimeError) as e:
+        data = {'ready': False, 'degraded': True, 'error': str(e)}
+    data['server'] = client.address
+    return data
+
+
+def stats():
+    client = get_client()
+    if client is None:
+        return {'cache': cache_stats(), 'batching': semantic_search.batcher.stats()}
+    data = _call(client, {'op': 'stats'})['stats']
+    data['client'] = client.stats()
+    return data
+
+
+def reload_index():
+    """立即切換到 manifest 指向的最新索引，回傳 (是否已切換, 目前的索引狀態)"""
+    client = get_client()
+    if client is None:
+        swapped = registry.reload_index()
+        return swapped, registry.status()['index']
+    response = _call(client, {'op': 'reload'})
+    return response['swapped'], response['index']
+
+
+def handle_request(message):
+    """search_server 收到的請求"""
+    op = message.get('op')
+    try:
+        if op == 'search':
+            results = semantic_search.run_search(
+                message['queries'],
+                k=message.get('k') or 5,
+                nprobe=message.get('nprobe'),
+                ef_search=message.get('ef_search'),
+                region=message.get('region'),
+                town=message.get('town'),
+                class_ids=message.get('class_ids'),
+                rerank=message.get('rerank', False),
+            )
+            return {'ok': True, 'results': results}
+        if op == 'similar':
+            result = semantic_search.run_similar(
+                message['travel_id'],
+                k=message.get('k') or 10,
+                nprobe=message.get('nprobe'),
+                ef_search=message.get('ef_search'),
+                region=message.get('region'),
+                town=message.get('town'),
+                class_ids=message.get('class_ids'),
+            )
+            return {'ok': True, 'result': result}
+        if op == 'status':
+            data = registry.status()
+            data['index']['metadata'] = read_metadata()
+            return {'ok': True, 'status': data}
+        if op == 'stats':
+            return {'ok': True, 'stats': {'cache': cache_stats(), 'batching': semantic_search.batcher.stats()}}
+        if op == 'reload':
+            swapped = registry.reload_index()
+            return {'ok': True, 'swapped': swapped, 'index': registry.status()['index']}
+        if op == 'ping':
+            return {'ok': True}
+    except SearchUnavailable as e:
+        return {'ok': False, 'unavailable': True, 'error': str(e)}
+    return {'ok': False, 'error': f'未知的操作：{op}'}
@@ -0,0 +1,193 @@
+"""
+語意搜尋：查詢編碼 + FAISS 檢索，兩個步驟都先查快取，
+同時到達的請求由 MicroBatcher 合併成一次 encode / search。
+縣市 / 鄉鎮 / 類別篩選在檢索時以 IDSelector 套用，而不是取回結果後再過濾。
+"""
+import numpy as np
+from django.db.models import Q
+
+from . import ann_index
+from .batcher import MicroBatcher
+from .cache_version import get_version
+from .gazetteer import canonical, get_gazetteer
+from .models import Travel
+from .search_cache import embedding_cache, embedding_key, filter_cache, normalize_query, result_cache
+from .search_registry import get_search_settings, registry
+
+
+class SearchFilter:
+    """篩選條件與符合條件的 travel_id"""
+
+    def __init__(self, key, ids):
+        self.key = key
+        self.ids = ids
+
+
+def resolve_filter(region=None, town=None, class_ids=None):
+    """把篩選條件轉成允許的 travel_id；沒有任何條件時回傳 None"""
+    if not (region or town or class_ids):
+        return None
+    class_ids = tuple(sorted(set(class_ids or ())))
+    # 「台」和「臺」對應到同一個縣市代碼
+    key = (canonical(region), canonical(town), class_ids, get_version('travel'))
+
+    ids = filter_cache.get(key)
+    if ids is None:
+        travels = Travel.objects.all()
+        if region or town:
+            condition = get_gazetteer().code_filter(region, town)
+            travels = travels.filter(condition) if condition else travels.none()
+        if class_ids:
+            travels = travels.filter(Q(class1__in=class_ids) | Q(class2__in=class_ids) | Q(class3__in=class_ids))
+        ids = np.fromiter(travels.values_list('travel_id', flat=True), dtype='int64')
+        filter_cache.set(key, ids)
+    return SearchFilter(key, ids)
+
+ENCODE_BATCH_SIZE = 512
+
+
+def encode_queries(queries):
+    """把查詢轉成向量，只有快取沒命中的句子才送進 encoder"""
+    keys = [normalize_query(query) for query in queries]
+    vectors = [embedding_cache.get(key) for key in keys]
+
+    missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+    if missing:
+        embeddings = registry.get_encoder().encode(
+            missing,
+            batch_size=ENCODE_BATCH_SIZE,
+            show_progress_bar=False,
+            normalize_embeddings=False
+        )
+        encoded = dict(zip(missing, np.asarray(embeddings, dtype='float32')))
+        for key, vector in encoded.items():
+            embedding_cache.set(key, vector)
+        vectors = [encoded[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+    return np.vstack(vectors).astype('float32')
+
+
+def search_vectors(embeddings, k=5, nprobe=None, ef_search=None, search_filter=None, generation=None):
+    """
+    在索引中查詢，回傳每個向量的 (相似度 list, document id list)
+    generation 為呼叫端已持有的索引版本（registry.index_lease()），沒給時自行取得
+    """
+    if generation is None:
+        with registry.index_lease() as generation:
+            return search_vectors(embeddings, k, nprobe, ef_search, search_filter, generation)
+    index = generation.index
+    version = generation.number
+    config = get_search_settings()
+    nprobe = nprobe or config['NPROBE']
+    ef_search = ef_search or config['EF_SEARCH']
+    filter_key = search_filter.key if search_filter is not None else None
+
+    # 篩選後沒有任何景點，不需要檢索
+    if search_filter is not None and not len(search_filter.ids):
+        return [([], []) for _ in range(len(embeddings))]
+
+    results = [None] * len(embeddings)
+    result_keys = [(embedding_key(vector), k, version, nprobe, ef_search, filter_key) for vector in embeddings]
+    for i, key in enumerate(result_keys):
+        results[i] = result_cache.get(key)
+
+    todo = [i for i, result in enumerate(results) if result is None]
+    if todo:
+        selector = ann_index.id_selector(search_filter.ids) if search_filter is not None else None
+        params = ann_index.search_parameters(index, nprobe=nprobe, ef_search=ef_search, selector=selector)
+        D, I = index.search(embeddings[todo], k=k, params=params)
+        for row, i in enumerate(todo):
+            # 符合條件的景點少於 k 筆時，FAISS 會以 -1 補位
+            found = I[row] != -1
+            results[i] = (D[row][found].tolist(), I[row][found].tolist())
+            result_cache.set(result_keys[i], results[i])
+    return results
+
+
+def _search_batch(queries, contexts):
+    """
+    合併後的批次：只 encode 一次；查詢參數與篩選條件相同的句子一起 search，
+    各請求的 k 可能不同，用最大的 k 查詢後再各自截斷
+    """
+    embeddings = encode_queries(queries)
+    groups = {}
+    filters = {}
+    for i, (k, nprobe, ef_search, search_filter) in enumerate(contexts):
+        filter_key = search_filter.key if search_filter is not None else None
+        filters[filter_key] = search_filter
+        groups.setdefault((nprobe, ef_search, filter_key), []).append(i)
+
+    results = [None] * len(queries)
+    for (nprobe, ef_search, filter_key), rows in groups.items():
+        k = max(contexts[i][0] for i in rows)
+        found = search_vectors(
+            embeddings[rows], k=k, nprobe=nprobe, ef_search=ef_search, search_filter=filters[filter_key]
+        )
+        for i, result in zip(rows, found):
+            results[i] = result
+    return results
+
+
+_config = get_search_settings()
+batcher = MicroBatcher(
+    _search_batch,
+    window_ms=_config['BATCH_WINDOW_MS'],
+    max_batch=_config['BATCH_MAX_SIZE'],
+    name='semantic-search-batcher',
+)
+
+
+def search(queries, k=5, nprobe=None, ef_search=None, search_filter=None):
+    """
+    查詢句子 -> [(相似度 list, document id list), ...]
+    nprobe / ef_search 只對 IVF / HNSW 索引有效，沒給時用設定值；
+    search_filter 由 resolve_filter() 產生
+    索引或模型無法使用時拋出 SearchUnavailable
+    """
+    # 先確認索引可用，避免索引不存在時還去載入模型
+    registry.get_index()
+    if not get_search_settings()['BATCHING']:
+        return search_vectors(
+            encode_queries(queries), k=k, nprobe=nprobe, ef_search=ef_search, search_filter=search_filter
+        )
+    results = batcher.submit(queries, context=(k, nprobe, ef_search, search_filter))
+    return [(similarities[:k], document_ids[:k]) for similarities, document_ids in results]
+
+
+def similar(travel_id, k=10, nprobe=None, ef_search=None, search_filter=None):
+    """
+    與 travel_id 相似的景點：直接用索引中儲存的向量檢索，不經過 encoder。
+    回傳 (相似度 list, document id list)，不含自己；景點不在索引中時回傳 None
+    """
+    # 取回向量與檢索使用同一個索引版本
+    with registry.index_lease() as generation:
+        vector = ann_index.reconstruct(generation.index, travel_id)
+        if vector is None:
+            return None
+        similarities, document_ids = search_vectors(
+            np.asarray(vector, dtype='float32')[None, :], k=k + 1,
+            nprobe=nprobe, ef_search=ef_search, search_filter=search_filter, generation=generation,
+        )[0]
+    pairs = [(score, doc_id) for score, doc_id in zip(similarities, document_ids) if doc_id != travel_id]
+    return [score for score, _ in pairs[:k]], [doc_id for _, doc_id in pairs[:k]]
+
+
+def run_similar(travel_id, k=10, nprobe=None, ef_search=None, region=None, town=None, class_ids=None):
+    search_filter = resolve_filter(region=region, town=town, class_ids=class_ids)
+    return similar(travel_id, k=k, nprobe=nprobe, ef_search=ef_search, search_filter=search_filter)
+
+
+def run_search(queries, k=5, nprobe=None, ef_search=None, region=None, town=None, class_ids=None, rerank=False):
+    """
+    從原始的篩選條件開始的完整查詢（本行程與搜尋服務共用）
+    回傳 [(相似度 list, document id list, 是否經過 reranker 排序), ...]
+    """
+    search_filter = resolve_filter(region=region, town=town, class_ids=class_ids)
+    if not rerank:
+        results = search(queries, k=k, nprobe=nprobe, ef_search=ef_search, search_filter=search_filter)
+        return [(similarities, document_ids, False) for similarities, document_ids in results]
+
+    from .reranker import rerank_results
+    candidates = max(k, get_search_settings()['RERANK_CANDIDATES'])
+    results = search(queries, k=candidates, nprobe=nprobe, ef_search=ef_search, search_filter=search_filter)
+    return rerank_results(queries, results, k)
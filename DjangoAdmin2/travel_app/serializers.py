@@ -6,10 +6,13 @@ class CountrySerializers(serializers.ModelSerializer):
         model = Counties
         fields = '__all__'
 
+# 內部使用的雜湊欄位，不輸出
+TRAVEL_INTERNAL_FIELDS = ('name_hash', 'tel_hash', 'address_hash')
+
 class TravelSerializers(serializers.ModelSerializer):
     class Meta:
         model = Travel
-        fields = '__all__'     
+        exclude = TRAVEL_INTERNAL_FIELDS
 
 class TravelClassSerializers(serializers.ModelSerializer):
     class Meta:
@@ -26,7 +29,36 @@ class TravelFilterSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Travel
-        fields = '__all__'  
+        exclude = TRAVEL_INTERNAL_FIELDS
+
+
 
+class TravelSearchResultSerializer(serializers.ModelSerializer):
+    """語意搜尋結果：只輸出請求的欄位，並附上類別名稱"""
+    # 預設輸出的欄位（不含 travel_txt 等長文字）
+    DEFAULT_FIELDS = ('travel_id', 'travel_name', 'region', 'town', 'travel_address', 'image1', 'px', 'py')
+    ALLOWED_FIELDS = (
+        'travel_id', 'travel_name', 'travel_txt', 'tel', 'travel_address', 'region', 'town',
+        'travel_linginfo', 'opentime', 'image1', 'image2', 'image3', 'px', 'py',
+        'website', 'ticketinfo', 'parkinginfo', 'upload',
+    )
+    classes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Travel
+        fields = ('travel_id', 'travel_name', 'travel_txt', 'tel', 'travel_address', 'region', 'town',
+                  'travel_linginfo', 'opentime', 'image1', 'image2', 'image3', 'px', 'py',
+                  'website', 'ticketinfo', 'parkinginfo', 'upload', 'classes')
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = set(fields or self.DEFAULT_FIELDS) | {'travel_id', 'classes'}
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
 
+    def get_classes(self, obj):
+        return [
+            {'class_id': travel_class.class_id, 'class_name': travel_class.class_name}
+            for travel_class in (obj.class1, obj.class2, obj.class3) if travel_class is not None
+        ]
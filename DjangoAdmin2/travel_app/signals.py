@@ -0,0 +1,61 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache_version import bump_version
+from .dedup import travel_hashes
+from .gazetteer import canonical, get_gazetteer
+from .models import Counties, Taiwan, Travel, TravelIndexTask
+from .spatial import spatial_registry
+
+
+# 儲存前重新計算名稱 / 電話 / 地址的雜湊，重複檢查只查有索引的雜湊欄位
+@receiver(pre_save, sender=Travel)
+def fill_travel_hashes(sender, instance, **kwargs):
+    for field, value in travel_hashes(instance.travel_name, instance.tel, instance.travel_address).items():
+        setattr(instance, field, value)
+
+
+# 縣市統一寫成「臺」，並依對照表填入縣市 / 鄉鎮市區代碼，篩選時以整數代碼比對
+@receiver(pre_save, sender=Travel)
+def fill_region_codes(sender, instance, **kwargs):
+    if instance.region:
+        instance.region = canonical(instance.region)
+    gazetteer = get_gazetteer()
+    instance.region_code = gazetteer.region_code(instance.region)
+    instance.town_code = gazetteer.town_code(instance.region, instance.town)
+
+
+# 景點新增/修改/刪除時，排入向量索引的同步佇列，並讓景點相關快取失效
+@receiver(post_save, sender=Travel)
+def queue_travel_upsert(sender, instance, **kwargs):
+    TravelIndexTask.objects.create(travel_id=instance.travel_id, action=TravelIndexTask.ACTION_UPSERT)
+    bump_version('travel')
+
+
+@receiver(post_delete, sender=Travel)
+def queue_travel_delete(sender, instance, **kwargs):
+    TravelIndexTask.objects.create(travel_id=instance.travel_id, action=TravelIndexTask.ACTION_DELETE)
+    bump_version('travel')
+
+
+# 本行程已建立的附近景點索引直接增量更新，不必整份重建
+@receiver(post_save, sender=Travel)
+def update_spatial_index(sender, instance, **kwargs):
+    spatial_registry.apply(
+        instance.travel_id, lat=instance.py, lng=instance.px,
+        classes=(instance.class1_id, instance.class2_id, instance.class3_id),
+    )
+
+
+@receiver(post_delete, sender=Travel)
+def remove_from_spatial_index(sender, instance, **kwargs):
+    spatial_registry.apply(instance.travel_id, deleted=True)
+
+
+# 縣市 / 鄉鎮市區異動時讓各行程的對照表重新載入
+@receiver(post_save, sender=Counties)
+@receiver(post_delete, sender=Counties)
+@receiver(post_save, sender=Taiwan)
+@receiver(post_delete, sender=Taiwan)
+def invalidate_gazetteer(sender, **kwargs):
+    bump_version('gazetteer')
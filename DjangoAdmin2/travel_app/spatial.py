@@ -0,0 +1,260 @@
+"""
+景點座標的記憶體內空間索引（附近景點）
+
+Travel.px / py 為經度 / 緯度。所有座標依 CELL_DEG 度的格子排序存成 NumPy 陣列，
+同一格的景點是連續的一段；查詢時只取半徑範圍（外接矩形）內的格子，
+再以向量化的 haversine 計算距離、過濾並排序。
+
+景點異動時，寫入的行程直接在索引上增量更新（signals）：異動的景點記在 overlay，
+累積超過 OVERLAY_LIMIT 筆才合併回陣列，不需要重新查詢資料庫。
+其他行程以資料版本號（cache_version 'travel'）判斷是否要重建；
+版本號只在本行程有效（LocMemCache）時，最多 NEARBY_REFRESH_SECONDS 秒後重建。
+"""
+import itertools
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+from .cache_version import get_version
+from .models import Travel
+from .conf import get_travel_settings
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+# 格子大小（度），約 5.5 公里
+CELL_DEG = 0.05
+
+# overlay 累積多少筆異動後合併回陣列
+OVERLAY_LIMIT = 256
+
+# 每個景點最多三個類別，沒有的以 0 表示
+CLASS_COLUMNS = 3
+
+# 索引內容每次改變（建立 / 增量更新）都取一個新的 revision，衍生的快取以此判斷是否過期
+_revisions = itertools.count(1)
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """(lat, lng) 到每個 (lats[i], lngs[i]) 的大圓距離（公里），輸入為度"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlng = np.radians(lngs) - math.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def parse_coordinate(lat, lng):
+    """
+    (lat, lng) 轉成浮點數；表單送來的字串、Decimal 都接受，空值、非數字或超出範圍時回傳 None
+    """
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def valid_coordinate(lat, lng):
+    return parse_coordinate(lat, lng) is not None
+
+
+def _cells(lats, lngs):
+    return np.floor(lats / CELL_DEG).astype('int64'), np.floor(lngs / CELL_DEG).astype('int64')
+
+
+class SpatialIndex:
+    def __init__(self, ids, lats, lngs, classes):
+        ids = np.asarray(ids, dtype='int64')
+        lats = np.asarray(lats, dtype='float64')
+        lngs = np.asarray(lngs, dtype='float64')
+        classes = np.asarray(classes, dtype='int64').reshape(len(ids), CLASS_COLUMNS)
+        cy, cx = _cells(lats, lngs)
+        order = np.lexsort((cx, cy))
+        self.ids = ids[order]
+        self.lats = lats[order]
+        self.lngs = lngs[order]
+        self.classes = classes[order]
+        # 格子 -> 陣列中的 [start, end)
+        self.cells = {}
+        if len(order):
+            cy, cx = cy[order], cx[order]
+            boundaries = np.flatnonzero((np.diff(cy) != 0) | (np.diff(cx) != 0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(order)]))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                self.cells[(int(cy[start]), int(cx[start]))] = (start, end)
+        # 增量更新：(陣列中已失效的 travel_id, 新增 / 修改後的景點 {travel_id: (lat, lng, classes)})，
+        # 整組一起替換，查詢中的執行緒看到的是一致的版本
+        self.overlay = (frozenset(), {})
+        self.revision = next(_revisions)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows 為 (travel_id, lat, lng, class1, class2, class3)；沒有座標或座標不合理的略過"""
+        kept = [row for row in rows if valid_coordinate(row[1], row[2])]
+        return cls(
+            [row[0] for row in kept],
+            [float(row[1]) for row in kept],
+            [float(row[2]) for row in kept],
+            [[class_id or 0 for class_id in row[3:3 + CLASS_COLUMNS]] for row in kept],
+        )
+
+    def __len__(self):
+        removed, extra = self.overlay
+        stale = int(np.isin(self.ids, list(removed)).sum()) if removed else 0
+        return len(self.ids) - stale + len(extra)
+
+    def upsert(self, travel_id, lat, lng, classes):
+        removed, extra = self.overlay
+        extra = dict(extra)
+        coordinate = parse_coordinate(lat, lng)
+        if coordinate is not None:
+            extra[travel_id] = (*coordinate, [class_id or 0 for class_id in classes])
+        else:
+            extra.pop(travel_id, None)
+        self.overlay = (removed | {travel_id}, extra)
+        self.revision = next(_revisions)
+
+    def remove(self, travel_id):
+        removed, extra = self.overlay
+        extra = dict(extra)
+        extra.pop(travel_id, None)
+        self.overlay = (removed | {travel_id}, extra)
+        self.revision = next(_revisions)
+
+    def needs_compaction(self):
+        removed, extra = self.overlay
+        return len(removed) + len(extra) > OVERLAY_LIMIT
+
+    def _with_overlay(self, positions):
+        """陣列中 positions 的景點，去掉已失效的並加上 overlay，回傳 (ids, lats, lngs, classes)"""
+        removed, extra = self.overlay
+        ids, lats, lngs, classes = self.ids[positions], self.lats[positions], self.lngs[positions], self.classes[positions]
+        if removed:
+            keep = ~np.isin(ids, list(removed))
+            ids, lats, lngs, classes = ids[keep], lats[keep], lngs[keep], classes[keep]
+        if extra:
+            extra_ids = list(extra)
+            ids = np.concatenate((ids, np.array(extra_ids, dtype='int64')))
+            lats = np.concatenate((lats, [extra[i][0] for i in extra_ids]))
+            lngs = np.concatenate((lngs, [extra[i][1] for i in extra_ids]))
+            classes = np.concatenate(
+                (classes, np.array([extra[i][2] for i in extra_ids], dtype='int64').reshape(-1, CLASS_COLUMNS))
+            )
+        return ids, lats, lngs, classes
+
+    def arrays(self):
+        """目前所有景點的 (ids, lats, lngs, classes)，已套用 overlay"""
+        return self._with_overlay(slice(None))
+
+    def compacted(self):
+        """把 overlay 合併回陣列，回傳新的索引"""
+        return SpatialIndex(*self.arrays())
+
+    def _candidates(self, lat, lng, radius_km):
+        """半徑外接矩形涵蓋的格子中所有景點的陣列位置"""
+        dlat = radius_km / (EARTH_RADIUS_KM * math.pi / 180)
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        dlng = min(dlat / cos_lat, 180)
+        y0, x0 = (int(v) for v in (math.floor((lat - dlat) / CELL_DEG), math.floor((lng - dlng) / CELL_DEG)))
+        y1, x1 = (int(v) for v in (math.floor((lat + dlat) / CELL_DEG), math.floor((lng + dlng) / CELL_DEG)))
+        # 範圍很大時直接掃描全部，比逐格查表快
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self.cells):
+            return np.arange(len(self.ids))
+        slices = [self.cells[(y, x)] for y in range(y0, y1 + 1) for x in range(x0, x1 + 1) if (y, x) in self.cells]
+        if not slices:
+            return np.empty(0, dtype='int64')
+        return np.concatenate([np.arange(start, end) for start, end in slices])
+
+    def query(self, lat, lng, radius_km, class_ids=None):
+        """半徑內的景點，依距離由近到遠，回傳 (距離 ndarray, travel_id ndarray)"""
+        ids, lats, lngs, classes = self._with_overlay(self._candidates(lat, lng, radius_km))
+        distances = haversine_km(lat, lng, lats, lngs)
+        mask = distances <= radius_km
+        if class_ids:
+            mask &= np.isin(classes, list(class_ids)).any(axis=1)
+        distances, ids = distances[mask], ids[mask]
+        order = np.argsort(distances, kind='stable')
+        return distances[order], ids[order]
+
+
+def load_rows():
+    return Travel.objects.filter(px__isnull=False, py__isnull=False).values_list(
+        'travel_id', 'py', 'px', 'class1_id', 'class2_id', 'class3_id'
+    )
+
+
+class SpatialRegistry:
+    """每個行程一份的空間索引，第一次查詢時才從資料庫建立"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.built_at = None
+        self.build_seconds = None
+
+    def _stale(self):
+        if self.index is None:
+            return True
+        max_age = get_travel_settings()['NEARBY_REFRESH_SECONDS']
+        return get_version('travel') != self.version or time.monotonic() - self.built_at > max_age
+
+    def get_index(self):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self._build()
+        return self.index
+
+    def _build(self):
+        start = time.perf_counter()
+        version = get_version('travel')
+        index = SpatialIndex.from_rows(list(load_rows()))
+        self.index, self.version, self.built_at = index, version, time.monotonic()
+        self.build_seconds = time.perf_counter() - start
+        logger.info('附近景點索引建立完成：%s 筆，耗時 %.3f 秒', len(index), self.build_seconds)
+
+    def apply(self, travel_id, lat=None, lng=None, classes=None, deleted=False):
+        """景點異動時在本行程的索引上增量更新；尚未建立索引時不需要處理"""
+        with self._lock:
+            if self.index is None:
+                return
+            if deleted:
+                self.index.remove(travel_id)
+            else:
+                self.index.upsert(travel_id, lat, lng, classes)
+            if self.index.needs_compaction():
+                self.index = self.index.compacted()
+            # 本行程已套用這次異動，不需要因為版本號改變而重建
+            self.version = get_version('travel')
+
+    def reset(self):
+        with self._lock:
+            self.index = None
+
+    def status(self):
+        return {
+            'loaded': self.index is not None,
+            'size': len(self.index) if self.index is not None else None,
+            'cells': len(self.index.cells) if self.index is not None else None,
+            'overlay': sum(len(part) for part in self.index.overlay) if self.index is not None else None,
+            'build_seconds': self.build_seconds,
+        }
+
+
+spatial_registry = SpatialRegistry()
+
+
+def nearby(lat, lng, radius_km, class_ids=None):
+    """半徑 radius_km 內的景點，回傳依距離排序的 [(距離公里, travel_id)]"""
+    distances, ids = spatial_registry.get_index().query(lat, lng, radius_km, class_ids)
+    return list(zip(distances.tolist(), ids.tolist()))
@@ -0,0 +1,87 @@
+"""
+測試共用的資料表與語意搜尋環境
+
+travel 等資料表為 managed = False，測試資料庫中不會建立，由 TravelTablesTestCase 在類別開始前自行建立；
+SearchIndexTestCase 另外把索引與 embedding store 指到暫存目錄，並以 FakeEncoder 取代模型。
+"""
+import os
+import tempfile
+import zlib
+from unittest import mock
+
+import numpy as np
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from .models import Counties, Taiwan, Travel, TravelClass
+from .search_cache import embedding_cache, filter_cache, result_cache
+from .search_registry import registry
+
+FAKE_DIMS = 16
+
+
+def fake_vectors(texts, dims=FAKE_DIMS):
+    """相同文字得到相同的單位向量"""
+    vectors = np.array(
+        [np.random.default_rng(zlib.crc32(text.encode('utf-8'))).standard_normal(dims) for text in texts],
+        dtype='float32',
+    ).reshape(len(texts), dims)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class FakeEncoder:
+    """取代 SentenceTransformer，記錄每次編碼的句子"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        texts = list(texts)
+        self.calls.append(texts)
+        return fake_vectors(texts)
+
+
+class TravelTablesTestCase(TestCase):
+    unmanaged_models = (TravelClass, Counties, Taiwan, Travel)
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.unmanaged_models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.unmanaged_models):
+                editor.delete_model(model)
+
+
+class SearchIndexTestCase(TravelTablesTestCase):
+    """索引、embedding store 在暫存目錄；encoder 為 FakeEncoder（self.encoder）"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.index_path = os.path.join(directory.name, 'vector.index')
+        search_settings = override_settings(TRAVEL_SEARCH={
+            'INDEX_PATH': self.index_path,
+            'INDEX_MMAP': False,
+            'EMBEDDING_STORE_DIR': os.path.join(directory.name, 'embeddings'),
+            'BATCHING': False,
+            # 查詢紀錄會延遲寫入，測試時不記錄，避免寫到原始碼目錄
+            'QUERY_LOG_ENABLED': False,
+        })
+        search_settings.enable()
+        self.addCleanup(search_settings.disable)
+        self.encoder = FakeEncoder()
+        patcher = mock.patch.object(registry, 'get_encoder', return_value=self.encoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        registry.reset()
+        self.addCleanup(registry.reset)
+        for cache in (embedding_cache, result_cache, filter_cache):
+            cache.clear()
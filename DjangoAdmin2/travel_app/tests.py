@@ -1,3 +1,821 @@
-from django.test import TestCase
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+
+from . import ann_index, index_versions, indexer, neighbors, semantic_search
+from .admission import REJECT_QUEUE_FULL, REJECT_TIMEOUT, AdmissionGate, Rejected
+from .analytics import QueryLog, SpaceSaving, summarize
+from .batcher import MicroBatcher
+from .embedding_store import EmbeddingStore
+from .encoders import encoder_id, load_encoder
+from .reranker import rerank
+from .search_cache import LRUCache, normalize_query
+from . import search_registry
+from .search_registry import SearchRegistry, SearchUnavailable
+from .search_rpc import RPCClient, RPCError
+from .map_clusters import ClusterIndex, tile_range
+from .index_build import IndexBuild, build_dir
+from .gazetteer import Gazetteer, gazetteer_registry, get_gazetteer
+from .dedup import find_duplicates, travel_hashes
+from .models import Counties, Taiwan, Travel, TravelClass, TravelIndexTask, TravelNeighbor
+from .pagination import KeysetPaginator, _query_key
+from .spatial import SpatialIndex, SpatialRegistry, haversine_km
+from .testing import SearchIndexTestCase, TravelTablesTestCase, fake_vectors
+from .validation import validate_travel
+from .views import _hydrate_travels
+
+try:
+    import faiss  # type: ignore  # noqa: F401
+except ImportError:
+    faiss = None
+
+
+class SearchRegistryTest(SimpleTestCase):
+    @override_settings(TRAVEL_SEARCH={'INDEX_PATH': '/nonexistent/vector.index'})
+    def test_missing_index_degrades(self):
+        """索引不存在時只有搜尋不可用，不會在 import 時失敗"""
+        registry = SearchRegistry()
+        self.assertEqual(registry.status()['index']['state'], 'unloaded')
+        with self.assertRaises(SearchUnavailable):
+            registry.get_index()
+        data = registry.status()
+        self.assertEqual(data['index']['state'], 'missing')
+        self.assertTrue(data['degraded'])
+        self.assertFalse(data['ready'])
+
+
+class LRUCacheTest(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = LRUCache(maxsize=2, ttl=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query(' 金門\u3000古蹟  ＡＢＣ '), '金門 古蹟 ABC')
+
+
+class MicroBatcherTest(SimpleTestCase):
+    def test_concurrent_requests_share_one_batch(self):
+        batch_sizes = []
+
+        def handler(items, contexts):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(handler, window_ms=200, max_batch=8)
+        results = {}
+
+        def client(i):
+            results[i] = batcher.submit([i, i + 100])
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(batch_sizes, [8])
+        for i in range(4):
+            self.assertEqual(results[i], [i * 2, (i + 100) * 2])
+
+
+class AdmissionGateTest(SimpleTestCase):
+    def test_queue_full_and_timeout(self):
+        gate = AdmissionGate(limit=1, queue_size=1, timeout=0.2)
+        release = threading.Event()
+        admitted = threading.Event()
+
+        def hold():
+            with gate.admit():
+                admitted.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        admitted.wait(5)
+        # 第二個請求排隊逾時
+        with self.assertRaises(Rejected) as cm:
+            with gate.admit():
+                pass
+        self.assertEqual(cm.exception.reason, REJECT_TIMEOUT)
+        self.assertGreaterEqual(cm.exception.retry_after, 1)
+
+        # 佇列已有人等待時，下一個請求立即被拒絕
+        def wait():
+            with self.assertRaises(Rejected):
+                with gate.admit():
+                    pass
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        while gate.waiting == 0:
+            time.sleep(0.001)
+        with self.assertRaises(Rejected) as cm:
+            with gate.admit():
+                pass
+        self.assertEqual(cm.exception.reason, REJECT_QUEUE_FULL)
+        waiter.join()
+        release.set()
+        holder.join()
+
+        with gate.admit():
+            pass
+        stats = gate.stats()
+        self.assertEqual(stats['admitted'], 2)
+        self.assertEqual(stats['rejected'], {REJECT_QUEUE_FULL: 1, REJECT_TIMEOUT: 2})
+        self.assertEqual(stats['queue_depth'], 0)
+
+
+class QueryAnalyticsTest(SimpleTestCase):
+    def test_space_saving_finds_heavy_hitters(self):
+        rng = np.random.default_rng(0)
+        stream = [f'rare-{i}' for i in rng.integers(0, 5000, 3000)] + ['hot'] * 300 + ['warm'] * 150
+        tracker = SpaceSaving(capacity=50)
+        for item in rng.permutation(stream):
+            tracker.add(item)
+        top = tracker.top(2)
+        self.assertEqual([item for item, _, _ in top], ['hot', 'warm'])
+        for item, count, error in top:
+            # 計數只會高估，且高估量不超過 error
+            self.assertGreaterEqual(count, stream.count(item))
+            self.assertLessEqual(count - error, stream.count(item))
+
+    def test_log_and_summarize(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(TRAVEL_SEARCH={'QUERY_LOG_DIR': directory, 'ANALYTICS_LOW_SCORE': 0.5}):
+            log = QueryLog(directory, flush_size=100)
+            for _ in range(3):
+                log.append(' 台北  夜市 ', ([0.9, 0.8], [1, 2]), 12.0, k=5, region='臺北市')
+            log.append('火星', ([0.1], [3]), 8.0, k=5)
+            log.append('沒有結果', ([], []), 8.0, k=5)
+            self.assertEqual(log.stats()['buffered'], 5)
+            log.flush()
+
+            summary = summarize()
+            self.assertEqual(summary['total_queries'], 5)
+            self.assertEqual(summary['top_queries'][0], {'query': '台北 夜市', 'count': 3, 'error': 0})
+            self.assertEqual({q['query'] for q in summary['low_score_queries']}, {'火星', '沒有結果'})
+            request = summary['top_requests'][0]
+            self.assertEqual(request['params']['region'], '臺北市')
+            self.assertEqual(request['params']['k'], 5)
+
+
+class SpatialIndexTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.ids = np.arange(1, 2001)
+        self.lats = rng.uniform(22.0, 25.3, len(self.ids))
+        self.lngs = rng.uniform(120.0, 122.0, len(self.ids))
+        self.classes = rng.integers(0, 5, (len(self.ids), 3))
+        self.index = SpatialIndex(self.ids, self.lats, self.lngs, self.classes)
+
+    def brute_force(self, lat, lng, radius, class_ids=None):
+        distances = haversine_km(lat, lng, self.lats, self.lngs)
+        mask = distances <= radius
+        if class_ids:
+            mask &= np.isin(self.classes, class_ids).any(axis=1)
+        return set(self.ids[mask].tolist())
+
+    def test_matches_brute_force(self):
+        for lat, lng, radius, class_ids in ((25.03, 121.56, 3, None), (23.5, 121.0, 20, [2]), (24.0, 120.5, 400, None)):
+            distances, ids = self.index.query(lat, lng, radius, class_ids)
+            self.assertEqual(set(ids.tolist()), self.brute_force(lat, lng, radius, class_ids))
+            self.assertTrue(np.all(np.diff(distances) >= 0))
+
+    def test_incremental_updates(self):
+        # 台北車站與台北 101 相距約 5 公里
+        self.assertAlmostEqual(float(haversine_km(25.0478, 121.5170, [25.0340], [121.5645])[0]), 5.05, delta=0.2)
+        self.index.upsert(9001, 25.0340, 121.5645, [1, None, None])
+        self.index.upsert(5, 25.0341, 121.5646, [1, 0, 0])
+        self.index.remove(6)
+        _, ids = self.index.query(25.0340, 121.5645, 0.1)
+        self.assertEqual(ids.tolist(), [9001, 5])
+        compacted = self.index.compacted()
+        self.assertEqual(len(compacted), len(self.index))
+        self.assertEqual(len(compacted), len(self.ids))
+        self.assertNotIn(6, compacted.ids.tolist())
+        self.assertEqual(compacted.query(25.0340, 121.5645, 0.1)[1].tolist(), [9001, 5])
+
+    def test_apply_accepts_form_strings(self):
+        # edit01 直接把表單字串寫進 px / py，post_save 時傳進來的是字串
+        registry = SpatialRegistry()
+        registry.index = self.index
+        registry.apply(9002, lat='25.0340', lng='121.5645', classes=(1, None, None))
+        self.assertEqual(registry.index.query(25.0340, 121.5645, 0.1)[1].tolist(), [9002])
+        for lat, lng in (('', '121.5'), ('abc', '121.5'), (None, None), ('95', '121.5')):
+            registry.apply(9002, lat=lat, lng=lng, classes=(1, None, None))
+            self.assertEqual(registry.index.query(25.0340, 121.5645, 0.1)[1].tolist(), [])
+
+    def test_map_clusters_cover_every_point_once(self):
+        clusters = ClusterIndex(self.index, points_zoom=12)
+        taiwan = (119.9, 21.9, 122.1, 25.4)
+        for zoom, class_ids in ((6, None), (9, None), (9, [2]), (12, None)):
+            x0, y0, x1, y1 = tile_range(zoom, *taiwan)
+            total, ids = 0, set()
+            for tx in range(x0, x1 + 1):
+                for ty in range(y0, y1 + 1):
+                    content = clusters.tile(zoom, tx, ty, class_ids)
+                    total += sum(count for _, _, count, _ in content['clusters']) + len(content['points'])
+                    ids.update(point[0] for point in content['points'])
+                    if zoom >= 12:
+                        self.assertEqual(content['clusters'], [])
+            expected = np.isin(self.classes, class_ids).any(axis=1).sum() if class_ids else len(self.ids)
+            self.assertEqual(total, expected)
+            self.assertTrue(ids <= set(self.ids.tolist()))
+
+
+class GazetteerTest(SimpleTestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer(
+            [(1, '台北市'), (2, '新北市'), (3, '臺東縣'), (4, '台北市')],
+            [(11, '台北市', '中正區'), (12, '台北市', '大安區'), (21, '新北市', '板橋區'), (22, '新北市', '中正區'),
+             (31, '臺東縣', '台東市')],
+        )
+
+    def test_lookup_ignores_tai_variants(self):
+        self.assertEqual(self.gazetteer.regions, ['台北市', '新北市', '臺東縣'])
+        self.assertEqual(self.gazetteer.towns_of('臺北市'), ['中正區', '大安區'])
+        self.assertTrue(self.gazetteer.has_town('台東縣', '臺東市'))
+        self.assertFalse(self.gazetteer.has_town('臺北市', '板橋區'))
+
+    def test_codes(self):
+        self.assertEqual(self.gazetteer.region_code('臺北市'), 1)
+        self.assertEqual(self.gazetteer.town_code('台東縣', '臺東市'), 31)
+        self.assertEqual(self.gazetteer.code_filter('臺北市', '大安區'), Q(region_code=1, town_code=12))
+        self.assertEqual(self.gazetteer.code_filter(town='中正區'), Q(town_code__in=[11, 22]))
+        self.assertIsNone(self.gazetteer.code_filter('臺北市', '板橋區'))
+        self.assertIsNone(self.gazetteer.code_filter('高雄市'))
+
+    def test_region_error(self):
+        self.assertIsNone(self.gazetteer.region_error('臺北市'))
+        self.assertIsNone(self.gazetteer.region_error('新北市'))
+        self.assertEqual(self.gazetteer.region_error('台北市'), "您好，台請改成臺")
+        self.assertEqual(self.gazetteer.region_error('高雄市'), "您好，此縣市不存在")
+
+
+class DedupTest(SimpleTestCase):
+    def test_hashes_ignore_formatting(self):
+        a = travel_hashes('ＡＢＣ 觀光工廠', '+886-2-2345-6789', '104 臺北市中山區南京東路 100 號')
+        b = travel_hashes('abc觀光工廠', '(02)23456789', '台北市中山區南京東路100號')
+        self.assertEqual(a, b)
+        self.assertIsNone(travel_hashes('x', '', None)['tel_hash'])
+
+    def test_near_duplicate_clusters(self):
+        records = [
+            (1, '龍山寺', '02-1', '臺北市萬華區廣州街211號'),
+            (2, '艋舺龍山寺', None, '台北市萬華區廣州街 211 號'),
+            (3, '國立故宮博物院', '02-2', '臺北市士林區至善路二段221號'),
+            (4, '淡水老街', '02-3', '新北市淡水區中正路'),
+            (5, '故宮博物院', None, '臺北市士林區至善路2段221號'),
+        ]
+        clusters = find_duplicates(records, threshold=0.5)
+        self.assertEqual(clusters[0]['travel_ids'], [1, 2])
+        self.assertIn('address', clusters[0]['reasons'])
+        self.assertIn([3, 5], [cluster['travel_ids'] for cluster in clusters])
+        self.assertNotIn(4, [travel_id for cluster in clusters for travel_id in cluster['travel_ids']])
+
+
+class TravelValidationTest(TravelTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        TravelClass.objects.create(class_id=1, class_name='自然')
+        Counties.objects.create(name='臺北市')
+        Taiwan.objects.create(region='臺北市', town='大安區')
+        Taiwan.objects.create(region='臺北市', town='中正區')
+        cls.park = Travel.objects.create(
+            travel_name='大安森林公園', tel='02-2700-3830', travel_address='臺北市大安區新生南路二段1號',
+            region='臺北市', town='大安區', px=121.5363, py=25.0297, class1_id=1,
+        )
+
+    def setUp(self):
+        gazetteer_registry.reset()
+        get_gazetteer()
+
+    def form(self, **changes):
+        data = {
+            'name': '華山1914文化創意產業園區', 'tel': '02-2358-1914', 'address': '臺北市中正區八德路一段1號',
+            'region': '臺北市', 'town': '中正區', 'Px': '121.5292', 'Py': '25.0441', 'class': ['1'],
+        }
+        data.update(changes)
+        return data
+
+    def test_whole_form_in_two_queries(self):
+        # 類別一次、名稱 / 電話 / 地址重複一次，縣市由記憶體內的對照表檢查
+        with self.assertNumQueries(2):
+            self.assertEqual(validate_travel(self.form()), {})
+
+    def test_duplicates_after_normalisation(self):
+        errors = validate_travel(self.form(
+            name=' 大安森林公園 ', tel='(02)27003830', address='台北市大安區新生南路二段１號',
+        ))
+        self.assertEqual(errors['name'], "您好，景點名稱已註冊")
+        self.assertEqual(errors['tel'], "您好，此電話已註冊")
+        self.assertEqual(errors['address'], "您好，此地址已註冊")
+
+    def test_edit_excludes_itself(self):
+        own = self.form(name='大安森林公園', tel='02-2700-3830', address='臺北市大安區新生南路二段1號', town='大安區')
+        self.assertEqual(validate_travel(own, travel_id=self.park.travel_id), {})
+        other = Travel.objects.create(
+            travel_name='華山1914', travel_address='臺北市中正區八德路一段1號', region='臺北市', town='中正區', class1_id=1,
+        )
+        self.assertEqual(set(validate_travel(own, travel_id=other.travel_id)), {'name', 'tel', 'address'})
+
+    def test_unknown_class(self):
+        for classes in (['1', '99'], ['x']):
+            self.assertEqual(validate_travel(self.form(**{'class': classes}))['class'], "您好，此類別不存在")
+        self.assertEqual(validate_travel(self.form(**{'class': []}))['class'], "您好，請至少選一個類別")
+
+    def test_views_share_the_rules(self):
+        response = self.client.post('/travel/travelValidate/', {'name': '大安森林公園', 'travel_id': self.park.travel_id})
+        self.assertEqual(response.json()['errors'], {})
+        response = self.client.post('/travel/travelValidate/', {'name': '大安森林公園', 'region': '台北市'})
+        self.assertTrue(response.json()['name_exists'])
+        self.assertEqual(response.json()['errors']['region'], "您好，台請改成臺")
+        for travel_id in ('abc', '1.5', '0'):
+            response = self.client.post('/travel/travelValidate/', {'name': '大安森林公園', 'travel_id': travel_id})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('travel_id', response.json()['error'])
+
+        response = self.client.post('/travel/register01/', self.form(tel='02-2700-3830'))
+        self.assertEqual(response.content.decode(), "您好，此電話已註冊")
+        self.client.post('/travel/register01/', self.form())
+        created = Travel.objects.get(travel_name='華山1914文化創意產業園區')
+        self.assertEqual((created.region_code, created.town_code), (1, 2))
+
+        # 修改時以表單字串寫入經緯度，名稱與自己相同不算重複
+        edit = dict(self.form(name='大安森林公園', town='大安區', Px='121.5364'), tel='', address='')
+        response = self.client.post(f'/travel/edit01/{self.park.travel_id}', edit)
+        self.assertEqual(response.content.decode().strip(), "您好，景點資訊，已修改")
+        self.park.refresh_from_db()
+        self.assertAlmostEqual(float(self.park.px), 121.5364)
+        response = self.client.post(f'/travel/edit01/{self.park.travel_id}', dict(edit, name='華山1914文化創意產業園區'))
+        self.assertEqual(response.content.decode(), "您好，景點名稱已註冊")
+
+
+@unittest.skipIf(faiss is None, '需要 faiss')
+class SemanticSearchTest(SearchIndexTestCase):
+    QUERY = '夜市小吃'
+
+    @classmethod
+    def setUpTestData(cls):
+        for class_id, name in ((1, '自然'), (2, '古蹟'), (3, '夜市')):
+            TravelClass.objects.create(class_id=class_id, class_name=name)
+        Counties.objects.create(name='臺北市')
+        Counties.objects.create(name='新北市')
+        Taiwan.objects.create(region='臺北市', town='大安區')
+        Taiwan.objects.create(region='新北市', town='板橋區')
+        for i in range(1, 41):
+            region, town = (('臺北市', '大安區'), ('新北市', '板橋區'))[i % 2]
+            Travel.objects.create(
+                travel_name=f'景點{i}', travel_txt=f'景點{i} 的介紹', travel_address=f'地址{i}',
+                region=region, town=town, class1_id=i % 3 + 1,
+            )
+        cls.user = get_user_model().objects.create(username='search', email='search@example.com')
+
+    def setUp(self):
+        super().setUp()
+        gazetteer_registry.reset()
+        indexer.rebuild_full()
+        self.client.force_login(self.user)
+
+    def ranking(self):
+        """不篩選時所有景點依相似度排序的 [(相似度, travel_id)]"""
+        similarities, ids = semantic_search.search([self.QUERY], k=40)[0]
+        return list(zip(similarities, ids))
+
+    def query(self, **data):
+        response = self.client.post('/travel/api/query/', dict({'queries': [self.QUERY]}, **data),
+                                    content_type='application/json')
+        return response
+
+    def test_class_filter_searches_the_subset(self):
+        # 篩選在檢索時套用：取回的是類別 2 中最相似的 5 筆，而不是前 5 名再過濾
+        in_class = set(Travel.objects.filter(class1_id=2).values_list('travel_id', flat=True))
+        expected = [travel_id for _, travel_id in self.ranking() if travel_id in in_class][:5]
+        result = self.query(k=5, **{'class': [2]}).json()['results'][0]
+        self.assertEqual(result['document_ids'], expected)
+        self.assertEqual({item['classes'][0]['class_id'] for item in result['items']}, {2})
+
+    def test_region_spelling(self):
+        taipei = set(Travel.objects.filter(region='臺北市').values_list('travel_id', flat=True))
+        self.assertEqual(set(semantic_search.resolve_filter(region='台北市').ids.tolist()), taipei)
+        results = [self.query(k=10, region=region).json()['results'][0]['document_ids'] for region in ('台北市', '臺北市')]
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[0]), 10)
+        self.assertTrue(set(results[0]) <= taipei)
+
+    def test_offset_and_min_score(self):
+        ranking = self.ranking()
+        result = self.query(k=3, offset=2).json()['results'][0]
+        self.assertEqual(result['document_ids'], [travel_id for _, travel_id in ranking[2:5]])
+        threshold = ranking[3][0]
+        result = self.query(k=10, min_score=threshold).json()['results'][0]
+        self.assertEqual(result['document_ids'], [travel_id for _, travel_id in ranking[:4]])
+        self.assertTrue(all(score >= threshold for score in result['similarities']))
+
+    def test_fields_hydrated_in_one_query(self):
+        ids = [travel_id for _, travel_id in self.ranking()[:5]]
+        with self.assertNumQueries(1):
+            travels = _hydrate_travels(set(ids), ['travel_name', 'region', 'not_a_field'])
+        self.assertEqual(set(travels), set(ids))
+        self.assertEqual(set(travels[ids[0]]), {'travel_id', 'travel_name', 'region', 'classes'})
+        item = self.query(k=5, fields='travel_name,tel').json()['results'][0]['items'][0]
+        self.assertEqual(set(item), {'travel_id', 'travel_name', 'tel', 'classes', 'score'})
+
+    def test_bad_parameters(self):
+        for data in ({'k': 0}, {'k': 'x'}, {'k': 51}, {'class': ['abc']}, {'min_score': 'high'}, {'queries': []}):
+            response = self.query(**data)
+            self.assertEqual(response.status_code, 400, data)
+            self.assertIn('error', response.json())
+
+
+@unittest.skipIf(faiss is None, '需要 faiss')
+class FlushPendingTest(SearchIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        self.embedded = []
+        patcher = mock.patch.object(indexer, 'embed_rows', side_effect=self.fake_embed_rows)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        TravelClass.objects.create(class_id=1, class_name='自然')
+        self.travels = [
+            Travel.objects.create(travel_name=f'景點{i}', travel_txt=f'介紹{i}', travel_address=f'地址{i}',
+                                  region='臺北市', town='大安區', class1_id=1)
+            for i in range(5)
+        ]
+        indexer.rebuild_full()
+        self.embedded.clear()
+
+    def fake_embed_rows(self, rows, store=None):
+        self.embedded.append([row[0] for row in rows])
+        return fake_vectors([indexer.document_text(txt, name) for _, txt, name in rows])
+
+    def index_ids(self):
+        index = indexer.load_index(self.index_path)
+        return sorted(faiss.vector_to_array(index.id_map).tolist()), index
+
+    def test_collapses_tasks_and_replaces_vectors(self):
+        edited, deleted, later = self.travels[0], self.travels[1], self.travels[2]
+        self.assertEqual(TravelIndexTask.objects.count(), 0)
+        for text in ('改過一次', '改過兩次'):
+            edited.travel_txt = text
+            edited.save()
+        deleted.delete()
+        created = Travel.objects.create(travel_name='新景點', travel_txt='新介紹', travel_address='新地址',
+                                        region='臺北市', town='大安區', class1_id=1)
+        later.travel_txt = '下一批'
+        later.save()
+
+        # 前 4 筆異動：同一景點的兩次修改只編碼一次，刪除的不編碼；第 5 筆留到下一次
+        result = indexer.flush_pending(limit=4)
+        self.assertEqual((result['upserted'], result['deleted'], result['rebuilt']), (2, 1, False))
+        self.assertEqual(self.embedded, [sorted([edited.travel_id, created.travel_id])])
+        self.assertEqual(list(TravelIndexTask.objects.values_list('travel_id', flat=True)), [later.travel_id])
+
+        ids, index = self.index_ids()
+        expected = sorted({travel.travel_id for travel in self.travels} - {deleted.travel_id} | {created.travel_id})
+        self.assertEqual(ids, expected)
+        self.assertEqual(index.ntotal, len(expected))
+        np.testing.assert_allclose(ann_index.reconstruct(index, edited.travel_id), fake_vectors(['改過兩次'])[0], rtol=1e-6)
+
+        indexer.flush_pending()
+        self.assertEqual(TravelIndexTask.objects.count(), 0)
+        _, index = self.index_ids()
+        np.testing.assert_allclose(ann_index.reconstruct(index, later.travel_id), fake_vectors(['下一批'])[0], rtol=1e-6)
+
+
+@unittest.skipIf(faiss is None, '需要 faiss')
+class NeighborRefreshTest(SearchIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        TravelClass.objects.create(class_id=1, class_name='自然')
+        self.travels = [
+            Travel.objects.create(travel_name=f'景點{i}', travel_txt=f'介紹{i}', travel_address=f'地址{i}',
+                                  region='臺北市', town='大安區', class1_id=1)
+            for i in range(40)
+        ]
+        indexer.rebuild_full()
+        neighbors.refresh_all()
+
+    def table(self):
+        return list(
+            TravelNeighbor.objects.order_by('travel_id', 'rank')
+            .values_list('travel_id', 'rank', 'neighbor_id', 'score')
+        )
+
+    def test_incremental_refresh_matches_full_refresh(self):
+        before = self.table()
+        for travel, text in ((self.travels[3], '改寫3'), (self.travels[17], '改寫17')):
+            travel.travel_txt = text
+            travel.save()
+        self.travels[8].delete()
+        Travel.objects.create(travel_name='新景點', travel_txt='新介紹', travel_address='新地址',
+                              region='臺北市', town='大安區', class1_id=1)
+        changed = indexer.flush_pending()['travel_ids']
+
+        neighbors.refresh_changed(changed)
+        incremental = self.table()
+        self.assertNotEqual(incremental, before)
+        neighbors.refresh_all()
+        self.assertEqual(incremental, self.table())
+        self.assertFalse(TravelNeighbor.objects.filter(travel_id=self.travels[8].travel_id).exists())
+        self.assertFalse(TravelNeighbor.objects.filter(neighbor_id=self.travels[8].travel_id).exists())
+
+
+@unittest.skipIf(faiss is None, '需要 faiss')
+class IndexBuildTest(SearchIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        TravelClass.objects.create(class_id=1, class_name='自然')
+        self.travels = [
+            Travel.objects.create(travel_name=f'景點{i}', travel_txt=f'介紹{i}', travel_address=f'地址{i}',
+                                  region='臺北市', town='大安區', class1_id=1)
+            for i in range(7)
+        ]
+
+    def interrupted_build(self):
+        """每批 3 筆，第三次編碼時中斷：只有第一批完成"""
+        calls = []
+
+        def encode_texts(texts):
+            calls.append(texts)
+            if len(calls) == 3:
+                raise RuntimeError('中斷')
+            return indexer.encode_texts(texts)
+
+        with mock.patch('travel_app.index_build.encode_texts', side_effect=encode_texts):
+            with self.assertRaises(RuntimeError):
+                IndexBuild(chunk_size=3).run()
+        with open(os.path.join(build_dir(self.index_path), 'checkpoint.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def encoded_texts(self):
+        return [text for call in self.encoder.calls for text in call]
+
+    def test_resume_encodes_only_remaining_rows(self):
+        checkpoint = self.interrupted_build()
+        self.assertEqual((checkpoint['chunks'], checkpoint['rows']), (1, 3))
+        self.assertEqual(checkpoint['last_id'], self.travels[2].travel_id)
+
+        self.encoder.calls.clear()
+        stats = IndexBuild(chunk_size=3).run()
+        self.assertEqual(self.encoded_texts(), [f'介紹{i}' for i in range(3, 7)])
+        self.assertEqual((stats['rows'], stats['encoded'], stats['reused'], stats['resumed_from']), (7, 7, 0, 3))
+        self.assertFalse(os.path.exists(build_dir(self.index_path)))
+        self.assertEqual(indexer.load_index(self.index_path).ntotal, 7)
+
+        self.travels[5].travel_txt = '改寫'
+        self.travels[5].save()
+        self.encoder.calls.clear()
+        stats = IndexBuild(chunk_size=3).run(restart=True)
+        self.assertEqual(self.encoded_texts(), ['改寫'])
+        self.assertEqual((stats['rows'], stats['encoded'], stats['reused'], stats['resumed_from']), (7, 1, 6, 0))
+
+    def assert_restarts_with(self, **changes):
+        self.interrupted_build()
+        self.encoder.calls.clear()
+        with override_settings(TRAVEL_SEARCH={**settings.TRAVEL_SEARCH, **changes}):
+            stats = IndexBuild(chunk_size=3).run()
+        self.assertEqual((stats['rows'], stats['resumed_from']), (7, 0))
+        return stats
+
+    def test_index_spec_change_discards_checkpoint(self):
+        stats = self.assert_restarts_with(INDEX_SPEC='HNSW8')
+        # 同一個模型，第一批的向量仍由 embedding store 沿用
+        self.assertEqual((stats['encoded'], stats['reused']), (4, 3))
+        self.assertEqual(self.encoded_texts(), [f'介紹{i}' for i in range(3, 7)])
+
+    def test_model_change_discards_checkpoint(self):
+        stats = self.assert_restarts_with(MODEL_NAME='other-model')
+        self.assertEqual((stats['encoded'], stats['reused']), (7, 0))
+        self.assertEqual(self.encoded_texts(), [f'介紹{i}' for i in range(7)])
+
+
+class KeysetPaginatorTest(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        self.paginator = KeysetPaginator(Travel.objects.all(), 30)
+        key = f'{_query_key("pages", self.paginator.object_list, "travel")}:30'
+        # 5000 筆、travel_id 為 3, 6, 9, ...
+        cache.set(key, (5000, list(range(3, 15001, 90))))
+        self.addCleanup(cache.delete, key)
+
+    def test_pages_seek_from_anchor(self):
+        self.assertEqual(self.paginator.count, 5000)
+        self.assertEqual(self.paginator.num_pages, 167)
+        self.assertFalse(self.paginator.page_queryset(1).query.where.children)
+        query = self.paginator.page_queryset(150).query
+        (lookup,) = query.where.children
+        self.assertEqual((lookup.lhs.target.name, lookup.lookup_name, lookup.rhs), ('travel_id', 'gte', 13413))
+        self.assertIn(13413, query.sql_with_params()[1])
+        # LIMIT 30，沒有 OFFSET
+        self.assertEqual((query.low_mark, query.high_mark), (0, 30))
+
+
+class EmbeddingStoreTest(SimpleTestCase):
+    def test_lookup_by_model_and_text_hash(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = EmbeddingStore('model-a', root=root)
+            store.add([(7, 'a' * 40), (8, 'b' * 40)], np.ones((2, 4), dtype='float32'))
+            store.add([(7, 'c' * 40)], np.full((1, 4), 2, dtype='float32'))
+
+            found = EmbeddingStore('model-a', root=root).lookup([(7, 'c' * 40), (7, 'x' * 40), (8, 'b' * 40)])
+            self.assertEqual(sorted(found), [0, 2])
+            self.assertEqual(found[0].tolist(), [2, 2, 2, 2])
+            self.assertEqual(EmbeddingStore('model-b', root=root).lookup([(8, 'b' * 40)]), {})
+
+            self.assertEqual(store.compact({(7, 'c' * 40)}), 1)
+            self.assertEqual(store.stats()['shards'], 1)
+            self.assertEqual(len(EmbeddingStore('model-a', root=root)), 1)
+
+
+
+class EncoderBackendTest(SimpleTestCase):
+    def test_onnx_backend_requires_export(self):
+        with tempfile.TemporaryDirectory() as path:
+            with self.assertRaises(FileNotFoundError):
+                load_encoder('model-a', backend='onnx-int8', path=path)
+        with self.assertRaises(ValueError):
+            load_encoder('model-a', backend='tflite')
+
+    def test_store_key_depends_on_backend(self):
+        self.assertEqual(encoder_id('model-a'), 'model-a')
+        self.assertNotEqual(encoder_id('model-a', 'onnx-int8'), encoder_id('model-a', 'torch-int8'))
+
+
+
+@unittest.skipIf(faiss is None, '需要 faiss')
+class ReconstructTest(SimpleTestCase):
+    def test_reconstruct_by_travel_id(self):
+        vectors = np.random.default_rng(0).standard_normal((500, 8)).astype('float32')
+        ids = np.arange(1000, 1500, dtype='int64')
+        for spec in ('Flat', 'IVF4,Flat'):
+            index = ann_index.new_index(8, spec, len(vectors))
+            ann_index.train(index, vectors)
+            index.add_with_ids(vectors, ids)
+            np.testing.assert_allclose(ann_index.reconstruct(index, 1042), vectors[42])
+            self.assertIsNone(ann_index.reconstruct(index, 7))
+
+
+@unittest.skipIf(faiss is None, '需要 faiss')
+class IndexSwapTest(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.dir.name, 'vector.index')
+        self.settings = override_settings(TRAVEL_SEARCH={'INDEX_PATH': self.index_path, 'INDEX_MMAP': True})
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.dir.cleanup()
+
+    def write_version(self, rows):
+        index = ann_index.new_index(8)
+        index.add_with_ids(np.random.default_rng(rows).standard_normal((rows, 8)).astype('float32'),
+                           np.arange(rows, dtype='int64'))
+        version = index_versions.next_version(self.index_path)
+        faiss.write_index(index, index_versions.version_path(self.index_path, version))
+        index_versions.write_manifest(self.index_path, version)
+        return version
+
+    def test_swap_waits_for_inflight_searches(self):
+        """切換後舊版本仍可完成進行中的查詢，結束後才釋放"""
+        registry = SearchRegistry()
+        self.write_version(10)
+        self.assertEqual(registry.get_index().ntotal, 10)
+        with registry.index_lease() as old:
+            self.write_version(20)
+            self.assertTrue(registry.reload_index())
+            self.assertEqual(registry.get_index().ntotal, 20)
+            self.assertEqual(old.index.ntotal, 10)
+            self.assertEqual(len(registry.status()['index']['draining']), 1)
+        self.assertIsNone(old.index)
+        self.assertEqual(registry.status()['index']['draining'], [])
+        self.assertFalse(registry.reload_index())
+
+    def test_background_reload(self):
+        registry = SearchRegistry()
+        self.write_version(10)
+        registry.get_index()
+        self.write_version(30)
+        registry._checked_at = -search_registry.RELOAD_CHECK_SECONDS
+        # 偵測到新版本時這次查詢仍使用舊版本，新版本在背景載入
+        self.assertIn(registry.get_index().ntotal, (10, 30))
+        deadline = time.monotonic() + 5
+        while registry.status()['index']['version'] != 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(registry.get_index().ntotal, 30)
+
+    def test_prune_keeps_current_version(self):
+        for rows in (10, 11, 12, 13):
+            self.write_version(rows)
+        self.assertEqual(index_versions.prune_versions(self.index_path, keep=2), [1, 2])
+        self.assertEqual(index_versions.list_versions(self.index_path), [3, 4])
+        self.assertTrue(index_versions.current_index_path(self.index_path).endswith('vector.4.index'))
+
+
+
+class RerankTest(SimpleTestCase):
+    class FakeCrossEncoder:
+        calls = 0
+
+        def predict(self, pairs, **kwargs):
+            self.calls += 1
+            return [len(passage) for _, passage in pairs]
+
+    def rerank(self, model, cache, deadline):
+        return rerank(
+            '景點', [0.9, 0.8, 0.7], [1, 2, 3], 2, deadline,
+            get_passages=lambda ids: {doc_id: 'x' * doc_id for doc_id in ids},
+            get_model=lambda: model, cache=cache, version=0,
+        )
+
+    def test_reorders_within_budget_and_caches_scores(self):
+        model, cache = self.FakeCrossEncoder(), LRUCache(maxsize=10, ttl=60)
+        self.assertEqual(self.rerank(model, cache, time.monotonic() + 10), ([0.7, 0.8], [3, 2], True))
+        # 預算已用完，但分數都在快取中，不需要再呼叫模型
+        self.assertEqual(self.rerank(model, cache, time.monotonic() - 1), ([0.7, 0.8], [3, 2], True))
+        self.assertEqual(model.calls, 1)
+
+    def test_falls_back_to_first_stage_order_when_budget_exceeded(self):
+        model = self.FakeCrossEncoder()
+        self.assertEqual(self.rerank(model, None, time.monotonic() - 1), ([0.9, 0.8], [1, 2], False))
+        self.assertEqual(model.calls, 0)
+
+
+RPC_SERVER_SCRIPT = """
+import sys, time
+from travel_app.search_rpc import make_server
+
+def handler(message):
+    if message.get('op') == 'sleep':
+        time.sleep(message['seconds'])
+    return {'ok': True, 'echo': message}
+
+server = make_server(sys.argv[1], handler)
+print('ready', flush=True)
+server.serve_forever()
+"""
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), '需要 Unix socket')
+class SearchRPCTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.address = 'unix:' + os.path.join(self.directory.name, 'search.sock')
+        self.server = subprocess.Popen(
+            [sys.executable, '-c', RPC_SERVER_SCRIPT, self.address],
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE, text=True,
+        )
+        self.assertEqual(self.server.stdout.readline().strip(), 'ready')
+
+    def tearDown(self):
+        self.server.kill()
+        self.server.wait()
+        self.server.stdout.close()
+        self.directory.cleanup()
+
+    def test_reuses_connection_and_recovers_from_timeout(self):
+        client = RPCClient(self.address, timeout=0.5)
+        self.assertEqual(client.call({'op': 'ping', 'queries': ['金門']})['echo']['queries'], ['金門'])
+        client.call({'op': 'ping'})
+        self.assertEqual(client.connects, 1)
+
+        with self.assertRaises(RPCError):
+            client.call({'op': 'sleep', 'seconds': 2})
+        self.assertTrue(client.call({'op': 'ping'})['ok'])
+        self.assertEqual(client.connects, 2)
+
+    def test_server_down_raises_rpc_error(self):
+        client = RPCClient(self.address, timeout=0.5)
+        client.call({'op': 'ping'})
+        self.server.kill()
+        self.server.wait()
+        start = time.monotonic()
+        with self.assertRaises(RPCError):
+            client.call({'op': 'ping'})
+        self.assertLess(time.monotonic() - start, 2)
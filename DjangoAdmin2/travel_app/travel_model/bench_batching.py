@@ -0,0 +1,71 @@
+import os
+import statistics
+import sys
+import threading
+import time
+
+import django
+
+# 比較「合併請求」開/關時，不同併發數下的吞吐量與延遲
+# 用法：python travel_app/travel_model/bench_batching.py [每個 client 的請求數]
+
+# 專案根目錄（manage.py 所在位置）
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, base_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+django.setup()
+
+from django.test.utils import override_settings  # noqa: E402
+
+from travel_app import search_cache, semantic_search  # noqa: E402
+from travel_app.models import Travel  # noqa: E402
+from travel_app.search_registry import registry  # noqa: E402
+
+requests_per_client = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+concurrency_levels = [1, 8, 32]
+
+# 量測時關閉快取，每個請求都要真的 encode / search
+search_cache.embedding_cache.maxsize = 0
+search_cache.result_cache.maxsize = 0
+
+# 用景點名稱當查詢句子
+queries = list(Travel.objects.order_by('travel_id').values_list('travel_name', flat=True)[:1000])
+registry.warm_up()
+
+
+def run(clients, batching):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset):
+        local = []
+        for i in range(requests_per_client):
+            query = queries[(offset * requests_per_client + i) % len(queries)]
+            start = time.perf_counter()
+            semantic_search.search([query], k=5)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    with override_settings(TRAVEL_SEARCH={'BATCHING': batching}):
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"clients={clients:>2} batching={'on ' if batching else 'off'} "
+        f"QPS={len(latencies) / elapsed:8.1f} "
+        f"p50={statistics.median(latencies) * 1000:7.1f}ms p95={p95 * 1000:7.1f}ms"
+    )
+
+
+for clients in concurrency_levels:
+    run(clients, batching=False)
+    run(clients, batching=True)
+print(f"batcher: {semantic_search.batcher.stats()}")
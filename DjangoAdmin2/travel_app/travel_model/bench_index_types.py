@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+import time
+
+import django
+import numpy as np
+
+# 用現有 vector.index 裡的向量，比較不同索引類型的建置時間、記憶體、延遲與 recall
+# 不需要重新編碼，也不需要載入模型
+# 用法：python travel_app/travel_model/bench_index_types.py [index spec ...]
+
+# 專案根目錄（manage.py 所在位置）
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, base_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+django.setup()
+
+import faiss  # type: ignore # noqa: E402
+
+from travel_app import ann_index  # noqa: E402
+from travel_app.index_versions import current_index_path  # noqa: E402
+from travel_app.search_registry import get_search_settings  # noqa: E402
+
+specs = sys.argv[1:] or ['Flat', 'IVF256,Flat', 'HNSW32', 'IVF,PQ16x8']
+k = 10
+query_count = 200
+config = get_search_settings()
+report_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index_report.json')
+
+# 從 IndexIDMap(IndexFlatIP) 取回所有向量與 doc id
+source = faiss.read_index(current_index_path(config['INDEX_PATH']))
+flat = ann_index.base_index(source)
+if not isinstance(flat, faiss.IndexFlat):
+    sys.exit('請用 Flat 索引當作比較基準')
+vectors = flat.reconstruct_n(0, flat.ntotal)
+ids = faiss.vector_to_array(source.id_map).astype('int64')
+
+# 用既有向量加上雜訊當作查詢
+rng = np.random.default_rng(0)
+sample = rng.choice(len(vectors), size=min(query_count, len(vectors)), replace=False)
+queries = vectors[sample] + rng.normal(scale=0.01, size=vectors[sample].shape).astype('float32')
+_, truth = source.search(queries, k)
+
+report = {'ntotal': int(len(vectors)), 'dims': int(vectors.shape[1]), 'k': k, 'results': []}
+for spec in specs:
+    index = ann_index.new_index(vectors.shape[1], spec, len(vectors))
+    start = time.perf_counter()
+    ann_index.train(index, vectors)
+    index.add_with_ids(vectors, ids)
+    build_seconds = time.perf_counter() - start
+
+    params = ann_index.search_parameters(index, nprobe=config['NPROBE'], ef_search=config['EF_SEARCH'])
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, I = index.search(query.reshape(1, -1), k, params=params)
+        latencies.append(time.perf_counter() - start)
+        found.append(I[0])
+    latencies.sort()
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+
+    result = {
+        'spec': spec,
+        'index': ann_index.describe(index),
+        'build_seconds': round(build_seconds, 3),
+        'memory_bytes': int(faiss.serialize_index(index).nbytes),
+        'latency_ms_p50': round(latencies[len(latencies) // 2] * 1000, 3),
+        'latency_ms_p95': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+        f'recall@{k}': round(float(recall), 4),
+    }
+    report['results'].append(result)
+    print(result)
+
+with open(report_path, 'w', encoding='utf-8') as f:
+    json.dump(report, f, ensure_ascii=False, indent=2)
+print(f"報告已寫入 {report_path}")
@@ -0,0 +1,45 @@
+import os
+import sys
+
+# 列出 gunicorn master 與各 worker 的記憶體用量（只支援 Linux）
+# RSS 會重複計算共用的頁面，PSS 則把共用頁面平均分攤，比較能反映實際總用量
+# 用法：python travel_app/travel_model/rss_report.py <gunicorn master pid>
+
+
+def read_rollup(pid):
+    """從 /proc/<pid>/smaps_rollup 讀出各項記憶體（KB）"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return values
+
+
+def children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+if len(sys.argv) < 2:
+    sys.exit('用法：python rss_report.py <gunicorn master pid>')
+
+master = int(sys.argv[1])
+pids = [master] + children(master)
+fields = ['Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty']
+total = dict.fromkeys(fields, 0)
+
+print(f"{'pid':>8} {'role':>7} " + ' '.join(f'{field:>14}' for field in fields))
+for pid in pids:
+    values = read_rollup(pid)
+    role = 'master' if pid == master else 'worker'
+    print(f'{pid:>8} {role:>7} ' + ' '.join(f'{values.get(field, 0) / 1024:>11.1f} MB' for field in fields))
+    for field in fields:
+        total[field] += values.get(field, 0)
+
+print(f"{'':>8} {'total':>7} " + ' '.join(f'{total[field] / 1024:>11.1f} MB' for field in fields))
+print(f"worker 數：{len(pids) - 1}，INDEX_MMAP 請見 /travel/api/query/readiness/ 的 index.mmap")
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import time
+
+# 量測 manage.py 指令的啟動時間與記憶體，用來比較延遲載入模型前後的差異
+# 用法：python travel_app/travel_model/startup_time.py [次數]
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組
+    resource = None
+
+# 專案根目錄（manage.py 所在位置）
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+# 要量測的指令：check 會載入 URLconf（也就是 travel_app.views）
+commands = [
+    ['check'],
+    ['showmigrations', 'travel_app'],
+]
+
+for command in commands:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, 'manage.py', *command],
+            cwd=base_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+        durations.append(time.perf_counter() - start)
+
+    line = f"manage.py {' '.join(command)}: 平均 {sum(durations) / runs:.2f} 秒，最快 {min(durations):.2f} 秒"
+    if resource is not None:
+        # ru_maxrss 在 Linux 是 KB
+        max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        line += f"，子行程最大 RSS {max_rss:.0f} MB"
+    print(line)
@@ -10,6 +10,8 @@ router.register('travelclass', views.TravelClassViewSet)
 router.register('taiwan', views.TaiwanViewSet)
 router.register('travelfilter', views.TravelFilterViewSet,basename='travelfilter')
 router.register('query', views.QueryViewSet, basename='query')
+router.register('nearby', views.NearbyViewSet, basename='nearby')
+router.register('map', views.MapClusterViewSet, basename='map')
 
 
 app_name='travel'
@@ -38,6 +40,7 @@ urlpatterns = [
     path('travelAddress/', views.travelAddress, name='travelAddress'),
     path('travelRegion/', views.travelRegion, name='travelRegion'),
     path('travelTown/', views.travelTown, name='travelTown'),
+    path('travelValidate/', views.travelValidate, name='travelValidate'),
 
     
 
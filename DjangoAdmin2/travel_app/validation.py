@@ -0,0 +1,117 @@
+"""
+景點表單的驗證
+
+新增 / 修改景點（register01 / edit01）與表單即時檢查（travelValidate）共用同一套規則：
+名稱、電話、地址是否重複以一次彙總查詢（雜湊欄位的索引）檢查，縣市 / 鄉鎮市區由記憶體內的對照表檢查，
+類別是否存在再一次查詢，整份表單最多兩次查詢。
+"""
+from django.db.models import Count, Q
+
+from .dedup import travel_hashes
+from .gazetteer import get_gazetteer
+from .models import Travel, TravelClass
+
+# 臺灣的經緯度範圍
+LNG_RANGE = (121, 125)
+LAT_RANGE = (21, 26)
+
+MAX_CLASSES = 3
+
+
+def class_list(data):
+    """表單中勾選的類別（最多三個）"""
+    values = data.getlist('class') if hasattr(data, 'getlist') else data.get('class') or []
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    return [value for value in values if value not in (None, '')][:MAX_CLASSES]
+
+
+def taken_fields(name=None, tel=None, address=None, exclude_id=None):
+    """
+    名稱 / 電話 / 地址中已被其他景點使用的欄位，以一次查詢檢查；
+    比對的是正規化後的雜湊欄位（有索引），只差在空白或全形字也算重複
+    """
+    hashes = travel_hashes(name, tel, address)
+    values = {'name': hashes['name_hash'], 'tel': hashes['tel_hash'], 'address': hashes['address_hash']}
+    checks = {field: Q(**{f'{field}_hash': value}) for field, value in values.items() if value}
+    if not checks:
+        return set()
+    travels = Travel.objects.all()
+    if exclude_id:
+        travels = travels.exclude(travel_id=exclude_id)
+    condition = Q()
+    for q in checks.values():
+        condition |= q
+    counts = travels.filter(condition).aggregate(
+        **{field: Count('travel_id', filter=q) for field, q in checks.items()}
+    )
+    return {field for field, count in counts.items() if count}
+
+
+def validate_travel(data, travel_id=None, partial=False):
+    """
+    data 為表單（QueryDict 或 dict），欄位與 register01 相同：name, tel, address, region, town, Px, Py, class。
+    travel_id 為修改中的景點，重複檢查時排除自己；partial=True 時只檢查有填的欄位（即時檢查用）。
+    回傳 {欄位: 錯誤訊息}，依原本 register01 的檢查順序排列，沒有錯誤時為空 dict
+    """
+    errors = {}
+    name, tel, address = data.get('name'), data.get('tel'), data.get('address')
+    region, town = data.get('region'), data.get('town')
+    px, py = data.get('Px'), data.get('Py')
+
+    #景點屬性
+    classes = class_list(data)
+    if classes:
+        try:
+            class_ids = {int(class_id) for class_id in classes}
+        except (TypeError, ValueError):
+            class_ids = None
+        if class_ids is None or TravelClass.objects.filter(class_id__in=class_ids).count() != len(class_ids):
+            errors['class'] = "您好，此類別不存在"
+    elif not partial:
+        errors['class'] = "您好，請至少選一個類別"
+
+    #確認景點名稱、電話、地址是否重複
+    if not name and not partial:
+        errors['name'] = "您好，景點名稱不能是空的"
+    taken = taken_fields(name, tel, address, travel_id)
+    if 'name' in taken:
+        errors['name'] = "您好，景點名稱已註冊"
+    if 'tel' in taken:
+        errors['tel'] = "您好，此電話已註冊"
+    if 'address' in taken:
+        errors['address'] = "您好，此地址已註冊"
+
+    #確認縣市
+    gazetteer = get_gazetteer()
+    if not region or not town:
+        if not partial:
+            errors['region'] = "您好，縣市/鄉鎮市(區)欄位不能為空"
+    if region and 'region' not in errors:
+        error = gazetteer.region_error(region)
+        if error:
+            errors['region'] = error
+        elif town:
+            error = gazetteer.town_error(region, town)
+            if error:
+                errors['town'] = error
+
+    #確認經緯度
+    if not px or not py:
+        if not partial:
+            errors['coordinates'] = "您好，經/緯度不能是空的"
+    else:
+        try:
+            px, py = float(px), float(py)
+        except (TypeError, ValueError):
+            errors['coordinates'] = "您好，經/緯度必須是數字"
+        else:
+            if not LNG_RANGE[0] <= px <= LNG_RANGE[1]:
+                errors['coordinates'] = "您好，此經度不再臺灣範圍內"
+            elif not LAT_RANGE[0] <= py <= LAT_RANGE[1]:
+                errors['coordinates'] = "您好，此緯度不再臺灣範圍內"
+    return errors
+
+
+def first_error(errors):
+    return next(iter(errors.values()), None)
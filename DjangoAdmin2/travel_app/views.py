@@ -2,42 +2,40 @@ from django.shortcuts import render, redirect
 from django.db.models import Q
 from django.http import HttpResponse, JsonResponse, FileResponse
 from .models import Travel,Taiwan,Counties,TravelClass
+from .gazetteer import get_gazetteer
+from .validation import class_list, first_error, taken_fields, validate_travel
 from datetime import datetime
 import time
 import json
 from django.core.files.storage import FileSystemStorage
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from rest_framework import viewsets, filters, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.authentication import SessionAuthentication
-from .serializers import TravelSerializers,TravelClassSerializers,TaiwanSerializers,TravelFilterSerializer,CountrySerializers
+from .serializers import TravelSerializers,TravelClassSerializers,TaiwanSerializers,TravelFilterSerializer,CountrySerializers,TravelSearchResultSerializer
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
 # Create your views here.
-from django.core.paginator import Paginator
 from django.shortcuts import render
 from .models import Travel
+from .pagination import CachedCountPaginator, KeysetCursorPagination, KeysetPaginator
 
 #讀取縣市資料
 def region(request):
-    regions = Counties.objects.values('name').distinct()
-    regions = [item['name'] for item in regions]
-    return JsonResponse(regions, safe=False)
+    return JsonResponse(get_gazetteer().regions, safe=False)
 
 # 讀取鄉鎮市區資料
 def town(request, region_name):
-    towns = Taiwan.objects.filter(region=region_name).values('town')
-    towns = [item['town'] for item in towns]
-    return JsonResponse(towns, safe=False)
+    return JsonResponse(get_gazetteer().towns_of(region_name), safe=False)
 
 # 顯示篩選資料
 def show(request, region_name, town_name):
-    travels = Travel.objects.filter(
-        town=town_name,
-        region__in=[region_name.replace('台', '臺'), region_name.replace('臺', '台')]  # 支援「台」和「臺」
-    ).values()
+    # 以縣市 / 鄉鎮市區代碼比對（「台」和「臺」對應到同一個代碼）
+    condition = get_gazetteer().code_filter(region_name, town_name)
+    travels = Travel.objects.filter(condition).values() if condition else []
     return JsonResponse(list(travels), safe=False)
 
 
@@ -55,16 +53,15 @@ def travel_main(request):
             travel_name__icontains=travel_name
         ).order_by('travel_id')  # 使用 travel_id 作為排序依據
     elif town_name and region_name:
-        # 修改 show 函數返回的 QuerySet
-        travels = Travel.objects.filter(
-            town=town_name,
-            region__in=[region_name.replace('台', '臺'), region_name.replace('臺', '台')]
-        ).order_by('travel_id')
+        # 與 show 相同，以縣市 / 鄉鎮市區代碼比對
+        condition = get_gazetteer().code_filter(region_name, town_name)
+        travels = Travel.objects.filter(condition) if condition else Travel.objects.none()
+        travels = travels.order_by('travel_id')
     else:
         travels = Travel.objects.all().order_by('travel_id')
 
-    # 分頁處理
-    paginator = Paginator(travels, per_page)
+    # 分頁處理：以 travel_id 做 keyset 分頁，總筆數與每頁起點快取，任何一頁都不需要 OFFSET
+    paginator = KeysetPaginator(travels, per_page)
     page_obj = paginator.get_page(page_number)
 
     # 自定義分頁邏輯：顯示最多 10 個頁碼按鈕
@@ -105,101 +102,38 @@ def edit(request, id):
 
 #新增資料
 def register01(request):
-    if request.method == 'POST':
-        name = request.POST.get('name')
-        txt = request.POST.get('txt')
-        tel = request.POST.get('tel')
-        address = request.POST.get('address')
-        region = request.POST.get("region")
-        town = request.POST.get('town')
-        linginfo = request.POST.get('linginfo')
-        opentime = request.POST.get('opentime')
-        image1 = request.POST.get('image1')
-        image2 = request.POST.get('image2')
-        image3 = request.POST.get('image3')
-        Px = request.POST.get('Px')
-        Py = request.POST.get('Py')
-        website = request.POST.get('website')
-        tickinfo = request.POST.get('tickinfo')
-        parkinfo = request.POST.get('parkinfo')
-
-        #景點屬性
-        class_list = request.POST.getlist("class")
-        if not class_list:
-            return HttpResponse("您好，請至少選一個類別", 'text/plain')
-        class1=class_list[0]
-        if len(class_list)>=2:
-            class2=class_list[1]
-        else:
-            class2=None
-        if len(class_list)>=3:
-            class3=class_list[2]
-        else:
-            class3=None
-
-    #確認景點名稱
-    if not name:
-       return HttpResponse("您好，景點名稱不能是空的", 'text/plain')
-    if Travel.objects.filter(travel_name=name):
-       return HttpResponse("您好，景點名稱已註冊", 'text/plain')
-
-    #確認景點電話
-    if tel and Travel.objects.filter(tel=tel):
-       return HttpResponse("您好，此電話已註冊", 'text/plain')
-
-    #確認景點地址
-    if address and Travel.objects.filter(travel_address=address):
-       return HttpResponse("您好，此地址已註冊", 'text/plain')
-
-    #確認縣市
-    if not region or not town:
-        return HttpResponse("您好，縣市/鄉鎮市(區)欄位不能為空", 'text/plain')
-
-    if region.startswith('臺') :
-        if not Counties.objects.filter(name__contains=region[1:]):
-            return HttpResponse("您好，此縣市不存在", 'text/plain')
-    elif region.startswith('台'):
-        return HttpResponse("您好，台請改成臺", 'text/plain')
-    elif not Counties.objects.filter(name=region):
-        return HttpResponse("您好，此縣市不存在", 'text/plain')
-
-    if region.startswith('臺'):
-        region_name = region[1:].strip()
-        if not Counties.objects.filter(Q(name__iexact='台' + region_name)).exists():
-            return HttpResponse("您好，此縣市不存在", 'text/plain')
-    elif not Taiwan.objects.filter(region=region,town=town) :
-        return HttpResponse("您好，這縣市，不存在此鄉鎮市", 'text/plain')
-
-    #確認經緯度
-    if not Px or not Py :
-        return HttpResponse("您好，經/緯度不能是空的", 'text/plain')
-    Px=float(Px)
-    if  Px>125 or Px<121:
-        return HttpResponse("您好，此經度不再臺灣範圍內", 'text/plain')
-    Py=float(Py)
-    if  Py>26 or Py<21:
-        return HttpResponse("您好，此緯度不再臺灣範圍內", 'text/plain')
-    
+    if request.method != 'POST':
+        return HttpResponse("您好，請以表單送出", 'text/plain')
+
+    # 與表單即時檢查共用同一套驗證
+    error = first_error(validate_travel(request.POST))
+    if error:
+        return HttpResponse(error, 'text/plain')
+
+    name = request.POST.get('name')
+    #景點屬性
+    class_ids = class_list(request.POST) + [None, None]
+
     Travel.objects.create(
         travel_name = name,
-        travel_txt = txt,
-        tel = tel,
-        travel_address = address,
-        region = region,
-        town = town,
-        travel_linginfo =linginfo,
-        opentime = opentime,
-        image1 = image1,
-        image2 = image2,
-        image3 = image3,
-        px = Px,
-        py = Py,
-        class1_id = class1,
-        class2_id = class2,
-        class3_id = class3,
-        website = website,
-        ticketinfo = tickinfo,
-        parkinginfo = parkinfo,
+        travel_txt = request.POST.get('txt'),
+        tel = request.POST.get('tel'),
+        travel_address = request.POST.get('address'),
+        region = request.POST.get("region"),
+        town = request.POST.get('town'),
+        travel_linginfo = request.POST.get('linginfo'),
+        opentime = request.POST.get('opentime'),
+        image1 = request.POST.get('image1'),
+        image2 = request.POST.get('image2'),
+        image3 = request.POST.get('image3'),
+        px = float(request.POST.get('Px')),
+        py = float(request.POST.get('Py')),
+        class1_id = class_ids[0],
+        class2_id = class_ids[1],
+        class3_id = class_ids[2],
+        website = request.POST.get('website'),
+        ticketinfo = request.POST.get('tickinfo'),
+        parkinginfo = request.POST.get('parkinfo'),
         upload = datetime.now()
     )
     content =  f"您好，景點:{name}，已加入資料庫  "
@@ -208,32 +142,13 @@ def register01(request):
 def edit01(request,id):
     travel = Travel.objects.get(travel_id=id) 
     if request.method == 'POST':
-
-        #確認景點名稱，並輸入
-        if not travel.travel_name:
-            return HttpResponse("您好，景點名稱不能是空的", 'text/plain')
-        if travel.travel_name != request.POST.get('name'):
-            if Travel.objects.filter(travel_name=request.POST.get('name')):
-                return HttpResponse("您好，景點名稱已註冊", 'text/plain')
-            else:
-                travel.travel_name = request.POST.get('name')
-
+        travel.travel_name = request.POST.get('name')
         travel.travel_txt = request.POST.get('txt')
-        
-        #確認景點電話，並輸入
-        if travel.tel != request.POST.get('tel') and  request.POST.get('tel'):
-            if travel.tel and Travel.objects.filter(tel=travel.tel):
-                return HttpResponse("您好，此電話已註冊", 'text/plain')
-            else :
-                travel.tel = request.POST.get('tel')
-
-        #確認景點地址，並輸入
-        if travel.travel_address != request.POST.get('address') and  request.POST.get('address'):
-            if travel.travel_address and Travel.objects.filter(travel_address=travel.travel_address):
-                return HttpResponse("您好，此地址已註冊", 'text/plain')
-            else :
-                travel.travel_address = request.POST.get('address')
-        
+        # 電話、地址沒填時保留原本的資料
+        if request.POST.get('tel'):
+            travel.tel = request.POST.get('tel')
+        if request.POST.get('address'):
+            travel.travel_address = request.POST.get('address')
         travel.region = request.POST.get("region")
         travel.town = request.POST.get('town')
         travel.travel_linginfo = request.POST.get('linginfo')
@@ -247,54 +162,24 @@ def edit01(request,id):
         travel.ticketinfo = request.POST.get('tickinfo')
         travel.parkinginfo = request.POST.get('parkinfo')
 
-        # 景點屬性處理
-        class_list = request.POST.getlist("class")
-        if not class_list:
-            return HttpResponse("您好，請至少選一個類別", 'text/plain')
-        
-        # 先清空所有類別
-        travel.class1 = None
-        travel.class2 = None
-        travel.class3 = None
-
-        # 依序設置類別
-        if len(class_list) >= 1:
-            travel.class1 = TravelClass.objects.get(class_id=class_list[0])
-        if len(class_list) >= 2:
-            travel.class2 = TravelClass.objects.get(class_id=class_list[1])
-        if len(class_list) >= 3:
-            travel.class3 = TravelClass.objects.get(class_id=class_list[2])
-
-            
-    #確認景點縣市
-    if not travel.region or not travel.town:
-        return HttpResponse("您好，縣市/鄉鎮市(區)欄位不能為空", 'text/plain')
-
-    if travel.region.startswith('臺') :
-        region_name = travel.region[1:].strip()
-        if not Counties.objects.filter(Q(name__iexact='台' + region_name)).exists():
-            return HttpResponse("您好，此縣市不存在", 'text/plain')
-    elif travel.region.startswith('台'):
-        return HttpResponse("您好，台請改成臺", 'text/plain')
-    elif not Counties.objects.filter(name=travel.region):
-        return HttpResponse("您好，此縣市不存在", 'text/plain')
-
-    if travel.region.startswith('臺'):
-        if not Taiwan.objects.filter(region__contains=travel.region[1:],town=travel.town):
-            return HttpResponse("您好，這縣市，不存在此鄉鎮市", 'text/plain')
-    elif not Taiwan.objects.filter(region=travel.region,town=travel.town) :
-        return HttpResponse("您好，這縣市，不存在此鄉鎮市", 'text/plain')
-
-    #確認經緯度
-    if not travel.px or not travel.py :
-        return HttpResponse("您好，經/緯度不能是空的", 'text/plain')   
-    Px = float(travel.px)
-    if  Px>125 or Px<121:
-        return HttpResponse("您好，此經度不再臺灣範圍內", 'text/plain')
-    Py=float(travel.py)
-    if  Py>26 or Py<21:
-        return HttpResponse("您好，此緯度不再臺灣範圍內", 'text/plain')
-    
+        # 景點屬性處理：依序設置類別，沒有的清空
+        class_ids = class_list(request.POST) + [None, None]
+        travel.class1_id, travel.class2_id, travel.class3_id = class_ids[:3]
+
+    # 以修改後的內容驗證（排除自己），規則與新增時相同
+    error = first_error(validate_travel({
+        'name': travel.travel_name,
+        'tel': travel.tel,
+        'address': travel.travel_address,
+        'region': travel.region,
+        'town': travel.town,
+        'Px': travel.px,
+        'Py': travel.py,
+        'class': [class_id for class_id in (travel.class1_id, travel.class2_id, travel.class3_id) if class_id],
+    }, travel_id=travel.travel_id))
+    if error:
+        return HttpResponse(error, 'text/plain')
+
     travel.save()
     content =  f"您好，景點資訊，已修改  "
     return HttpResponse(content, 'text/plain')
@@ -318,63 +203,30 @@ def preview(request,id):
         class3 = TravelClass.objects.get(class_id = travel.class3_id)
     else : class3 = None
 
-    return render(request,"travel/preview.html",{'travel': travel,'class1': class1 ,'class2': class2 ,'class3': class3})
+    # 預先算好的相似景點（沒有資料時不顯示）
+    order = {neighbor_id: rank for rank, (_, neighbor_id) in enumerate(neighbors.stored_neighbors(id, 6) or [])}
+    similar = Travel.objects.filter(travel_id__in=order).only('travel_id', 'travel_name', 'region', 'town')
+    similar = sorted(similar, key=lambda item: order[item.travel_id])
+
+    return render(request,"travel/preview.html",{'travel': travel,'class1': class1 ,'class2': class2 ,'class3': class3, 'similar': similar})
 
 
 
 
 #確認景點名稱
 def travelName(request):
-    name = request.GET.get("name")
-    result = {
-        "name_exists": False,
-    }
-
-    if request.GET.get("travel_id"):
-        id = request.GET.get("travel_id")
-        if not Travel.objects.filter(travel_name=name,travel_id=id).exists():
-            if Travel.objects.filter(travel_name=name).exists():
-                result["name_exists"] = True
-    
-    elif Travel.objects.filter(travel_name=name).exists():
-        result["name_exists"] = True
-    return JsonResponse(result, safe=False)
+    taken = taken_fields(name=request.GET.get("name"), exclude_id=request.GET.get("travel_id") or None)
+    return JsonResponse({"name_exists": 'name' in taken}, safe=False)
 
 #確認電話
 def travelTel(request):
-    tel = request.GET.get("tel")
-    result = {
-        "tel_exists": False,
-    }
-
-    if tel:
-        if request.GET.get("travel_id"):
-            id = request.GET.get("travel_id")
-            if not Travel.objects.filter(tel=tel,travel_id=id).exists():
-                if Travel.objects.filter(tel=tel).exists():
-                    result["tel_exists"] = True
-    
-        elif Travel.objects.filter(tel=tel).exists():
-            result["tel_exists"] = True
-    return JsonResponse(result, safe=False)
+    taken = taken_fields(tel=request.GET.get("tel"), exclude_id=request.GET.get("travel_id") or None)
+    return JsonResponse({"tel_exists": 'tel' in taken}, safe=False)
 
 #確認地址
 def travelAddress(request):
-    address = request.GET.get("address")
-    travel_id = request.GET.get("travel_id")
-    result = {
-        "address_exists": False,
-    }
-    if address:
-        if travel_id:
-            if not Travel.objects.filter(travel_address=address, travel_id=travel_id).exists():
-                if Travel.objects.filter(travel_address=address).exists():
-                    result["address_exists"] = True
-        else:  
-            if Travel.objects.filter(travel_address=address).exists():
-                result["address_exists"] = True
-    
-    return JsonResponse(result, safe=False)
+    taken = taken_fields(address=request.GET.get("address"), exclude_id=request.GET.get("travel_id") or None)
+    return JsonResponse({"address_exists": 'address' in taken}, safe=False)
 
 #確認縣市
 def travelRegion(request):
@@ -383,14 +235,9 @@ def travelRegion(request):
         "region_exists": False,
     }
     
-    if region.startswith("台") or region.startswith("臺"):
-        # 判斷以 "台" 或 "臺" 開頭時是否匹配
-        region_name = region[1:].strip()
-        if not (region.startswith("臺") and Counties.objects.filter(Q(name__iexact='台' + region_name)).exists()):
-            result["region_exists"] = True
-    else:
-        if not Counties.objects.filter(name=region).exists():
-            result["region_exists"] = True
+    # region_exists 為 True 表示縣市有誤（以「台」開頭或不存在）
+    if get_gazetteer().region_error(region or ''):
+        result["region_exists"] = True
     
     return JsonResponse(result, safe=False)
 #確認鄉鎮市區
@@ -400,15 +247,30 @@ def travelTown(request):
     result = {
         "town_exists": False,
     }
-    if region.startswith("臺"):
-        region_name = region[1:].strip()
-        if not Taiwan.objects.filter(Q(region__iexact='台' + region_name),town=town).exists():
-            result["town_exists"] = True
-
-    elif not Taiwan.objects.filter(town=town,region=region).exists():
+    if not get_gazetteer().has_town(region, town):
         result["town_exists"] = True
     return JsonResponse(result, safe=False)
 
+#一次檢查整份表單（取代上面五個逐欄檢查的請求）
+def travelValidate(request):
+    """
+    參數與 register01 相同（POST 表單或 GET 參數），修改時加上 travel_id；只檢查有填的欄位。
+    回傳 {valid, errors: {欄位: 錯誤訊息}}，並附上與逐欄檢查相同的 *_exists 旗標
+    """
+    data = request.POST if request.method == 'POST' else request.GET
+    try:
+        travel_id = _optional_int(data.get('travel_id'), 'travel_id', 1, 2 ** 31 - 1)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    errors = validate_travel(data, travel_id=travel_id, partial=True)
+    result = {
+        "valid": not errors,
+        "errors": errors,
+    }
+    for field in ('name', 'tel', 'address', 'region', 'town'):
+        result[f"{field}_exists"] = field in errors
+    return JsonResponse(result, safe=False)
+
 
 from rest_framework import viewsets, filters,status
 from rest_framework.pagination import PageNumberPagination
@@ -416,17 +278,73 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
 
+class TravelCursorPagination(KeysetCursorPagination):
+    ordering = 'travel_id'
+
+class CountyCursorPagination(KeysetCursorPagination):
+    ordering = 'id'
+    version_name = 'gazetteer'
+
+class TaiwanCursorPagination(KeysetCursorPagination):
+    ordering = 'taiwen_id'
+    version_name = 'gazetteer'
+
 class CountryViewSet(viewsets.ModelViewSet):
     queryset = Counties.objects.all()
     serializer_class = CountrySerializers
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = CountyCursorPagination
 
 class TravelViewSet(viewsets.ModelViewSet):
     queryset = Travel.objects.all()
     serializer_class = TravelSerializers
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = TravelCursorPagination
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        相似景點：沒有篩選條件時使用預先算好的 TravelNeighbor，
+        否則以索引中儲存的向量即時檢索（不需要 encoder）
+        """
+        try:
+            travel_id = _optional_int(pk, 'travel_id', 1, 2 ** 31 - 1)
+            k = _optional_int(request.query_params.get('k'), 'k', 1, 50) or 10
+            class_ids = [_optional_int(class_id, 'class', 1, 10 ** 9) for class_id in _list_param(request.query_params.get('class'))]
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not Travel.objects.filter(travel_id=travel_id).exists():
+            return Response({"error": "找不到景點"}, status=status.HTTP_404_NOT_FOUND)
+        region = request.query_params.get('region')
+        town = request.query_params.get('town')
+
+        pairs = None
+        source = 'precomputed'
+        if not (region or town or class_ids):
+            pairs = neighbors.stored_neighbors(travel_id, k)
+        if pairs is None:
+            source = 'index'
+            try:
+                result = search_service.similar(travel_id, k=k, region=region, town=town, class_ids=class_ids)
+            except SearchUnavailable as e:
+                return Response({"error": f"搜尋服務暫時無法使用：{e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            if result is None:
+                return Response({"error": "此景點尚未加入向量索引"}, status=status.HTTP_404_NOT_FOUND)
+            pairs = list(zip(*result))
+
+        travels = _hydrate_travels({neighbor_id for _, neighbor_id in pairs}, _list_param(request.query_params.get('fields')))
+        return Response({
+            "travel_id": travel_id,
+            "source": source,
+            "similarities": [score for score, _ in pairs],
+            "document_ids": [neighbor_id for _, neighbor_id in pairs],
+            "items": [
+                dict(travels[neighbor_id], score=score)
+                for score, neighbor_id in pairs if neighbor_id in travels
+            ],
+        })
 
 class TravelClassViewSet(viewsets.ModelViewSet):
     queryset = TravelClass.objects.all()
@@ -439,10 +357,13 @@ class TaiwanViewSet(viewsets.ModelViewSet):
     serializer_class = TaiwanSerializers
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = TaiwanCursorPagination
 
 class SpotimagesspotPagination(PageNumberPagination):
     page_size=9 # 一頁幾筆資料
     page_size_query_param = 'page_size' # ?page_size=20
+    max_page_size = 100
+    django_paginator_class = CachedCountPaginator # 總筆數快取，景點異動後失效
     def get_paginated_response(self, data):
         return Response({
             'total_page':self.page.paginator.num_pages,
@@ -452,7 +373,7 @@ class SpotimagesspotPagination(PageNumberPagination):
 
 # Create your views here.
 class TravelFilterViewSet(viewsets.ModelViewSet):
-    queryset = Travel.objects.all()
+    queryset = Travel.objects.order_by('travel_id') # 預設排序，分頁結果才會穩定
     serializer_class = TravelFilterSerializer
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
@@ -467,22 +388,67 @@ class TravelFilterViewSet(viewsets.ModelViewSet):
     pagination_class= SpotimagesspotPagination
     
 
-import os
-import faiss # type: ignore
-from sentence_transformers import SentenceTransformer 
-from django.conf import settings
+from .search_registry import SearchUnavailable, get_search_settings
+from .conf import get_travel_settings
+from . import map_clusters, neighbors, search_service, spatial
+from .admission import REJECT_QUEUE_FULL, Rejected, search_gate
+from .analytics import query_log, read_summary, summarize, write_summary
+
+def _optional_float(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} 必須是數字")
+
+
+def _list_param(value):
+    """接受 list 或以逗號分隔的字串"""
+    if value in (None, ''):
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def _hydrate_travels(ids, fields):
+    """以一次查詢取回景點與類別名稱，回傳 {travel_id: 序列化後的資料}"""
+    if not ids:
+        return {}
+    fields = [field for field in fields if field in TravelSearchResultSerializer.ALLOWED_FIELDS]
+    only_fields = set(fields or TravelSearchResultSerializer.DEFAULT_FIELDS) | {'travel_id'}
+    only_fields |= {'class1', 'class2', 'class3', 'class1__class_name', 'class2__class_name', 'class3__class_name'}
+    travels = (
+        Travel.objects.filter(travel_id__in=ids)
+        .select_related('class1', 'class2', 'class3')
+        .only(*only_fields)
+    )
+    serializer = TravelSearchResultSerializer(travels, many=True, fields=fields or None)
+    return {item['travel_id']: item for item in serializer.data}
 
-# 初始化模型和索引
-model_name = 'sentence-transformers/distiluse-base-multilingual-cased-v1'
-bi_encoder = SentenceTransformer(model_name)
 
-# 使用絕對路徑加載索引文件
-index_path = os.path.join(settings.BASE_DIR, 'travel_app/travel_model/vector.index')
+def _optional_int(value, name, minimum, maximum):
+    """選填的整數參數，超出範圍時拋出 ValueError"""
+    if value in (None, ''):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} 必須是整數")
+    if not minimum <= value <= maximum:
+        raise ValueError(f"{name} 必須介於 {minimum} 到 {maximum} 之間")
+    return value
 
-if not os.path.exists(index_path):
-    raise FileNotFoundError(f"索引文件不存在：{index_path}")
 
-index = faiss.read_index(index_path)
+def _optional_bool(value, default):
+    """接受 true/false、1/0、yes/no，沒給時回傳預設值"""
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
 
 class QueryViewSet(viewsets.ViewSet):
     def create(self, request):
@@ -491,24 +457,80 @@ class QueryViewSet(viewsets.ViewSet):
             list_query = request.data.get('queries', [])
             if not list_query or not isinstance(list_query, list):
                 return Response({"error": "請提供有效的查詢句子列表"}, status=status.HTTP_400_BAD_REQUEST)
-            # 將查詢轉換為向量
-            embeddings = bi_encoder.encode(
-                list_query,
-                batch_size=512,
-                show_progress_bar=False,
-                normalize_embeddings=False
-            )
-
-            # 在索引中進行查詢
-            D, I = index.search(embeddings, k=5)
+            max_queries = get_search_settings()['MAX_QUERIES']
+            if len(list_query) > max_queries:
+                return Response({"error": f"每次最多 {max_queries} 句查詢"}, status=status.HTTP_400_BAD_REQUEST)
+
+            # 選填參數：筆數、位移、分數門檻、IVF / HNSW 查詢參數、篩選條件、是否重新排序、輸出欄位
+            try:
+                k = _optional_int(request.data.get('k'), 'k', 1, 50) or 5
+                offset = _optional_int(request.data.get('offset'), 'offset', 0, 200) or 0
+                min_score = _optional_float(request.data.get('min_score'), 'min_score')
+                nprobe = _optional_int(request.data.get('nprobe'), 'nprobe', 1, 4096)
+                ef_search = _optional_int(request.data.get('ef_search'), 'ef_search', 1, 4096)
+                class_ids = [_optional_int(class_id, 'class', 1, 10 ** 9) for class_id in _list_param(request.data.get('class'))]
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            fields = _list_param(request.data.get('fields'))
+            rerank = _optional_bool(request.data.get('rerank'), get_search_settings()['RERANK_ENABLED'])
+
+            # 在本行程或獨立的搜尋服務中查詢（依 SERVER_ADDRESS）；相同查詢直接使用快取
+            # 同時執行的搜尋數有上限，滿載時立即拒絕，不佔住 worker 的執行緒
+            try:
+                with search_gate.admit():
+                    search_start = time.perf_counter()
+                    search_results = search_service.search(
+                        list_query,
+                        k=k + offset,
+                        nprobe=nprobe,
+                        ef_search=ef_search,
+                        region=request.data.get('region'),
+                        town=request.data.get('town'),
+                        class_ids=class_ids,
+                        rerank=rerank,
+                    )
+            except Rejected as e:
+                code = status.HTTP_429_TOO_MANY_REQUESTS if e.reason == REJECT_QUEUE_FULL else status.HTTP_503_SERVICE_UNAVAILABLE
+                return Response(
+                    {"error": "搜尋請求過多，請稍後再試"}, status=code, headers={'Retry-After': str(e.retry_after)}
+                )
+            except SearchUnavailable as e:
+                return Response({"error": f"搜尋服務暫時無法使用：{e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            latency_ms = (time.perf_counter() - search_start) * 1000
+
+            # 記錄查詢（參數與送出的搜尋相同，預熱時才會命中同一個快取）
+            if get_search_settings()['QUERY_LOG_ENABLED']:
+                for query, (similarities, document_ids, _) in zip(list_query, search_results):
+                    query_log.append(
+                        query, (similarities, document_ids), latency_ms,
+                        k=k + offset, nprobe=nprobe, ef_search=ef_search,
+                        region=request.data.get('region'), town=request.data.get('town'),
+                        class_ids=class_ids, rerank=rerank,
+                    )
+
+            # 套用分數門檻與位移（分數門檻看的是 FAISS 的相似度）
+            pages = []
+            for similarities, document_ids, _ in search_results:
+                pairs = list(zip(similarities, document_ids))
+                if min_score is not None:
+                    pairs = [pair for pair in pairs if pair[0] >= min_score]
+                pages.append(pairs[offset:offset + k])
+
+            # 所有查詢的景點一次取回
+            travels = _hydrate_travels({travel_id for pairs in pages for _, travel_id in pairs}, fields)
 
             # 將結果轉換為可讀格式
             results = []
-            for i in range(len(list_query)):
+            for query, pairs, (_, _, reranked) in zip(list_query, pages, search_results):
                 results.append({
-                    "query": list_query[i],
-                    "similarities": D[i].tolist(),
-                    "document_ids": I[i].tolist()
+                    "query": query,
+                    "reranked": reranked,
+                    "similarities": [score for score, _ in pairs],
+                    "document_ids": [travel_id for _, travel_id in pairs],
+                    "items": [
+                        dict(travels[travel_id], score=score)
+                        for score, travel_id in pairs if travel_id in travels
+                    ],
                 })
 
             return Response({"results": results}, status=status.HTTP_200_OK)
@@ -516,6 +538,150 @@ class QueryViewSet(viewsets.ViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'])
+    def readiness(self, request):
+        """
+        搜尋服務的 readiness 檢查：尚未載入仍視為可用，索引不存在、載入失敗或連不上搜尋服務時回傳 503
+        """
+        data = search_service.status()
+        code = status.HTTP_503_SERVICE_UNAVAILABLE if data['degraded'] else status.HTTP_200_OK
+        return Response(data, status=code)
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        查詢向量 / 搜尋結果快取的命中統計，以及本 worker 的准入控制（排隊數、等待時間、拒絕數）
+        """
+        try:
+            data = search_service.stats()
+            data['admission'] = search_gate.stats()
+            return Response(data)
+        except SearchUnavailable as e:
+            return Response({"error": f"搜尋服務暫時無法使用：{e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def analytics(self, request):
+        """
+        管理員：熱門查詢、分數偏低的查詢（search_analytics 指令產生的彙整，refresh=true 時重新彙整），
+        本 worker 最近的熱門查詢與快取命中率
+        """
+        summary = None if _optional_bool(request.query_params.get('refresh'), False) else read_summary()
+        if summary is None:
+            summary = summarize()
+            write_summary(summary)
+        try:
+            cache = search_service.stats()['cache']
+        except SearchUnavailable:
+            cache = None
+        return Response({
+            'summary': {key: value for key, value in summary.items() if key != 'top_requests'},
+            'recent': query_log.stats(),
+            'cache': cache,
+        })
+
+    @action(detail=False, methods=['post'], url_path='reload-index', permission_classes=[IsAdminUser])
+    def reload_index(self, request):
+        """
+        管理員：立即切換到最新版本的索引（背景檢查每隔幾秒也會自動切換）。
+        在本行程查詢時只切換處理這個請求的 worker，其他 worker 由定期檢查切換
+        """
+        try:
+            swapped, index_status = search_service.reload_index()
+        except SearchUnavailable as e:
+            return Response({"error": f"搜尋服務暫時無法使用：{e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"swapped": swapped, "index": index_status})
+
+class NearbyPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'total_page': self.page.paginator.num_pages,
+            'current_page': self.page.number,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class NearbyViewSet(viewsets.ViewSet):
+    """
+    附近景點：?lat=&lng=&radius=（公里，預設 3）&class=，依距離由近到遠分頁
+    以記憶體內的空間索引計算，不需要掃描整張 travel 表
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    pagination_class = NearbyPagination
+
+    def list(self, request):
+        try:
+            lat = _optional_float(request.query_params.get('lat'), 'lat')
+            lng = _optional_float(request.query_params.get('lng'), 'lng')
+            radius = _optional_float(request.query_params.get('radius'), 'radius')
+            class_ids = [_optional_int(class_id, 'class', 1, 10 ** 9) for class_id in _list_param(request.query_params.get('class'))]
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if lat is None or lng is None or not spatial.valid_coordinate(lat, lng):
+            return Response({"error": "請提供有效的 lat / lng"}, status=status.HTTP_400_BAD_REQUEST)
+        max_radius = get_travel_settings()['NEARBY_MAX_RADIUS_KM']
+        radius = 3.0 if radius is None else radius
+        if not 0 < radius <= max_radius:
+            return Response({"error": f"radius 必須介於 0 到 {max_radius} 公里之間"}, status=status.HTTP_400_BAD_REQUEST)
+
+        pairs = spatial.nearby(lat, lng, radius, class_ids)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(pairs, request, view=self)
+        # 只取回這一頁的景點資料
+        travels = _hydrate_travels({travel_id for _, travel_id in page}, _list_param(request.query_params.get('fields')))
+        return paginator.get_paginated_response([
+            dict(travels[travel_id], distance_km=round(distance, 3))
+            for distance, travel_id in page if travel_id in travels
+        ])
+
+class MapClusterViewSet(viewsets.ViewSet):
+    """
+    地圖標記：?bbox=west,south,east,north&zoom=&class=
+    回傳涵蓋 bbox 的圖磚內預先聚合的群集；縮放層級達 MAP_POINTS_ZOOM 才回傳個別景點。
+    座標為乘上 coord_scale 的整數，群集與景點以陣列表示，欄位順序見 format
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        try:
+            zoom = _optional_int(request.query_params.get('zoom'), 'zoom', 0, 22)
+            bbox = [_optional_float(value, 'bbox') for value in _list_param(request.query_params.get('bbox'))]
+            class_ids = [_optional_int(class_id, 'class', 1, 10 ** 9) for class_id in _list_param(request.query_params.get('class'))]
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if zoom is None or len(bbox) != 4:
+            return Response({"error": "請提供 zoom 與 bbox=west,south,east,north"}, status=status.HTTP_400_BAD_REQUEST)
+        west, south, east, north = bbox
+        if not (spatial.valid_coordinate(south, west) and spatial.valid_coordinate(north, east)) or west > east or south > north:
+            return Response({"error": "bbox 範圍不正確"}, status=status.HTTP_400_BAD_REQUEST)
+
+        config = get_travel_settings()
+        x0, y0, x1, y1 = map_clusters.tile_range(zoom, west, south, east, north)
+        tiles = [(tx, ty) for ty in range(y0, y1 + 1) for tx in range(x0, x1 + 1)]
+        if len(tiles) > config['MAP_MAX_TILES']:
+            return Response({"error": "bbox 在這個縮放層級涵蓋的範圍太大"}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = map_clusters.cluster_registry.tiles(zoom, tiles, class_ids)
+        return Response({
+            "zoom": zoom,
+            "format": {
+                "coord_scale": map_clusters.COORD_SCALE,
+                "cluster": ["lat", "lng", "count", "representative_ids"],
+                "point": ["travel_id", "lat", "lng", "class1"],
+            },
+            "revision": data['revision'],
+            "clusters": data['clusters'],
+            "points": data['points'],
+        })
+
 def api_test(request):
     """
     顯示API測試頁面
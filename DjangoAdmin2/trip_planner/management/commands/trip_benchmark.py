@@ -0,0 +1,87 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from trip_planner import optimizer
+from trip_planner.planner import DEFAULT_BUDGET_MS, load_points, matrix_cache, stop_matrix
+from travel_app.models import Travel
+
+# 台灣本島的大致範圍 (lat, lng)
+TAIWAN_BOUNDS = ((21.9, 120.1), (25.3, 122.0))
+
+# 精確解只在這個規模以下計算
+HELD_KARP_MAX = 12
+
+
+def _sample_points(n, rng, from_db):
+    if from_db:
+        ids = list(Travel.objects.filter(px__isnull=False, py__isnull=False).values_list('travel_id', flat=True))
+        if len(ids) < n:
+            return None
+        return load_points(rng.choice(ids, n, replace=False).tolist())
+    (south, west), (north, east) = TAIWAN_BOUNDS
+    lats, lngs = rng.uniform(south, north, n), rng.uniform(west, east, n)
+    # 合成資料用負數當 id，不會和真實景點的快取鍵重複
+    return [(-(i + 1), float(lat), float(lng)) for i, (lat, lng) in enumerate(zip(lats, lngs))]
+
+
+class Command(BaseCommand):
+    help = '行程排序基準測試：比較最近鄰與 2-opt / Or-opt 改善後的距離、耗時與距離矩陣快取'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,50,200', help='景點數，以逗號分隔')
+        parser.add_argument('--trials', type=int, default=5, help='每種規模重複次數')
+        parser.add_argument('--budget-ms', type=int, default=DEFAULT_BUDGET_MS, help='改善的時間預算（毫秒）')
+        parser.add_argument('--from-db', action='store_true', help='從資料庫隨機抽樣景點，而不是合成座標')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='結果 JSON 的輸出路徑')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        budget = options['budget_ms'] / 1000
+        report = {'budget_ms': options['budget_ms'], 'source': 'db' if options['from_db'] else 'synthetic', 'sizes': []}
+        for n in [int(size) for size in options['sizes'].split(',') if size.strip()]:
+            rows = []
+            for _ in range(options['trials']):
+                points = _sample_points(n, rng, options['from_db'])
+                if points is None:
+                    self.stdout.write(self.style.WARNING(f'具有座標的景點不足 {n} 個，略過'))
+                    break
+                matrix_cache.clear()
+                start = time.perf_counter()
+                D, _ = stop_matrix(points)
+                cold_ms = (time.perf_counter() - start) * 1000
+                start = time.perf_counter()
+                stop_matrix(points)
+                cached_ms = (time.perf_counter() - start) * 1000
+
+                route, stats = optimizer.optimize(D, 0, False, budget)
+                row = {
+                    'matrix_cold_ms': cold_ms,
+                    'matrix_cached_ms': cached_ms,
+                    'nearest_neighbor_km': stats['initial_km'],
+                    'optimized_km': stats['optimized_km'],
+                    'improvement': stats['improvement'],
+                    'optimize_ms': stats['elapsed_ms'],
+                    'converged': stats['converged'],
+                }
+                if n <= HELD_KARP_MAX:
+                    exact = optimizer.held_karp(D)
+                    row['optimal_gap'] = (stats['optimized_km'] - exact) / exact if exact else 0.0
+                rows.append(row)
+            if not rows:
+                continue
+            summary = {'stops': n, 'trials': len(rows)}
+            for name in rows[0]:
+                values = [row[name] for row in rows]
+                summary[name] = sum(values) / len(values) if name != 'converged' else all(values)
+            summary['optimize_ms_max'] = max(row['optimize_ms'] for row in rows)
+            report['sizes'].append(summary)
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text)
+        self.stdout.write(text)
@@ -0,0 +1,223 @@
+"""
+行程排序的啟發式演算法（只用 NumPy，不依賴 Django）
+
+路線以距離矩陣 D 上的節點順序表示，route[0] 固定為出發點：
+    1. nearest_neighbor() 產生初始路線
+    2. 在時間預算內交替執行 2-opt（反轉一段）與 Or-opt（把 1~3 個連續景點移到別處），
+       直到沒有可改善的移動
+    3. split_days() 把排好的路線切成多天，使每天的時間（停留 + 交通）盡量平均
+closed=True 時最後要回到出發點。
+"""
+import math
+import time
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# 浮點誤差以內的改善不算
+EPSILON = 1e-9
+
+OR_OPT_SEGMENTS = (1, 2, 3)
+
+
+def distance_matrix(lats, lngs):
+    """所有點兩兩之間的大圓距離（公里）"""
+    lats = np.radians(np.asarray(lats, dtype='float64'))
+    lngs = np.radians(np.asarray(lngs, dtype='float64'))
+    dlat = lats[:, None] - lats[None, :]
+    dlng = lngs[:, None] - lngs[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lats)[:, None] * np.cos(lats)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def route_length(D, route, closed=False):
+    route = np.asarray(route)
+    length = float(D[route[:-1], route[1:]].sum())
+    if closed and len(route) > 1:
+        length += float(D[route[-1], route[0]])
+    return length
+
+
+def nearest_neighbor(D, start=0):
+    """從 start 出發，每次走到最近的未造訪點"""
+    n = len(D)
+    visited = np.zeros(n, dtype=bool)
+    route = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        distances = np.where(visited, np.inf, D[route[-1]])
+        nxt = int(np.argmin(distances))
+        route.append(nxt)
+        visited[nxt] = True
+    return np.array(route, dtype='int64')
+
+
+def two_opt_pass(D, route, closed, deadline):
+    """一輪 2-opt：對每個 i 找出最好的 j 並反轉 route[i..j]；回傳是否有改善"""
+    n = len(route)
+    improved = False
+    for i in range(1, n - 1):
+        if time.perf_counter() >= deadline:
+            break
+        a, b = route[i - 1], route[i]
+        cs = route[i + 1:]
+        ds = np.append(route[i + 2:], route[0])
+        head, tail = D[b, ds], D[cs, ds]
+        if not closed:
+            # 開放路線反轉到最後一個點時，後面沒有下一個點
+            head[-1] = tail[-1] = 0.0
+        delta = D[a, cs] + head - D[a, b] - tail
+        j = int(np.argmin(delta))
+        if delta[j] < -EPSILON:
+            route[i:i + j + 2] = route[i:i + j + 2][::-1]
+            improved = True
+    return improved
+
+
+def or_opt_pass(D, route, closed, deadline):
+    """一輪 Or-opt：把長度 1~3 的連續片段（可反向）移到最省距離的位置；回傳是否有改善"""
+    n = len(route)
+    improved = False
+    for length in OR_OPT_SEGMENTS:
+        i = 1
+        while i + length <= n:
+            if time.perf_counter() >= deadline:
+                return improved
+            first, last = route[i], route[i + length - 1]
+            prev = route[i - 1]
+            nxt = route[i + length] if i + length < n else (route[0] if closed else None)
+            removed_gain = D[prev, first] - (0.0 if nxt is None else D[prev, nxt] - D[last, nxt])
+
+            rest = np.concatenate((route[:i], route[i + length:]))
+            ps = rest
+            qs = np.append(rest[1:], rest[0])
+            open_end = np.zeros(len(rest), dtype=bool)
+            if not closed:
+                open_end[-1] = True
+            base = np.where(open_end, 0.0, D[ps, qs])
+            forward = D[ps, first] + np.where(open_end, 0.0, D[last, qs]) - base
+            backward = D[ps, last] + np.where(open_end, 0.0, D[first, qs]) - base
+            # 插回原位置等於沒動
+            forward[i - 1] = backward[i - 1] = np.inf
+            k_forward, k_backward = int(np.argmin(forward)), int(np.argmin(backward))
+            reverse = backward[k_backward] < forward[k_forward]
+            k = k_backward if reverse else k_forward
+            cost = backward[k] if reverse else forward[k]
+            if cost < removed_gain - EPSILON:
+                segment = route[i:i + length][::-1] if reverse else route[i:i + length]
+                route[:] = np.concatenate((rest[:k + 1], segment, rest[k + 1:]))
+                improved = True
+            else:
+                i += 1
+    return improved
+
+
+def optimize(D, start=0, closed=False, time_budget=0.3):
+    """
+    回傳 (路線, 統計)。在 time_budget 秒內反覆改善，時間到就回傳目前最好的路線
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget
+    n = len(D)
+    route = nearest_neighbor(D, start)
+    initial = route_length(D, route, closed)
+    rounds = 0
+    if n > 3:
+        while time.perf_counter() < deadline:
+            rounds += 1
+            improved = two_opt_pass(D, route, closed, deadline)
+            improved = or_opt_pass(D, route, closed, deadline) or improved
+            if not improved:
+                break
+    final = route_length(D, route, closed)
+    return route, {
+        'initial_km': initial,
+        'optimized_km': final,
+        'improvement': (initial - final) / initial if initial else 0.0,
+        'rounds': rounds,
+        'converged': time.perf_counter() < deadline,
+        'elapsed_ms': (time.perf_counter() - started) * 1000,
+    }
+
+
+def _day_cost(legs, visit_minutes, speed_kmh, start, end):
+    """route[start:end] 的時間（分鐘）：停留時間加上區間內的交通時間"""
+    return visit_minutes * (end - start) + legs[start:end - 1].sum() / speed_kmh * 60
+
+
+def split_days(D, route, days=None, day_minutes=None, visit_minutes=60, speed_kmh=40, skip_first=False):
+    """
+    把路線切成連續的幾天，回傳每一天在 route 中的 (start, end)。
+    days：切成固定天數並讓最長的一天盡量短；day_minutes：每天的時間上限，天數依需要增加。
+    skip_first=True 表示 route[0] 是出發點而不是景點
+    """
+    offset = 1 if skip_first else 0
+    stops = len(route) - offset
+    if stops <= 0:
+        return []
+    legs = D[route[offset:-1], route[offset + 1:]] if stops > 1 else np.zeros(0)
+    legs = np.append(legs, 0.0)
+
+    def greedy(limit):
+        parts, start = [], 0
+        while start < stops:
+            end = start + 1
+            while end < stops and _day_cost(legs, visit_minutes, speed_kmh, start, end + 1) <= limit:
+                end += 1
+            parts.append((start, end))
+            start = end
+        return parts
+
+    if days:
+        days = min(days, stops)
+        low = visit_minutes
+        high = _day_cost(legs, visit_minutes, speed_kmh, 0, stops)
+        # 二分搜尋最小的「每天上限」，使貪婪切分不超過 days 天
+        for _ in range(50):
+            middle = (low + high) / 2
+            if len(greedy(middle)) <= days:
+                high = middle
+            else:
+                low = middle
+        parts = greedy(high)
+    elif day_minutes:
+        parts = greedy(day_minutes)
+    else:
+        parts = [(0, stops)]
+    return [(start + offset, end + offset) for start, end in parts]
+
+
+def day_summary(D, route, parts, visit_minutes=60, speed_kmh=40):
+    summary = []
+    for start, end in parts:
+        segment = route[start:end]
+        distance = route_length(D, segment) if len(segment) > 1 else 0.0
+        summary.append({
+            'nodes': segment.tolist(),
+            'distance_km': distance,
+            'minutes': visit_minutes * len(segment) + distance / speed_kmh * 60,
+        })
+    return summary
+
+
+def held_karp(D, start=0):
+    """開放路線（固定起點）的精確解，O(2^n n^2)，只給基準測試在小規模時比較用"""
+    n = len(D)
+    others = [node for node in range(n) if node != start]
+    m = len(others)
+    full = (1 << m) - 1
+    cost = np.full((1 << m, m), math.inf)
+    for j, node in enumerate(others):
+        cost[1 << j, j] = D[start, node]
+    for mask in range(1, 1 << m):
+        for j in range(m):
+            if not mask & (1 << j) or cost[mask, j] == math.inf:
+                continue
+            for k in range(m):
+                if mask & (1 << k):
+                    continue
+                value = cost[mask, j] + D[others[j], others[k]]
+                if value < cost[mask | (1 << k), k]:
+                    cost[mask | (1 << k), k] = value
+    return float(cost[full].min())
@@ -0,0 +1,138 @@
+"""
+行程規劃：取得景點座標 -> 距離矩陣 -> optimizer 排序 -> 切成多天
+
+距離矩陣只和景點集合有關，依排序後的 travel_id 組合（加上景點資料版本）快取，
+同一組景點換出發點、天數或時間預算重新規劃時不必重算。
+出發點到各景點的距離每次另外計算，接在快取的矩陣前面成為第 0 個節點；
+沒有出發點時第 0 個節點是到每個景點距離都為 0 的虛擬起點，讓演算法自己決定第一站。
+"""
+import time
+
+import numpy as np
+
+from travel_app.cache_version import get_version
+from travel_app.models import Travel
+from travel_app.search_cache import LRUCache
+from travel_app.spatial import haversine_km, nearby, valid_coordinate
+
+from . import optimizer
+
+# 一次規劃的景點數上限（矩陣為 n^2，2-opt 一輪為 n^2）
+MAX_STOPS = 200
+
+DEFAULT_BUDGET_MS = 300
+MAX_BUDGET_MS = 2000
+
+# 以出發點 + 類別挑選景點時的預設值
+DEFAULT_RADIUS_KM = 10.0
+DEFAULT_LIMIT = 10
+
+matrix_cache = LRUCache(256, 3600)
+
+
+class PlanError(ValueError):
+    """規劃參數不正確，或找不到可以排序的景點"""
+
+
+def load_points(travel_ids):
+    """依 travel_id 排序的 [(travel_id, lat, lng)]；沒有座標的景點不會出現"""
+    rows = Travel.objects.filter(travel_id__in=travel_ids, px__isnull=False, py__isnull=False).values_list(
+        'travel_id', 'py', 'px'
+    )
+    points = [(travel_id, float(lat), float(lng)) for travel_id, lat, lng in rows if valid_coordinate(lat, lng)]
+    return sorted(points)
+
+
+def stop_matrix(points):
+    """景點之間的距離矩陣，回傳 (矩陣, 是否命中快取)"""
+    key = (get_version('travel'), tuple(travel_id for travel_id, _, _ in points))
+    matrix = matrix_cache.get(key)
+    if matrix is not None:
+        return matrix, True
+    matrix = optimizer.distance_matrix([lat for _, lat, _ in points], [lng for _, _, lng in points])
+    # 快取的矩陣會被多個請求共用，設為唯讀避免被意外修改
+    matrix.flags.writeable = False
+    matrix_cache.set(key, matrix)
+    return matrix, False
+
+
+def pick_stops(lat, lng, class_ids=None, radius_km=DEFAULT_RADIUS_KM, limit=DEFAULT_LIMIT):
+    """出發點附近符合類別的景點，由近到遠取 limit 個"""
+    return [travel_id for _, travel_id in nearby(lat, lng, radius_km, class_ids)[:limit]]
+
+
+def plan(travel_ids=None, start=None, class_ids=None, radius_km=DEFAULT_RADIUS_KM, limit=DEFAULT_LIMIT,
+         days=None, day_hours=None, visit_minutes=60, speed_kmh=40, return_to_start=False,
+         time_budget_ms=DEFAULT_BUDGET_MS):
+    """
+    travel_ids 與 start (lat, lng) 至少給一個；只給 start 時依 class_ids 在 radius_km 內挑景點。
+    days（固定天數）與 day_hours（每天時數上限）擇一。
+    回傳排好的順序、每天的行程與距離統計
+    """
+    started = time.perf_counter()
+    if start is not None and not valid_coordinate(*start):
+        raise PlanError('出發點座標不正確')
+    if not travel_ids:
+        if start is None:
+            raise PlanError('請提供 travel_ids 或出發點')
+        travel_ids = pick_stops(start[0], start[1], class_ids, radius_km, min(limit, MAX_STOPS))
+    travel_ids = list(dict.fromkeys(travel_ids))
+    if len(travel_ids) > MAX_STOPS:
+        raise PlanError(f'景點最多 {MAX_STOPS} 個')
+    if return_to_start and start is None:
+        raise PlanError('要回到出發點時必須提供出發點')
+    if days and day_hours:
+        raise PlanError('days 與 day_hours 只能擇一')
+
+    points = load_points(travel_ids)
+    if not points:
+        raise PlanError('沒有任何具有座標的景點')
+    ids = [travel_id for travel_id, _, _ in points]
+    stops, cached = stop_matrix(points)
+
+    n = len(points)
+    D = np.zeros((n + 1, n + 1))
+    D[1:, 1:] = stops
+    if start is not None:
+        from_start = haversine_km(start[0], start[1], np.array([lat for _, lat, _ in points]),
+                                  np.array([lng for _, _, lng in points]))
+        D[0, 1:] = D[1:, 0] = from_start
+    closed = bool(return_to_start)
+    matrix_ms = (time.perf_counter() - started) * 1000
+
+    budget = min(max(time_budget_ms, 0), MAX_BUDGET_MS) / 1000
+    route, stats = optimizer.optimize(D, 0, closed, budget)
+    day_minutes = day_hours * 60 if day_hours else None
+    parts = optimizer.split_days(D, route, days, day_minutes, visit_minutes, speed_kmh, skip_first=True)
+
+    itinerary = []
+    for number, (part, summary) in enumerate(
+        zip(parts, optimizer.day_summary(D, route, parts, visit_minutes, speed_kmh)), start=1
+    ):
+        # 前一天最後一站（或出發點）到這一天第一站的距離；沒有出發點時第一天為 0
+        approach = float(D[route[part[0] - 1], route[part[0]]])
+        itinerary.append({
+            'day': number,
+            'travel_ids': [ids[node - 1] for node in summary['nodes']],
+            'approach_km': round(approach, 3),
+            'distance_km': round(summary['distance_km'], 3),
+            'minutes': round(summary['minutes'] + approach / speed_kmh * 60),
+        })
+
+    return {
+        'order': [ids[node - 1] for node in route[1:]],
+        'days': itinerary,
+        'distance_km': round(stats['optimized_km'], 3),
+        'initial_distance_km': round(stats['initial_km'], 3),
+        'return_km': round(float(D[route[-1], 0]), 3) if closed else None,
+        'missing': sorted(set(travel_ids) - set(ids)),
+        'stats': {
+            'stops': n,
+            'improvement': round(stats['improvement'], 4),
+            'rounds': stats['rounds'],
+            'converged': stats['converged'],
+            'matrix_cached': cached,
+            'matrix_ms': round(matrix_ms, 2),
+            'optimize_ms': round(stats['elapsed_ms'], 2),
+        },
+    }
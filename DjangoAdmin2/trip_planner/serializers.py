@@ -0,0 +1,30 @@
+from rest_framework import serializers
+
+from .planner import DEFAULT_BUDGET_MS, DEFAULT_LIMIT, DEFAULT_RADIUS_KM, MAX_BUDGET_MS, MAX_STOPS
+
+
+class TripPlanSerializer(serializers.Serializer):
+    """行程規劃的參數：travel_ids 或出發點（可加類別）擇一"""
+    travel_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                       max_length=MAX_STOPS)
+    start_lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    start_lng = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    class_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    radius_km = serializers.FloatField(required=False, min_value=0.1, max_value=50, default=DEFAULT_RADIUS_KM)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=MAX_STOPS, default=DEFAULT_LIMIT)
+    days = serializers.IntegerField(required=False, min_value=1, max_value=30)
+    day_hours = serializers.FloatField(required=False, min_value=1, max_value=24)
+    visit_minutes = serializers.IntegerField(required=False, min_value=0, max_value=600, default=60)
+    speed_kmh = serializers.FloatField(required=False, min_value=1, max_value=200, default=40)
+    return_to_start = serializers.BooleanField(required=False, default=False)
+    time_budget_ms = serializers.IntegerField(required=False, min_value=0, max_value=MAX_BUDGET_MS,
+                                              default=DEFAULT_BUDGET_MS)
+
+    def validate(self, data):
+        if ('start_lat' in data) != ('start_lng' in data):
+            raise serializers.ValidationError('start_lat 與 start_lng 必須同時提供')
+        if not data.get('travel_ids') and 'start_lat' not in data:
+            raise serializers.ValidationError('請提供 travel_ids 或出發點')
+        if 'days' in data and 'day_hours' in data:
+            raise serializers.ValidationError('days 與 day_hours 只能擇一')
+        return data
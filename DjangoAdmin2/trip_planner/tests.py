@@ -0,0 +1,111 @@
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+
+from travel_app.models import Travel, TravelClass
+from travel_app.spatial import spatial_registry
+from travel_app.testing import TravelTablesTestCase
+
+from . import optimizer, planner
+from .planner import PlanError, plan
+
+
+class OptimizerTest(SimpleTestCase):
+    def _matrix(self, n, seed=0):
+        rng = np.random.default_rng(seed)
+        return optimizer.distance_matrix(rng.uniform(22, 25.3, n), rng.uniform(120, 122, n))
+
+    def test_route_keeps_start_and_beats_nearest_neighbor(self):
+        D = self._matrix(60)
+        for closed in (False, True):
+            route, stats = optimizer.optimize(D, 0, closed, time_budget=2.0)
+            self.assertEqual(sorted(route.tolist()), list(range(60)))
+            self.assertEqual(route[0], 0)
+            self.assertLessEqual(stats['optimized_km'], stats['initial_km'])
+            self.assertAlmostEqual(stats['optimized_km'], optimizer.route_length(D, route, closed))
+
+    def test_small_route_close_to_optimal(self):
+        D = self._matrix(9, seed=3)
+        route, stats = optimizer.optimize(D, 0, False, time_budget=2.0)
+        self.assertLessEqual(stats['optimized_km'], optimizer.held_karp(D) * 1.1)
+
+    def test_split_days(self):
+        D = self._matrix(21)
+        route, _ = optimizer.optimize(D, 0, False, time_budget=1.0)
+        parts = optimizer.split_days(D, route, days=3, skip_first=True)
+        self.assertEqual(len(parts), 3)
+        # 每天連續且涵蓋出發點以外的所有景點
+        self.assertEqual(parts[0][0], 1)
+        self.assertEqual(parts[-1][1], 21)
+        self.assertTrue(all(a[1] == b[0] for a, b in zip(parts, parts[1:])))
+
+        # 每天上限 3 小時、每個景點 60 分鐘，一天最多三個景點
+        parts = optimizer.split_days(D, route, day_minutes=180, skip_first=True)
+        self.assertTrue(all(end - start <= 3 for start, end in parts))
+
+
+class PlannerTest(TravelTablesTestCase):
+    START = (25.03, 121.53)
+
+    @classmethod
+    def setUpTestData(cls):
+        TravelClass.objects.create(class_id=1, class_name='自然')
+        TravelClass.objects.create(class_id=2, class_name='古蹟')
+
+        def travel(name, class_id, lat=None, lng=None):
+            return Travel.objects.create(travel_name=name, travel_txt=name, travel_address=name, region='臺北市',
+                                         town='大安區', class1_id=class_id, py=lat, px=lng).travel_id
+
+        cls.near = travel('近', 1, 25.031, 121.531)
+        cls.other_class = travel('古蹟', 2, 25.04, 121.54)
+        cls.east = travel('東', 1, 25.02, 121.55)
+        cls.no_coordinates = travel('沒有座標', 1)
+        cls.far = travel('高雄', 1, 22.6, 120.3)
+        cls.user = get_user_model().objects.create(username='planner', email='planner@example.com')
+
+    def setUp(self):
+        planner.matrix_cache.clear()
+        spatial_registry.reset()
+        self.addCleanup(spatial_registry.reset)
+
+    def test_matrix_cached_for_same_stops(self):
+        stops = [self.near, self.other_class, self.east]
+        first = plan(travel_ids=stops)
+        self.assertFalse(first['stats']['matrix_cached'])
+        self.assertEqual(sorted(first['order']), sorted(stops))
+        # 順序不同但景點相同，仍命中快取
+        second = plan(travel_ids=stops[::-1])
+        self.assertTrue(second['stats']['matrix_cached'])
+        self.assertEqual(second['distance_km'], first['distance_km'])
+
+    def test_start_picks_nearby_stops_of_class(self):
+        result = plan(start=self.START, class_ids=[1], radius_km=5)
+        self.assertEqual(sorted(result['order']), sorted([self.near, self.east]))
+        self.assertEqual(result['order'][0], self.near)
+        self.assertEqual(plan(start=self.START, radius_km=5, limit=1)['order'], [self.near])
+
+    def test_missing_coordinates(self):
+        with self.assertRaisesMessage(PlanError, '沒有任何具有座標的景點'):
+            plan(travel_ids=[self.no_coordinates])
+        self.assertEqual(plan(travel_ids=[self.near, self.no_coordinates])['missing'], [self.no_coordinates])
+
+    def test_days_and_day_hours_are_exclusive(self):
+        with self.assertRaises(PlanError):
+            plan(travel_ids=[self.near, self.east], days=2, day_hours=8)
+
+    def test_view(self):
+        url = '/trip/api/plan/'
+        body = {'travel_ids': [self.near, self.other_class, self.east, self.far], 'days': 2}
+        self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 403)
+
+        self.client.force_login(self.user)
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['days']), 2)
+        self.assertEqual(sorted(int(travel_id) for travel_id in data['travels']), sorted(body['travel_ids']))
+
+        for bad in ({**body, 'day_hours': 8}, {'travel_ids': [self.no_coordinates]}, {'start_lat': 25.03}):
+            response = self.client.post(url, bad, content_type='application/json')
+            self.assertEqual(response.status_code, 400, bad)
+            self.assertIn('error', response.json())
@@ -5,4 +5,5 @@ urlpatterns = [
     path('list/', views.trip_list, name='trip_list'),
     path('create/', views.trip_create, name='trip_create'),
     path('category/', views.trip_category, name='trip_category'),
-]
\ No newline at end of file
+    path('api/plan/', views.trip_plan, name='trip_plan'),
+]
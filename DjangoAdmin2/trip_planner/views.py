@@ -1,4 +1,15 @@
 from django.shortcuts import render
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from travel_app.models import Travel
+from travel_app.serializers import TravelSearchResultSerializer
+
+from .planner import PlanError, plan
+from .serializers import TripPlanSerializer
 
 def trip_list(request):
     return render(request, 'trip_planner/list.html')
@@ -7,4 +18,31 @@ def trip_create(request):
     return render(request, 'trip_planner/create.html')
 
 def trip_category(request):
-    return render(request, 'trip_planner/category.html')
\ No newline at end of file
+    return render(request, 'trip_planner/category.html')
+
+
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def trip_plan(request):
+    """
+    排出景點的參觀順序並切成多天
+    參數見 TripPlanSerializer；回傳順序、每天的行程、距離統計與景點資料
+    """
+    serializer = TripPlanSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    params = dict(serializer.validated_data)
+    start_lat, start_lng = params.pop('start_lat', None), params.pop('start_lng', None)
+    start = (start_lat, start_lng) if start_lat is not None else None
+    try:
+        result = plan(start=start, **params)
+    except PlanError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    travels = (
+        Travel.objects.filter(travel_id__in=result['order'])
+        .select_related('class1', 'class2', 'class3')
+    )
+    result['travels'] = {item['travel_id']: item for item in TravelSearchResultSerializer(travels, many=True).data}
+    return Response(result)